@@ -0,0 +1,212 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import shutil
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+# Imported for its side effect: .env is loaded before AUDIT_* are read below
+import config  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+# Append-only audit log (JSON lines) of lock actions, refused requests and
+# user changes. Events are queued in memory and written by a background
+# task; the file is rotated past AUDIT_MAX_BYTES into gzip-compressed
+# backups (audit.jsonl.1.gz is the newest).
+#
+# /history is answered from a small in-memory index of the latest events,
+# overall and per chat, never by reading the log files. At startup the
+# index is rebuilt from the newest segments only.
+
+# Audit log file ("" = disabled)
+AUDIT_FILE = os.getenv("AUDIT_FILE", "audit.jsonl")
+AUDIT_MAX_BYTES = int(os.getenv("AUDIT_MAX_BYTES", str(1024 * 1024)))
+# Compressed rotated files kept (audit.jsonl.1.gz ... .N.gz)
+AUDIT_BACKUPS = int(os.getenv("AUDIT_BACKUPS", "5"))
+
+# Index sizes: latest events overall, per chat, and chats indexed (LRU)
+INDEX_RECENT = 1000
+INDEX_PER_CHAT = 50
+INDEX_CHATS = 500
+# Events waiting to be written; the oldest are dropped past this
+QUEUE_MAX = 10000
+
+Event = Dict[str, Any]
+
+_recent: Deque[Event] = deque(maxlen=INDEX_RECENT)
+_by_chat: "OrderedDict[int, Deque[Event]]" = OrderedDict()
+_pending: Deque[Event] = deque()
+_wakeup: Optional[asyncio.Event] = None
+_writer_task: "Optional[asyncio.Task[None]]" = None
+_closing = False
+_dropped = 0
+
+
+def audit(event: str, chat_id: Optional[int], **details: Any) -> None:
+    """Record an audit event made by ``chat_id`` (None = not from a chat).
+
+    ``target`` in ``details`` is the user an event is about, if another
+    one: such events are listed in the history of both chats.
+    """
+    record: Event = {
+        "ts": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "event": event,
+        "chat_id": chat_id,
+        **details,
+    }
+    _index(record)
+    if not AUDIT_FILE:
+        return
+    if _writer_task is None:
+        # Not started (scripts, tests): write right away
+        _write_batch([record])
+        return
+    global _dropped
+    if len(_pending) >= QUEUE_MAX:
+        _pending.popleft()
+        _dropped += 1
+        if _dropped == 1 or _dropped % 1000 == 0:
+            logger.warning("Audit log writer lagging, %d event(s) dropped", _dropped)
+    _pending.append(record)
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+def _index(record: Event) -> None:
+    _recent.append(record)
+    for chat_id in {record.get("chat_id"), record.get("target")}:
+        if not isinstance(chat_id, int):
+            continue
+        events = _by_chat.get(chat_id)
+        if events is None:
+            events = _by_chat[chat_id] = deque(maxlen=INDEX_PER_CHAT)
+            if len(_by_chat) > INDEX_CHATS:
+                _by_chat.popitem(last=False)
+        else:
+            _by_chat.move_to_end(chat_id)
+        events.append(record)
+
+
+def get_history(
+    chat_id: Optional[int] = None, page: int = 0, page_size: int = 10
+) -> Tuple[List[Event], int]:
+    """One page of the latest indexed events, newest first.
+
+    :return: (events on the page, number of indexed events).
+    """
+    events = _recent if chat_id is None else _by_chat.get(chat_id, ())
+    total = len(events)
+    end = total - max(page, 0) * page_size
+    start = max(end - page_size, 0)
+    if end <= 0:
+        return [], total
+    return [events[i] for i in range(end - 1, start - 1, -1)], total
+
+
+def _backup_path(n: int) -> str:
+    return f"{AUDIT_FILE}.{n}.gz"
+
+
+def _write_batch(records: List[Event]) -> None:
+    """Append records to the log, rotating it if it grew too big (blocking)."""
+    try:
+        with open(AUDIT_FILE, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            size = f.tell()
+        if AUDIT_MAX_BYTES > 0 and size >= AUDIT_MAX_BYTES:
+            _rotate()
+    except OSError as exc:
+        logger.error("Error writing audit log %s: %s", AUDIT_FILE, exc)
+
+
+def _rotate() -> None:
+    """Compress the current log into .1.gz, shifting older backups."""
+    if AUDIT_BACKUPS <= 0:
+        os.remove(AUDIT_FILE)
+        return
+    for n in range(AUDIT_BACKUPS - 1, 0, -1):
+        if os.path.exists(_backup_path(n)):
+            os.replace(_backup_path(n), _backup_path(n + 1))
+    tmp_path = _backup_path(1) + ".tmp"
+    with open(AUDIT_FILE, "rb") as src, gzip.open(tmp_path, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(tmp_path, _backup_path(1))
+    os.remove(AUDIT_FILE)
+    logger.info("Rotated audit log %s", AUDIT_FILE)
+
+
+def _read_segment(path: str) -> Iterator[Event]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Torn last line of a crash: skip it
+                continue
+            if isinstance(record, dict):
+                yield record
+
+
+def _read_latest() -> List[Event]:
+    """Events of the newest segments, oldest first (blocking)."""
+    segments: List[List[Event]] = []
+    count = 0
+    for path in [AUDIT_FILE] + [_backup_path(n) for n in range(1, AUDIT_BACKUPS + 1)]:
+        if count >= INDEX_RECENT:
+            break
+        if not os.path.exists(path):
+            continue
+        try:
+            # Each segment is at most AUDIT_MAX_BYTES (compressed: less)
+            events = list(_read_segment(path))
+        except (OSError, EOFError) as exc:
+            logger.warning("Cannot read audit log %s: %s", path, exc)
+            break
+        segments.append(events)
+        count += len(events)
+    return [record for events in reversed(segments) for record in events]
+
+
+async def _writer_loop(wakeup: asyncio.Event) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        await wakeup.wait()
+        wakeup.clear()
+        # One batch at a time: writes and rotations never overlap
+        while _pending:
+            batch = list(_pending)
+            _pending.clear()
+            await loop.run_in_executor(None, _write_batch, batch)
+        if _closing:
+            return
+
+
+async def start_audit() -> None:
+    """Load the history index and start the background writer."""
+    global _wakeup, _writer_task
+    if not AUDIT_FILE or _writer_task is not None:
+        return
+    loop = asyncio.get_running_loop()
+    for record in await loop.run_in_executor(None, _read_latest):
+        _index(record)
+    _wakeup = asyncio.Event()
+    _writer_task = asyncio.ensure_future(_writer_loop(_wakeup))
+    logger.info("Audit log: %s (%d recent event(s) indexed)", AUDIT_FILE, len(_recent))
+
+
+async def stop_audit() -> None:
+    """Stop the writer after writing the events still queued."""
+    global _closing, _writer_task
+    if _writer_task is None or _wakeup is None:
+        return
+    _closing = True
+    _wakeup.set()
+    await _writer_task
+    _writer_task = None
+    _closing = False
@@ -1,61 +1,237 @@
-import asyncio
+import io
 import logging
-import secrets
-from config import get_config
-from typing import List, Tuple, Optional, Dict
-
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes
+import time
+from collections import OrderedDict
+from datetime import datetime
+from config import LockConfig, get_config, get_lock
+from typing import Any, List, Tuple, Optional, Dict
+
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Message
+from telegram.ext import ApplicationHandlerStop, ContextTypes
 from telegram.error import BadRequest, TelegramError
 
 from users import (
-    is_admin,
-    is_known,
-    can_do,
+    AuthContext,
+    get_auth,
     get_user_cfg,
-    get_users_sorted,
+    get_users_page,
+    search_users,
     add_or_update_user,
     delete_user,
     grant_all_permissions,
     revoke_all_permissions,
     toggle_permission,
+    add_user_listener,
+    flush_users,
+    add_schedule,
+    remove_schedule,
     ALL_PERMISSIONS,
-    get_user_lang,
-    set_user_lang
+    set_user_lang,
+    set_user_notify,
 )
 
-from nuki import nuki_lock_action, nuki_lock_state, summarize_state
+from nuki import (
+    BRIDGE_OFFLINE,
+    BRIDGE_TIMEOUT,
+    nuki_lock_action,
+    nuki_lock_state_all,
+    nuki_lock_state_cached,
+    nuki_lock_state_is_fresh,
+    nuki_wait_for_state,
+    summarize_state,
+    STATE_MOTOR_BLOCKED,
+)
+from audit import audit, get_history
 from i18n import t, bt, DEFAULT_LANG
+from users_cli import FORMATS, export_stream, guess_format, import_stream
+from schedules import parse_rule
+from ratelimit import InboundLimiter
+from tokens import TokenStore
+from metrics import inc, timed
 
 logger = logging.getLogger(__name__)
 
+# Users per page in the admin user list and in search results
+USERS_PAGE_SIZE = 10
+# Audit events per /history page
+HISTORY_PAGE_SIZE = 15
+# Largest users file accepted by /import
+IMPORT_MAX_BYTES = 5 * 1024 * 1024
+# Import errors listed in the reply (the rest are only counted)
+IMPORT_ERRORS_SHOWN = 20
+
+# OPEN DOOR confirmation tokens (token -> lock key), see OPEN_CONFIRM_TTL
+_open_tokens: "TokenStore[str]" = TokenStore()
+
 
 # ---------------------------------------------------------------------------
 # Helpers: menus and common responses
 # ---------------------------------------------------------------------------
 
-def _is_stranger(chat_id: int) -> bool:
+async def attach_auth(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Resolve the AuthContext of the update's chat into ``context.auth``.
+
+    Registered in an early handler group (see main.py), so it runs once
+    before the handler that processes the update.
+    """
+    chat = update.effective_chat
+    if chat is not None:
+        context.auth = get_auth(chat.id)
+
+
+_limiter: Optional[InboundLimiter] = None
+
+
+def _rate_limit_kind(update: Update) -> str:
+    """What an update is accounted as: the permission it uses, or "default"."""
+    data = update.callback_query.data if update.callback_query else None
+    if not data:
+        return "default"
+    if data.startswith("confirm_open:"):
+        return "open"
+    if data.startswith("cmd:"):
+        op = data.split(":", 2)[1]
+        if op == "statusall":
+            return "status"
+        # cmd:open only asks for confirmation: confirm_open is the action
+        if op in ALL_PERMISSIONS and op != "open":
+            return op
+    return "default"
+
+
+async def rate_limit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Drop updates of chats going over their RATE_LIMITS.
+
+    Registered in the group after attach_auth's (see main.py): a refused
+    update reaches no other handler. Only the first refusal in a row is
+    answered, and strangers never are.
+    """
+    global _limiter
+    chat = update.effective_chat
+    if chat is None:
+        return
+    if _limiter is None:
+        _limiter = InboundLimiter(get_config().rate_limits)
+    wait, notify = _limiter.check(chat.id, _rate_limit_kind(update))
+    if not wait:
+        return
+    auth = _auth(update, context)
+    text = None
+    if notify and not auth.is_stranger:
+        text = t("rate_limited", auth.lang, seconds=max(1, round(wait)))
+    try:
+        if update.callback_query:
+            # Also stops the button's loading animation
+            await update.callback_query.answer(text, show_alert=text is not None)
+        elif text and update.effective_message:
+            await update.effective_message.reply_text(text)
+    except TelegramError as exc:
+        logger.debug("Cannot answer rate limited update: %s", exc)
+    raise ApplicationHandlerStop
+
+
+def _auth(update: Update, context: ContextTypes.DEFAULT_TYPE) -> AuthContext:
+    """The AuthContext of this update (resolved now if attach_auth did not)."""
+    auth: Optional[AuthContext] = getattr(context, "auth", None)
+    chat_id = update.effective_chat.id
+    if auth is None or auth.chat_id != chat_id:
+        auth = context.auth = get_auth(chat_id)
+    return auth
+
+
+def _refresh_auth(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> AuthContext:
+    """Rebuild the AuthContext after the user changed their own settings."""
+    auth = context.auth = get_auth(chat_id)
+    return auth
+
+
+def _is_stranger(auth: AuthContext) -> bool:
     """True if user is NOT admin and NOT present in users.json."""
-    return not is_admin(chat_id) and not is_known(chat_id)
+    if not auth.is_stranger:
+        return False
+    inc("stranger_drops_total")
+    audit("stranger", auth.chat_id)
+    return True
+
+
+# Keyboards are immutable once built (python-telegram-bot freezes them), so
+# one instance per distinct input is shared by every reply:
+#   _main_menus: keyed by everything build_main_menu() looks at, so entries
+#                never go stale (a few dozen combinations at most)
+#   _user_edit_keyboards: keyed by (lang, target chat ID), dropped when that
+#                user changes (see _on_user_changed), LRU-bounded
+_main_menus: Dict[Tuple[Any, ...], InlineKeyboardMarkup] = {}
+_user_edit_keyboards: "OrderedDict[Tuple[str, int], InlineKeyboardMarkup]" = OrderedDict()
+USER_EDIT_KEYBOARDS_MAX = 256
+
+
+def _on_user_changed(chat_id: Optional[int]) -> None:
+    """users.py listener: forget the edit keyboards of a changed user."""
+    if chat_id is None:
+        _user_edit_keyboards.clear()
+        return
+    for key in [key for key in _user_edit_keyboards if key[1] == chat_id]:
+        del _user_edit_keyboards[key]
+
+
+add_user_listener(_on_user_changed)
 
 
-def build_main_menu(chat_id: int) -> InlineKeyboardMarkup:
-    """Build the main inline keyboard for a given user."""
-    lang = get_user_lang(chat_id)
+def build_main_menu(auth: AuthContext, lock_key: Optional[str] = None) -> InlineKeyboardMarkup:
+    """Return the main inline keyboard for a given user.
+
+    Action buttons target ``lock_key`` (default: the first configured lock).
+    With more than one lock, a lock selector row is shown on top.
+    """
+    lock = get_lock(lock_key) or get_config().locks[0]
+    key = (
+        lock.key,
+        auth.lang,
+        auth.is_admin,
+        auth.is_known,
+        # Admins can do anything whatever their stored permissions
+        -1 if auth.is_admin else auth.perms,
+        auth.notify,
+    )
+    markup = _main_menus.get(key)
+    if markup is None:
+        markup = _main_menus[key] = _render_main_menu(auth, lock)
+    return markup
+
+
+def _render_main_menu(auth: AuthContext, lock: LockConfig) -> InlineKeyboardMarkup:
+    lang = auth.lang
+    locks = get_config().locks
     buttons: List[List[InlineKeyboardButton]] = []
 
+    # Lock selector (multi-lock setups only)
+    if len(locks) > 1:
+        selector: List[InlineKeyboardButton] = []
+        for other in locks:
+            prefix = "🔘 " if other.key == lock.key else "⚪ "
+            selector.append(
+                InlineKeyboardButton(
+                    prefix + other.name, callback_data=f"lock:{other.key}"
+                )
+            )
+            if len(selector) == 3:
+                buttons.append(selector)
+                selector = []
+        if selector:
+            buttons.append(selector)
+
     # First row: lock / unlock
     row1: List[InlineKeyboardButton] = []
-    if can_do(chat_id, "lock"):
+    if auth.can("lock"):
         row1.append(
             InlineKeyboardButton(
-                bt("close", lang), callback_data="cmd:lock"
+                bt("close", lang), callback_data=f"cmd:lock:{lock.key}"
             )
         )
-    if can_do(chat_id, "unlock"):
+    if auth.can("unlock"):
         row1.append(
             InlineKeyboardButton(
-                bt("unlock", lang), callback_data="cmd:unlock"
+                bt("unlock", lang), callback_data=f"cmd:unlock:{lock.key}"
             )
         )
     if row1:
@@ -63,16 +239,16 @@ def build_main_menu(chat_id: int) -> InlineKeyboardMarkup:
 
     # Second row: open / lock'n'go
     row2: List[InlineKeyboardButton] = []
-    if can_do(chat_id, "open"):
+    if auth.can("open"):
         row2.append(
             InlineKeyboardButton(
-                bt("open_door", lang), callback_data="cmd:open"
+                bt("open_door", lang), callback_data=f"cmd:open:{lock.key}"
             )
         )
-    if can_do(chat_id, "lockngo"):
+    if auth.can("lockngo"):
         row2.append(
             InlineKeyboardButton(
-                bt("lockngo", lang), callback_data="cmd:lockngo"
+                bt("lockngo", lang), callback_data=f"cmd:lockngo:{lock.key}"
             )
         )
     if row2:
@@ -80,12 +256,18 @@ def build_main_menu(chat_id: int) -> InlineKeyboardMarkup:
 
     # Third row: status / id
     row3: List[InlineKeyboardButton] = []
-    if can_do(chat_id, "status"):
+    if auth.can("status"):
         row3.append(
             InlineKeyboardButton(
-                bt("status", lang), callback_data="cmd:status"
+                bt("status", lang), callback_data=f"cmd:status:{lock.key}"
             )
         )
+        if len(locks) > 1:
+            row3.append(
+                InlineKeyboardButton(
+                    bt("status_all", lang), callback_data="cmd:statusall"
+                )
+            )
     row3.append(
         InlineKeyboardButton(
             bt("id", lang), callback_data="cmd:id"
@@ -93,18 +275,24 @@ def build_main_menu(chat_id: int) -> InlineKeyboardMarkup:
     )
     buttons.append(row3)
 
-    # Language selector
-    buttons.append(
-        [
+    # Language selector (+ notifications toggle when the watcher runs)
+    row4: List[InlineKeyboardButton] = [
+        InlineKeyboardButton(
+            bt("lang", lang),
+            callback_data="lang:menu",
+        )
+    ]
+    if get_config().watcher_enabled and auth.is_known and auth.can("status"):
+        row4.append(
             InlineKeyboardButton(
-                bt("lang", lang),
-                callback_data="lang:menu",
+                bt("notify_on" if auth.notify else "notify_off", lang),
+                callback_data="notify:toggle",
             )
-        ]
-    )
+        )
+    buttons.append(row4)
 
     # Admin menu
-    if is_admin(chat_id):
+    if auth.is_admin:
         admin_row: List[InlineKeyboardButton] = [
             InlineKeyboardButton(
                 bt("add_user", lang), callback_data="admin:adduser_help"
@@ -112,20 +300,62 @@ def build_main_menu(chat_id: int) -> InlineKeyboardMarkup:
             InlineKeyboardButton(
                 bt("list_users", lang), callback_data="admin:listusers"
             ),
+            InlineKeyboardButton(
+                bt("history", lang), callback_data="admin:history"
+            ),
         ]
         buttons.append(admin_row)
 
     return InlineKeyboardMarkup(buttons)
 
 
-async def handle_unauthorized(update: Update) -> None:
+def _lock_title(lock: LockConfig) -> str:
+    """Header line naming the lock, only needed when several are configured."""
+    if len(get_config().locks) > 1:
+        return f"🚪 {lock.name}\n"
+    return ""
+
+
+async def handle_unauthorized(update: Update, auth: Optional[AuthContext] = None) -> None:
     """Reply with an innocuous message to unauthorized users."""
-    chat = update.effective_chat
-    lang = get_user_lang(chat.id) if chat else DEFAULT_LANG
+    inc("unauthorized_total")
+    if update.effective_chat:
+        request = update.callback_query.data if update.callback_query else None
+        if request is None and update.effective_message:
+            request = (update.effective_message.text or "")[:64]
+        audit("unauthorized", update.effective_chat.id, request=request)
+    lang = auth.lang if auth else DEFAULT_LANG
     if update.effective_message:
         await update.effective_message.reply_text(t("unauthorized", lang))
 
 
+def _error_text(res: dict, lang: str) -> str:
+    """Render the "error" of a bridge response."""
+    if res.get("error_code") == BRIDGE_OFFLINE:
+        return t("bridge_offline", lang)
+    if res.get("error_code") == BRIDGE_TIMEOUT:
+        return t("bridge_action_timeout", lang)
+    return f"❌ {res['error']}"
+
+
+# Lock states that mean an action has completed (see nuki_wait_for_state)
+ACTION_TARGET_STATES: Dict[str, frozenset] = {
+    "lock": frozenset({1}),  # locked
+    "unlock": frozenset({3}),  # unlocked
+    "open": frozenset({5}),  # unlatched
+    "lockngo": frozenset({6}),  # unlocked (lock'n'go)
+}
+# End states an action may also start from: (states, only once one of these
+# was seen). "Unlocked" before an unlatch, or "locked" before a lock'n'go,
+# proves nothing until the lock has been seen moving.
+ACTION_LATE_TARGET_STATES: Dict[str, Tuple[frozenset, frozenset]] = {
+    # Back to unlocked after unlatching / unlatched
+    "open": (frozenset({3}), frozenset({7, 5})),
+    # Locked again after the lock'n'go unlocking / relocking
+    "lockngo": (frozenset({1}), frozenset({2, 4})),
+}
+
+
 def _format_nuki_action_response(res: dict, op: Optional[str], lang: str) -> str:
     """Render a Nuki bridge response in a human-friendly way.
 
@@ -144,7 +374,7 @@ def _format_nuki_action_response(res: dict, op: Optional[str], lang: str) -> str
         parts.append(t("lockngo_ok", lang))
 
     if "error" in res:
-        parts.append(f"❌ {res['error']}")
+        parts.append(_error_text(res, lang))
         return "\n".join(parts)
 
     success = res.get("success")
@@ -169,18 +399,18 @@ def _format_nuki_action_response(res: dict, op: Optional[str], lang: str) -> str
 # Commands
 # ---------------------------------------------------------------------------
 
+@timed("handler_seconds", handler="cmd_cancel")
 async def cmd_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Cancel current admin operation (like add_user wizard)."""
-    chat = update.effective_chat
-    chat_id = chat.id
+    auth = _auth(update, context)
 
-    if _is_stranger(chat_id):
+    if _is_stranger(auth):
         await update.effective_message.reply_text("Silence is golden")
         return
 
-    lang = get_user_lang(chat.id)
+    lang = auth.lang
 
-    if is_admin(chat.id) and context.user_data.get("mode"):
+    if auth.is_admin and context.user_data.get("mode"):
         context.user_data["mode"] = None
         text = t("operation_cancelled", lang)
     else:
@@ -188,30 +418,30 @@ async def cmd_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
 
     await update.effective_message.reply_text(
         text,
-        reply_markup=build_main_menu(chat.id),
+        reply_markup=build_main_menu(auth),
     )
 
 
+@timed("handler_seconds", handler="cmd_start")
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    chat_id = update.effective_chat.id
+    auth = _auth(update, context)
 
     # Unknown users → fixed message, no menu
-    if _is_stranger(chat_id):
+    if _is_stranger(auth):
         await update.effective_message.reply_text("Silence is golden")
         return
 
-    lang = get_user_lang(chat_id)
+    lang = auth.lang
 
-    if is_admin(chat_id):
+    if auth.is_admin:
         text = t("start_admin", lang)
     else:
-        cfg = get_user_cfg(chat_id)
-        allowed = cfg.get("allowed") if cfg else []
+        allowed = auth.allowed
         perms = ", ".join(sorted(allowed)) if allowed else "(nessuno)" if lang == "it" else "(none)"
         text = t("start_user", lang, perms=perms)
 
     await update.effective_message.reply_text(
-        text, reply_markup=build_main_menu(chat_id)
+        text, reply_markup=build_main_menu(auth)
     )
 
 
@@ -220,16 +450,14 @@ async def cmd_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     return await cmd_start(update, context)
 
 
+@timed("handler_seconds", handler="cmd_id")
 async def cmd_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat = update.effective_chat
     user = update.effective_user
 
-    # Language for bot responses to this user
-    lang = get_user_lang(chat.id)
-
-    cfg = get_user_cfg(chat.id)
-    known = cfg is not None
-    admin_flag = is_admin(chat.id)
+    auth = _auth(update, context)
+    known = auth.is_known
+    admin_flag = auth.is_admin
 
     lines = []
 
@@ -258,9 +486,9 @@ async def cmd_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     lines.append(f"- admin: {'yes' if admin_flag else 'no'}")
 
     if known:
-        name = cfg.get("name") or "(no name)"
-        user_lang = cfg.get("lang") or lang
-        allowed = cfg.get("allowed") or []
+        name = auth.name or "(no name)"
+        user_lang = auth.lang
+        allowed = auth.allowed
 
         lines.append(f"- name: {name}")
         lines.append(f"- lang: {user_lang}")
@@ -274,7 +502,7 @@ async def cmd_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     text = "\n".join(lines)
 
     # For unknown non-admin users we do NOT show the menu
-    reply_markup = build_main_menu(chat.id) if (known or admin_flag) else None
+    reply_markup = build_main_menu(auth) if (known or admin_flag) else None
 
     await update.effective_message.reply_text(
         text,
@@ -282,15 +510,246 @@ async def cmd_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     )
 
 
+@timed("handler_seconds", handler="cmd_history")
+async def cmd_history(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/history [chat_id]: latest audit events, all or of one user (admins)."""
+    auth = _auth(update, context)
+    if _is_stranger(auth):
+        await update.effective_message.reply_text("Silence is golden")
+        return
+    if not auth.is_admin:
+        return await handle_unauthorized(update, auth)
+
+    target_id: Optional[int] = None
+    if context.args:
+        try:
+            target_id = int(context.args[0])
+        except ValueError:
+            await update.effective_message.reply_text(t("history_usage", auth.lang))
+            return
+    await _show_history(update, auth.lang, 0, target_id)
+
+
+def _who(chat_id: Any) -> str:
+    """Name and ID of a chat for history lines."""
+    if chat_id is None:
+        return "system"
+    cfg = get_user_cfg(chat_id) if isinstance(chat_id, int) else None
+    if cfg is not None and cfg.name:
+        return f"{cfg.name} [{chat_id}]"
+    return f"[{chat_id}]"
+
+
+def _format_event(record: Dict[str, Any]) -> str:
+    """One audit event as a history line (timestamps are UTC)."""
+    ts = str(record.get("ts", ""))[5:16].replace("T", " ")
+    who = _who(record.get("chat_id"))
+    event = record.get("event")
+    if event == "action":
+        return f"{ts} 🔑 {who}: {record.get('op')} {record.get('lock')} → {record.get('result')}"
+    if event == "confirm":
+        return (
+            f"{ts} ⏱ {who}: {record.get('op')} {record.get('lock')} "
+            f"{record.get('result')} ({record.get('seconds')}s)"
+        )
+    if event == "user":
+        details = " ".join(
+            f"{key}={value}"
+            for key, value in record.items()
+            if key not in {"ts", "event", "chat_id", "op", "target"}
+        )
+        return f"{ts} 👤 {who}: {record.get('op')} {_who(record.get('target'))} {details}".rstrip()
+    if event == "unauthorized":
+        return f"{ts} ⛔ {who}: {record.get('request') or ''}".rstrip()
+    return f"{ts} ⛔ {who}: {event}"
+
+
+async def _show_history(
+    update: Update, lang: str, page: int, target_id: Optional[int] = None
+) -> None:
+    """Show one page of the audit history; page buttons edit it in place."""
+    events, total = get_history(target_id, page, HISTORY_PAGE_SIZE)
+    if not events and page > 0:
+        page = 0
+        events, total = get_history(target_id, page, HISTORY_PAGE_SIZE)
+    if not events:
+        await update.effective_message.reply_text(t("history_empty", lang))
+        return
+
+    pages = (total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+    if target_id is None:
+        header = t("history_title", lang, page=page + 1, pages=pages)
+    else:
+        header = t("history_title_user", lang, who=_who(target_id), page=page + 1, pages=pages)
+    text = "\n".join([header] + [_format_event(record) for record in events])
+
+    suffix = f":{target_id}" if target_id is not None else ""
+    # Newest first: "previous" pages hold older events
+    nav_row: List[InlineKeyboardButton] = []
+    if page + 1 < pages:
+        nav_row.append(
+            InlineKeyboardButton(
+                bt("page_prev", lang), callback_data=f"admin:history:{page + 1}{suffix}"
+            )
+        )
+    if page > 0:
+        nav_row.append(
+            InlineKeyboardButton(
+                bt("page_next", lang), callback_data=f"admin:history:{page - 1}{suffix}"
+            )
+        )
+    kb = InlineKeyboardMarkup([nav_row]) if nav_row else None
+
+    query = update.callback_query
+    if query is not None and query.data.startswith("admin:history:"):
+        try:
+            await query.edit_message_text(text, reply_markup=kb)
+            return
+        except BadRequest:
+            pass
+    await update.effective_message.reply_text(text, reply_markup=kb)
+
+
+@timed("handler_seconds", handler="cmd_export")
+async def cmd_export(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/export [csv|jsonl]: send all users as a document (admins)."""
+    auth = _auth(update, context)
+    if _is_stranger(auth):
+        await update.effective_message.reply_text("Silence is golden")
+        return
+    if not auth.is_admin:
+        return await handle_unauthorized(update, auth)
+
+    fmt = context.args[0].lower() if context.args else "csv"
+    if fmt not in FORMATS:
+        fmt = "csv"
+    out = io.StringIO(newline="")
+    count = export_stream(out, fmt)
+    await update.effective_message.reply_document(
+        document=io.BytesIO(out.getvalue().encode("utf-8")),
+        filename=f"users.{fmt}",
+        caption=t("export_done", auth.lang, count=count),
+    )
+
+
+@timed("handler_seconds", handler="cmd_import")
+async def cmd_import(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/import: the next document sent is imported into the users (admins)."""
+    auth = _auth(update, context)
+    if _is_stranger(auth):
+        await update.effective_message.reply_text("Silence is golden")
+        return
+    if not auth.is_admin:
+        return await handle_unauthorized(update, auth)
+    context.user_data["mode"] = "import_users"
+    await update.effective_message.reply_text(t("import_intro", auth.lang))
+
+
+@timed("handler_seconds", handler="handle_document")
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Import an uploaded users file after /import."""
+    auth = _auth(update, context)
+    if _is_stranger(auth):
+        await update.effective_message.reply_text("Silence is golden")
+        return
+    lang = auth.lang
+    if not auth.is_admin or context.user_data.get("mode") != "import_users":
+        await update.effective_message.reply_text(
+            t("unknown_text", lang), reply_markup=build_main_menu(auth)
+        )
+        return
+
+    document = update.effective_message.document
+    fmt = guess_format(document.file_name or "", default="")
+    if not fmt:
+        await update.effective_message.reply_text(t("import_bad_file", lang))
+        return
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        await update.effective_message.reply_text(
+            t("import_too_big", lang, max_kb=IMPORT_MAX_BYTES // 1024)
+        )
+        return
+    try:
+        tg_file = await document.get_file()
+        data = await tg_file.download_as_bytearray()
+        text = bytes(data).decode("utf-8-sig")
+    except (TelegramError, UnicodeDecodeError) as exc:
+        logger.warning("Cannot read uploaded users file: %s", exc)
+        await update.effective_message.reply_text(t("import_bad_file", lang))
+        return
+
+    context.user_data["mode"] = None
+    report = import_stream(io.StringIO(text, newline=""), fmt, actor=auth.chat_id)
+    if report.applied:
+        # Write now rather than after the write-behind delay
+        await flush_users()
+
+    lines = [
+        f"line {line_num}: {message}"
+        for line_num, message in report.errors[:IMPORT_ERRORS_SHOWN]
+    ]
+    if len(report.errors) > IMPORT_ERRORS_SHOWN:
+        lines.append("...")
+    if report.applied:
+        lines.append(
+            t(
+                "import_done",
+                lang,
+                rows=report.rows,
+                added=report.added,
+                updated=report.updated,
+                deleted=report.deleted,
+            )
+        )
+    else:
+        lines.append(t("import_failed", lang, rows=report.rows, errors=len(report.errors)))
+    await update.effective_message.reply_text(
+        "\n".join(lines), reply_markup=build_main_menu(auth)
+    )
+
+
+async def _send_progress(update: Update, text: str) -> Optional[Message]:
+    """Send a "working on it" message.
+
+    :return: the message to edit with the result (see _finish_progress), or
+        None to send the result separately (PROGRESS_EDIT off).
+    """
+    sent = await update.effective_message.reply_text(text)
+    return sent if get_config().progress_edit else None
+
+
+async def _finish_progress(
+    update: Update,
+    progress: Optional[Message],
+    text: str,
+    reply_markup: Optional[InlineKeyboardMarkup] = None,
+) -> Message:
+    """Show a result by editing the progress message in place.
+
+    Falls back to a new message if there is nothing to edit or the edit
+    fails (e.g. the message was deleted meanwhile).
+    """
+    if progress is not None:
+        try:
+            edited = await progress.edit_text(text, reply_markup=reply_markup)
+            if isinstance(edited, Message):
+                return edited
+        except TelegramError as exc:
+            logger.debug("Cannot edit progress message, sending a new one: %s", exc)
+    return await update.effective_message.reply_text(text, reply_markup=reply_markup)
+
+
 async def _exec_nuki_action(
-    chat_id: int,
+    auth: AuthContext,
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
     action: int,
     op: str,
+    lock: Optional[LockConfig] = None,
 ) -> None:
     """Internal helper to send a Nuki action and report back."""
-    lang = get_user_lang(chat_id)
+    lang = auth.lang
+    lock = lock or get_lock()
     if op == "lock":
         sending_key = "sending_lock"
     elif op == "unlock":
@@ -302,82 +761,225 @@ async def _exec_nuki_action(
     else:
         sending_key = "sending_lock"
 
-    await update.effective_message.reply_text(t(sending_key, lang))
-    res = await asyncio.to_thread(nuki_lock_action, action)
-    msg = _format_nuki_action_response(res, op=op, lang=lang)
-    await update.effective_message.reply_text(msg, reply_markup=build_main_menu(chat_id))
+    title = _lock_title(lock)
+    progress = await _send_progress(update, title + t(sending_key, lang))
+    started = time.monotonic()
+    res = await nuki_lock_action(action, lock)
+    audit(
+        "action",
+        auth.chat_id,
+        name=auth.name,
+        op=op,
+        lock=lock.key,
+        result=_action_result(res),
+    )
+    msg = title + _format_nuki_action_response(res, op=op, lang=lang)
+    markup = build_main_menu(auth, lock.key)
+
+    verify = (
+        get_config().verify_actions
+        and op in ACTION_TARGET_STATES
+        and "error" not in res
+        and res.get("success") is not False
+    )
+    if not verify:
+        await _finish_progress(update, progress, msg, markup)
+        return
 
+    sent = await _finish_progress(
+        update, progress, msg + "\n" + t("action_waiting", lang), markup
+    )
+    # Runs in the background: the handler returns right away
+    context.application.create_task(
+        _confirm_action(sent, msg, markup, lock, op, lang, started), update=update
+    )
 
-async def cmd_lock(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    chat_id = update.effective_chat.id
 
-    if _is_stranger(chat_id):
+def _action_result(res: dict) -> str:
+    """Short outcome of a bridge action response, for the audit log."""
+    if res.get("error_code") == BRIDGE_OFFLINE:
+        return "offline"
+    if res.get("error_code") == BRIDGE_TIMEOUT:
+        return "timeout"
+    if "error" in res:
+        return "error"
+    if res.get("success") is True:
+        return "ok"
+    if res.get("success") is False:
+        return "failed"
+    return "unknown"
+
+
+async def _confirm_action(
+    sent: Message,
+    msg: str,
+    markup: InlineKeyboardMarkup,
+    lock: LockConfig,
+    op: str,
+    lang: str,
+    started: float,
+) -> None:
+    """Wait for the outcome of an accepted action and edit ``sent`` with it."""
+    late_targets, late_after = ACTION_LATE_TARGET_STATES.get(op, (frozenset(), frozenset()))
+    data, reached = await nuki_wait_for_state(
+        lock, ACTION_TARGET_STATES[op], get_config().verify_timeout, late_targets, late_after
+    )
+    seconds = f"{time.monotonic() - started:.1f}"
+    state = (data or {}).get("state")
+    state_name = (data or {}).get("stateName", str(state))
+    if reached and state == STATE_MOTOR_BLOCKED:
+        outcome = t("action_motor_blocked", lang, seconds=seconds)
+        result = "motor_blocked"
+    elif reached:
+        outcome = t("action_confirmed", lang, state_name=state_name, seconds=seconds)
+        result = "confirmed"
+    else:
+        outcome = t("action_not_confirmed", lang, state_name=state_name, seconds=seconds)
+        result = "not_confirmed"
+    audit("confirm", sent.chat_id, op=op, lock=lock.key, result=result, seconds=float(seconds))
+    try:
+        await sent.edit_text(msg + "\n" + outcome, reply_markup=markup)
+    except TelegramError as exc:
+        logger.warning("Cannot edit action confirmation for %s: %s", lock.key, exc)
+
+
+@timed("handler_seconds", handler="cmd_lock")
+async def cmd_lock(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, lock: Optional[LockConfig] = None
+) -> None:
+    auth = _auth(update, context)
+
+    if _is_stranger(auth):
         await update.effective_message.reply_text("Silence is golden")
         return
 
-    if not can_do(chat_id, "lock"):
-        return await handle_unauthorized(update)
+    if not auth.can("lock"):
+        return await handle_unauthorized(update, auth)
     # Nuki lock action is 2
-    await _exec_nuki_action(chat_id, update, context, action=2, op="lock")
+    await _exec_nuki_action(auth, update, context, action=2, op="lock", lock=lock)
 
 
-async def cmd_unlock(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    chat_id = update.effective_chat.id
+@timed("handler_seconds", handler="cmd_unlock")
+async def cmd_unlock(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, lock: Optional[LockConfig] = None
+) -> None:
+    auth = _auth(update, context)
 
-    if _is_stranger(chat_id):
+    if _is_stranger(auth):
         await update.effective_message.reply_text("Silence is golden")
         return
 
-    if not can_do(chat_id, "unlock"):
-        return await handle_unauthorized(update)
+    if not auth.can("unlock"):
+        return await handle_unauthorized(update, auth)
     # Nuki unlock action is 1
-    await _exec_nuki_action(chat_id, update, context, action=1, op="unlock")
+    await _exec_nuki_action(auth, update, context, action=1, op="unlock", lock=lock)
 
 
 async def _cmd_open_internal(
-    chat_id: int, update: Update, context: ContextTypes.DEFAULT_TYPE
+    auth: AuthContext,
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    lock: Optional[LockConfig] = None,
 ) -> None:
     """Internal helper for the 'open door' (unlatch) operation."""
     # Nuki "unlatch" action is usually 3
-    await _exec_nuki_action(chat_id, update, context, action=3, op="open")
+    await _exec_nuki_action(auth, update, context, action=3, op="open", lock=lock)
 
 
-async def cmd_lockngo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    chat_id = update.effective_chat.id
+@timed("handler_seconds", handler="cmd_lockngo")
+async def cmd_lockngo(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, lock: Optional[LockConfig] = None
+) -> None:
+    auth = _auth(update, context)
 
-    if _is_stranger(chat_id):
+    if _is_stranger(auth):
         await update.effective_message.reply_text("Silence is golden")
         return
 
-    if not can_do(chat_id, "lockngo"):
-        return await handle_unauthorized(update)
+    if not auth.can("lockngo"):
+        return await handle_unauthorized(update, auth)
     # Nuki lock'n'go action is usually 4
-    await _exec_nuki_action(chat_id, update, context, action=4, op="lockngo")
+    await _exec_nuki_action(auth, update, context, action=4, op="lockngo", lock=lock)
 
 
-async def cmd_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    chat_id = update.effective_chat.id
+@timed("handler_seconds", handler="cmd_status")
+async def cmd_status(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, lock: Optional[LockConfig] = None
+) -> None:
+    auth = _auth(update, context)
 
-    if _is_stranger(chat_id):
+    if _is_stranger(auth):
         await update.effective_message.reply_text("Silence is golden")
         return
 
-    if not can_do(chat_id, "status"):
-        return await handle_unauthorized(update)
-
-    lang = get_user_lang(chat_id)
-    await update.effective_message.reply_text(t("reading_state", lang))
-    res = await asyncio.to_thread(nuki_lock_state)
+    if not auth.can("status"):
+        return await handle_unauthorized(update, auth)
+
+    lang = auth.lang
+    lock = lock or get_lock()
+    title = _lock_title(lock)
+    # A cached state is shown at once: no "Reading..." message needed
+    progress = None
+    if not nuki_lock_state_is_fresh(lock):
+        progress = await _send_progress(update, title + t("reading_state", lang))
+    res, age = await nuki_lock_state_cached(lock)
     if "error" in res:
-        await update.effective_message.reply_text(
-            f"❌ {res['error']}", reply_markup=build_main_menu(chat_id)
+        await _finish_progress(
+            update, progress, title + _error_text(res, lang), build_main_menu(auth, lock.key)
         )
         return
 
-    summary = summarize_state(res, lang=lang)
-    await update.effective_message.reply_text(
-        summary, reply_markup=build_main_menu(chat_id)
-    )
+    summary = title + summarize_state(res, lang=lang)
+    if age >= 1:
+        summary += "\n" + t("state_cache_age", lang, age=int(age))
+    await _finish_progress(update, progress, summary, build_main_menu(auth, lock.key))
+
+
+@timed("handler_seconds", handler="cmd_status_all")
+async def cmd_status_all(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show the state of every configured lock.
+
+    A single message is edited as each bridge answers, so one slow bridge
+    does not hold back the others.
+    """
+    auth = _auth(update, context)
+
+    if _is_stranger(auth):
+        await update.effective_message.reply_text("Silence is golden")
+        return
+
+    if not auth.can("status"):
+        return await handle_unauthorized(update, auth)
+
+    lang = auth.lang
+    locks = get_config().locks
+    blocks: Dict[str, str] = {
+        lock.key: f"🚪 {lock.name}\n{t('reading_state', lang)}" for lock in locks
+    }
+
+    def render() -> str:
+        return "\n\n".join(blocks[lock.key] for lock in locks)
+
+    msg = await update.effective_message.reply_text(render())
+    async for lock, res, age in nuki_lock_state_all():
+        if "error" in res:
+            body = _error_text(res, lang)
+        else:
+            body = summarize_state(res, lang=lang)
+            if age >= 1:
+                body += "\n" + t("state_cache_age", lang, age=int(age))
+        blocks[lock.key] = f"🚪 {lock.name}\n{body}"
+        try:
+            await msg.edit_text(render())
+        except BadRequest as exc:
+            logger.debug("Could not update all-locks status message: %s", exc)
+
+    try:
+        await msg.edit_text(render(), reply_markup=build_main_menu(auth))
+    except BadRequest:
+        await update.effective_message.reply_text(
+            render(), reply_markup=build_main_menu(auth)
+        )
 
 
 # ---------------------------------------------------------------------------
@@ -385,9 +987,20 @@ async def cmd_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
 # ---------------------------------------------------------------------------
 
 
-def _build_user_edit_keyboard(chat_id: int, target_id: int) -> InlineKeyboardMarkup:
-    """Build the inline keyboard for editing a user's permissions."""
-    lang = get_user_lang(chat_id)
+def _build_user_edit_keyboard(lang: str, target_id: int) -> InlineKeyboardMarkup:
+    """Return the inline keyboard for editing a user's permissions."""
+    key = (lang, target_id)
+    markup = _user_edit_keyboards.get(key)
+    if markup is not None:
+        _user_edit_keyboards.move_to_end(key)
+        return markup
+    markup = _user_edit_keyboards[key] = _render_user_edit_keyboard(lang, target_id)
+    if len(_user_edit_keyboards) > USER_EDIT_KEYBOARDS_MAX:
+        _user_edit_keyboards.popitem(last=False)
+    return markup
+
+
+def _render_user_edit_keyboard(lang: str, target_id: int) -> InlineKeyboardMarkup:
     target_cfg = get_user_cfg(target_id) or {}
     allowed = set(target_cfg.get("allowed") or [])
 
@@ -437,7 +1050,17 @@ def _build_user_edit_keyboard(chat_id: int, target_id: int) -> InlineKeyboardMar
         ]
     )
 
-    # Fifth row: delete / back
+    # Fifth row: access windows
+    rows.append(
+        [
+            InlineKeyboardButton(
+                bt("schedules", lang),
+                callback_data=f"admin:sched:{target_id}",
+            ),
+        ]
+    )
+
+    # Sixth row: delete / back
     rows.append(
         [
             InlineKeyboardButton(
@@ -454,29 +1077,51 @@ def _build_user_edit_keyboard(chat_id: int, target_id: int) -> InlineKeyboardMar
     return InlineKeyboardMarkup(rows)
 
 
-async def _show_user_list(update: Update, chat_id: int) -> None:
-    """Show a list of users and a keyboard to select one to edit.
-
-    Owners (admin) defined in OWNERS are not shown in the list.
-    """
-    lang = get_user_lang(chat_id)
-    users_list = get_users_sorted()
-
-    # Owners from config
-    cfg = get_config()
-    owners = set(cfg.owners)
-
-    # Filter out owners from user list
-    visible_users = [(uid, ucfg) for uid, ucfg in users_list if uid not in owners]
+def _build_schedule_view(
+    lang: str, target_id: int
+) -> Tuple[str, InlineKeyboardMarkup]:
+    """Text and keyboard listing the access windows of a user."""
+    target_cfg = get_user_cfg(target_id)
+    name = target_cfg.get("name") if target_cfg else ""
+    schedules = target_cfg.schedules if target_cfg else ()
+    lines = [t("schedules_header", lang, name=name, uid=target_id)]
+    if not schedules:
+        lines.append(t("schedules_none", lang))
+    now = datetime.now()
+    rows: List[List[InlineKeyboardButton]] = []
+    delete_row: List[InlineKeyboardButton] = []
+    for i, rule in enumerate(schedules, start=1):
+        marker = "🟢" if rule.is_active(now) else "⚪️"
+        lines.append(f"{marker} {i}. {rule.describe()}")
+        delete_row.append(
+            InlineKeyboardButton(
+                f"🗑 {i}", callback_data=f"admin:schedel:{target_id}:{i - 1}"
+            )
+        )
+        if len(delete_row) == 4:
+            rows.append(delete_row)
+            delete_row = []
+    if delete_row:
+        rows.append(delete_row)
+    rows.append(
+        [
+            InlineKeyboardButton(
+                bt("schedule_add", lang), callback_data=f"admin:schedadd:{target_id}"
+            ),
+            InlineKeyboardButton(
+                bt("perm_back", lang), callback_data=f"admin:edit:{target_id}"
+            ),
+        ]
+    )
+    return "\n".join(lines), InlineKeyboardMarkup(rows)
 
-    if not visible_users:
-        await update.effective_message.reply_text(t("no_users", lang))
-        return
 
-    lines = [t("users_title", lang)]
+def _user_buttons(
+    users: List[Tuple[int, Any]], lines: List[str]
+) -> List[List[InlineKeyboardButton]]:
+    """Append one line per user to ``lines`` and return their edit buttons."""
     kb_rows: List[List[InlineKeyboardButton]] = []
-
-    for uid, ucfg in visible_users:
+    for uid, ucfg in users:
         name = ucfg.get("name") or "(no name)"
         lines.append(f"- {name} [{uid}]")
         kb_rows.append(
@@ -486,28 +1131,108 @@ async def _show_user_list(update: Update, chat_id: int) -> None:
                 )
             ]
         )
+    return kb_rows
+
+
+async def _show_user_list(update: Update, lang: str, page: int = 0) -> None:
+    """Show one page of users and a keyboard to select one to edit.
 
-    # Final row: Back button to admin menu
+    Owners (admin) defined in OWNERS are not shown in the list. Page
+    buttons edit the list message in place.
+    """
+    owners = get_config().owner_ids
+    page_users, total = get_users_page(page, USERS_PAGE_SIZE, exclude=owners)
+    pages = max((total + USERS_PAGE_SIZE - 1) // USERS_PAGE_SIZE, 1)
+    if page >= pages:
+        page = pages - 1
+        page_users, total = get_users_page(page, USERS_PAGE_SIZE, exclude=owners)
+
+    if not page_users:
+        await update.effective_message.reply_text(t("no_users", lang))
+        return
+
+    lines = [t("users_title", lang)]
+    if pages > 1:
+        lines[0] += " " + t("users_page", lang, page=page + 1, pages=pages, total=total)
+    kb_rows = _user_buttons(page_users, lines)
+
+    nav_row: List[InlineKeyboardButton] = []
+    if page > 0:
+        nav_row.append(
+            InlineKeyboardButton(
+                bt("page_prev", lang), callback_data=f"admin:listusers:{page - 1}"
+            )
+        )
+    if page + 1 < pages:
+        nav_row.append(
+            InlineKeyboardButton(
+                bt("page_next", lang), callback_data=f"admin:listusers:{page + 1}"
+            )
+        )
+    if nav_row:
+        kb_rows.append(nav_row)
+
+    # Final row: search and Back button to admin menu
     kb_rows.append(
         [
+            InlineKeyboardButton(
+                bt("search_users", lang),
+                callback_data="admin:searchusers",
+            ),
             InlineKeyboardButton(
                 bt("perm_back", lang),
                 callback_data="admin:back",
-            )
+            ),
         ]
     )
 
     kb = InlineKeyboardMarkup(kb_rows)
+    query = update.callback_query
+    if query is not None and query.data.startswith("admin:listusers:"):
+        try:
+            await query.edit_message_text("\n".join(lines), reply_markup=kb)
+            return
+        except BadRequest:
+            pass
     await update.effective_message.reply_text(
         "\n".join(lines), reply_markup=kb
     )
 
 
+async def _show_search_results(update: Update, lang: str, text: str) -> None:
+    """Reply with the users matching an admin search query."""
+    owners = get_config().owner_ids
+    found = [
+        (uid, ucfg)
+        for uid, ucfg in search_users(text, limit=USERS_PAGE_SIZE + len(owners))
+        if uid not in owners
+    ][:USERS_PAGE_SIZE]
+    if not found:
+        await update.effective_message.reply_text(
+            t("search_no_results", lang, query=text)
+        )
+        return
+
+    lines = [t("search_results", lang, query=text)]
+    kb_rows = _user_buttons(found, lines)
+    kb_rows.append(
+        [
+            InlineKeyboardButton(
+                bt("list_users", lang), callback_data="admin:listusers:0"
+            )
+        ]
+    )
+    await update.effective_message.reply_text(
+        "\n".join(lines), reply_markup=InlineKeyboardMarkup(kb_rows)
+    )
+
+
 # ---------------------------------------------------------------------------
 # Callback query handler
 # ---------------------------------------------------------------------------
 
 
+@timed("handler_seconds", handler="on_button")
 async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle all callback query interactions from inline keyboards."""
     query = update.callback_query
@@ -524,17 +1249,14 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     
     data = query.data or ""
     chat_id = query.message.chat.id
-    lang = get_user_lang(chat_id)
-    user_data: Dict = context.user_data
+    auth = _auth(update, context)
+    lang = auth.lang
 
     # Unknown users: no actions on buttons
-    if _is_stranger(chat_id):
+    if _is_stranger(auth):
         await query.message.reply_text("Silence is golden")
         return
 
-    # OPEN DOOR confirmation tokens are stored per-user
-    open_tokens: Dict[str, bool] = user_data.setdefault("open_tokens", {})
-
     # Language menu
     if data.startswith("lang:"):
         _, action, *rest = data.split(":", 2)
@@ -552,19 +1274,33 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
         if action == "set" and rest:
             new_lang = rest[0]
-            set_user_lang(chat_id, new_lang)
+            set_user_lang(chat_id, new_lang, actor=chat_id)
+            auth = _refresh_auth(context, chat_id)
             lang = new_lang
             await query.message.reply_text(t("lang_updated", lang))
             await query.message.reply_text(
-                t("menu_actions", lang), reply_markup=build_main_menu(chat_id)
+                t("menu_actions", lang), reply_markup=build_main_menu(auth)
             )
             return
 
+    # Lock state notifications
+    if data == "notify:toggle":
+        if not auth.can("status"):
+            return await handle_unauthorized(update, auth)
+        enabled = not auth.notify
+        set_user_notify(chat_id, enabled, actor=chat_id)
+        auth = _refresh_auth(context, chat_id)
+        await query.message.reply_text(
+            t("notify_enabled" if enabled else "notify_disabled", lang),
+            reply_markup=build_main_menu(auth),
+        )
+        return
+
     # Admin actions
     if data.startswith("admin:"):
         _, cmd, *rest = data.split(":", 2)
-        if not is_admin(chat_id):
-            return await handle_unauthorized(update)
+        if not auth.is_admin:
+            return await handle_unauthorized(update, auth)
 
         if cmd == "adduser_help":
             # Enter "add user" mode: next text message will be parsed
@@ -573,7 +1309,28 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             return
 
         if cmd == "listusers":
-            await _show_user_list(update, chat_id)
+            try:
+                page = int(rest[0]) if rest else 0
+            except ValueError:
+                page = 0
+            await _show_user_list(update, lang, max(page, 0))
+            return
+
+        if cmd == "history":
+            # admin:history:<page>[:<chat_id>]
+            page_raw, _, target_raw = (rest[0] if rest else "0").partition(":")
+            try:
+                page = max(int(page_raw), 0)
+                target_id = int(target_raw) if target_raw else None
+            except ValueError:
+                page, target_id = 0, None
+            await _show_history(update, lang, page, target_id)
+            return
+
+        if cmd == "searchusers":
+            # Enter "search users" mode: next text message is the query
+            context.user_data["mode"] = "search_users"
+            await query.message.reply_text(t("search_users_intro", lang))
             return
 
         if cmd == "edit" and rest:
@@ -590,10 +1347,30 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                 )
                 return
             header = t("edit_user_header", lang) + f"{target_cfg.get('name')} [{target_id}]"
-            kb = _build_user_edit_keyboard(chat_id, target_id)
+            kb = _build_user_edit_keyboard(lang, target_id)
             await query.message.reply_text(header, reply_markup=kb)
             return
 
+        if cmd == "toggle" and rest:
+            # admin:toggle:<target_id>:<perm>
+            target_raw, _, perm = rest[0].partition(":")
+            try:
+                target_id = int(target_raw)
+            except ValueError:
+                await query.message.reply_text(t("user_not_found", lang, uid=target_raw))
+                return
+            if not toggle_permission(target_id, perm, actor=chat_id):
+                await query.message.reply_text(t("user_not_found", lang, uid=target_id))
+                return
+            target_cfg = get_user_cfg(target_id) or {}
+            header = t("edit_user_header", lang) + f"{target_cfg.get('name')} [{target_id}]"
+            kb = _build_user_edit_keyboard(lang, target_id)
+            try:
+                await query.message.edit_text(header, reply_markup=kb)
+            except BadRequest:
+                await query.message.reply_text(header, reply_markup=kb)
+            return
+
         if cmd in {"all", "none", "delete"} and rest:
             target_raw = rest[0]
             try:
@@ -603,11 +1380,11 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                 return
 
             if cmd == "all":
-                grant_all_permissions(target_id)
+                grant_all_permissions(target_id, actor=chat_id)
             elif cmd == "none":
-                revoke_all_permissions(target_id)
+                revoke_all_permissions(target_id, actor=chat_id)
             elif cmd == "delete":
-                delete_user(target_id)
+                delete_user(target_id, actor=chat_id)
                 # Show confirmation + Back button
                 kb = InlineKeyboardMarkup(
                     [
@@ -627,50 +1404,101 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
             target_cfg = get_user_cfg(target_id) or {}
             header = t("edit_user_header", lang) + f"{target_cfg.get('name')} [{target_id}]"
-            kb = _build_user_edit_keyboard(chat_id, target_id)
+            kb = _build_user_edit_keyboard(lang, target_id)
             try:
                 await query.message.edit_text(header, reply_markup=kb)
             except BadRequest:
                 await query.message.reply_text(header, reply_markup=kb)
             return
 
+        if cmd in {"sched", "schedadd", "schedel"} and rest:
+            # admin:sched:<target_id>, admin:schedel:<target_id>:<index>
+            target_raw, _, index_raw = rest[0].partition(":")
+            try:
+                target_id = int(target_raw)
+            except ValueError:
+                await query.message.reply_text(t("user_not_found", lang, uid=target_raw))
+                return
+            if get_user_cfg(target_id) is None:
+                await query.message.reply_text(t("user_not_found", lang, uid=target_id))
+                return
+
+            if cmd == "schedadd":
+                # Enter "add window" mode: next text message is the rule
+                context.user_data["mode"] = "add_schedule"
+                context.user_data["schedule_target"] = target_id
+                await query.message.reply_text(t("schedule_add_intro", lang))
+                return
+
+            if cmd == "schedel" and index_raw.isdigit():
+                remove_schedule(target_id, int(index_raw), actor=chat_id)
+
+            text, kb = _build_schedule_view(lang, target_id)
+            try:
+                await query.message.edit_text(text, reply_markup=kb)
+            except BadRequest:
+                await query.message.reply_text(text, reply_markup=kb)
+            return
+
         if cmd == "back":
             # Exit from any admin mode (e.g. add_user)
             context.user_data.pop("mode", None)
             await query.message.reply_text(
-                t("menu_actions", lang), reply_markup=build_main_menu(chat_id)
+                t("menu_actions", lang), reply_markup=build_main_menu(auth)
             )
             return
 
     # Confirmation for opening the door
     if data.startswith("confirm_open:"):
         token = data.split(":", 1)[1]
-        if token not in open_tokens:
+        # Token is single-use, and expires after OPEN_CONFIRM_TTL
+        lock_key = _open_tokens.pop(chat_id, token)
+        lock = get_lock(lock_key) if lock_key is not None else None
+        if lock is None:
             await query.message.reply_text(t("confirm_open_expired", lang))
             return
 
-        # Token is single-use
-        open_tokens.pop(token, None)
-
         fake_update = Update(
             update.update_id,
             message=query.message,
         )
-        await _cmd_open_internal(chat_id, fake_update, context)
+        await _cmd_open_internal(auth, fake_update, context, lock=lock)
         return
 
     if data.startswith("cancel_open:"):
         token = data.split(":", 1)[1]
-        open_tokens.pop(token, None)
+        lock_key = _open_tokens.pop(chat_id, token)
         await query.message.reply_text(
             t("confirm_open_cancelled", lang),
-            reply_markup=build_main_menu(chat_id),
+            reply_markup=build_main_menu(auth, lock_key),
+        )
+        return
+
+    # Lock selector (multi-lock setups)
+    if data.startswith("lock:"):
+        lock_key = data.split(":", 1)[1]
+        lock = get_lock(lock_key)
+        if lock is None:
+            await query.message.reply_text(
+                t("lock_not_found", lang), reply_markup=build_main_menu(auth)
+            )
+            return
+        await query.message.reply_text(
+            t("menu_lock", lang, name=lock.name),
+            reply_markup=build_main_menu(auth, lock.key),
         )
         return
 
     # Command buttons
     if data.startswith("cmd:"):
-        _, cmd = data.split(":", 1)
+        # cmd:<op>[:<lock key>] - buttons without a key target the first lock
+        _, cmd, *rest = data.split(":", 2)
+        lock = get_lock(rest[0] if rest else None)
+        if lock is None:
+            await query.message.reply_text(
+                t("lock_not_found", lang), reply_markup=build_main_menu(auth)
+            )
+            return
 
         # Reuse the same functions used for /commands
         fake_update = Update(
@@ -679,21 +1507,20 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
 
         if cmd == "lock":
-            if not can_do(chat_id, "lock"):
-                return await handle_unauthorized(fake_update)
-            return await cmd_lock(fake_update, context)
+            if not auth.can("lock"):
+                return await handle_unauthorized(update, auth)
+            return await cmd_lock(fake_update, context, lock=lock)
 
         if cmd == "unlock":
-            if not can_do(chat_id, "unlock"):
-                return await handle_unauthorized(fake_update)
-            return await cmd_unlock(fake_update, context)
+            if not auth.can("unlock"):
+                return await handle_unauthorized(update, auth)
+            return await cmd_unlock(fake_update, context, lock=lock)
 
         if cmd == "open":
-            if not can_do(chat_id, "open"):
-                return await handle_unauthorized(fake_update)
+            if not auth.can("open"):
+                return await handle_unauthorized(update, auth)
             # Ask for confirmation with a one-time token
-            token = secrets.token_urlsafe(16)
-            open_tokens[token] = True
+            token = _open_tokens.issue(chat_id, lock.key, get_config().open_confirm_ttl)
             kb = InlineKeyboardMarkup(
                 [
                     [
@@ -709,20 +1536,25 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                 ]
             )
             await query.message.reply_text(
-                t("confirm_open_question", lang),
+                _lock_title(lock) + t("confirm_open_question", lang),
                 reply_markup=kb,
             )
             return
 
         if cmd == "lockngo":
-            if not can_do(chat_id, "lockngo"):
-                return await handle_unauthorized(fake_update)
-            return await cmd_lockngo(fake_update, context)
+            if not auth.can("lockngo"):
+                return await handle_unauthorized(update, auth)
+            return await cmd_lockngo(fake_update, context, lock=lock)
 
         if cmd == "status":
-            if not can_do(chat_id, "status"):
-                return await handle_unauthorized(fake_update)
-            return await cmd_status(fake_update, context)
+            if not auth.can("status"):
+                return await handle_unauthorized(update, auth)
+            return await cmd_status(fake_update, context, lock=lock)
+
+        if cmd == "statusall":
+            if not auth.can("status"):
+                return await handle_unauthorized(update, auth)
+            return await cmd_status_all(fake_update, context)
 
         if cmd == "id":
             return await cmd_id(fake_update, context)
@@ -733,36 +1565,36 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 # ---------------------------------------------------------------------------
 
 
+@timed("handler_seconds", handler="unknown_command")
 async def unknown_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle unknown /commands."""
-    chat = update.effective_chat
-    chat_id = chat.id if chat else None
+    auth = _auth(update, context)
 
     # Unknown users → fixed response
-    if chat_id is not None and _is_stranger(chat_id):
+    if _is_stranger(auth):
         await update.effective_message.reply_text("Silence is golden")
         return
 
-    lang = get_user_lang(chat.id) if chat else DEFAULT_LANG
     await update.effective_message.reply_text(
-        t("unknown_command", lang), reply_markup=build_main_menu(chat.id)
+        t("unknown_command", auth.lang), reply_markup=build_main_menu(auth)
     )
 
 
+@timed("handler_seconds", handler="handle_text")
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle plain text messages (non-commands)."""
     chat = update.effective_chat
-    chat_id = chat.id if chat else None
+    auth = _auth(update, context)
 
-    if chat_id is not None and _is_stranger(chat_id):
+    if _is_stranger(auth):
         await update.effective_message.reply_text("Silence is golden")
         return
 
-    lang = get_user_lang(chat.id) if chat else DEFAULT_LANG
+    lang = auth.lang
     text = (update.effective_message.text or "").strip()
 
     # Admin "add user" wizard
-    if is_admin(chat.id) and context.user_data.get("mode") == "add_user":
+    if auth.is_admin and context.user_data.get("mode") == "add_user":
         parts = text.split()
         if not parts:
             await update.effective_message.reply_text(
@@ -780,14 +1612,46 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             return
 
         name = " ".join(name_parts).strip() or f"user_{new_chat_id}"
-        add_or_update_user(new_chat_id, name, allowed=[])
+        add_or_update_user(new_chat_id, name, allowed=[], actor=chat.id)
         context.user_data["mode"] = None
         await update.effective_message.reply_text(
             t("add_user_ok", lang, uid=new_chat_id, name=name),
-            reply_markup=build_main_menu(chat.id),
+            reply_markup=build_main_menu(auth),
         )
         return
 
+    # Admin "add access window" wizard
+    if auth.is_admin and context.user_data.get("mode") == "add_schedule":
+        target_id = context.user_data.get("schedule_target")
+        try:
+            added = add_schedule(target_id, parse_rule(text), actor=chat.id)
+        except ValueError as exc:
+            await update.effective_message.reply_text(
+                t("schedule_invalid", lang, error=exc)
+            )
+            return
+        context.user_data["mode"] = None
+        context.user_data.pop("schedule_target", None)
+        if not added:
+            await update.effective_message.reply_text(
+                t("user_not_found", lang, uid=target_id),
+                reply_markup=build_main_menu(auth),
+            )
+            return
+        view_text, kb = _build_schedule_view(lang, target_id)
+        await update.effective_message.reply_text(view_text, reply_markup=kb)
+        return
+
+    # Admin user search: stays in search mode until /cancel
+    if (
+        auth.is_admin
+        and context.user_data.get("mode") == "search_users"
+        and text
+        and not text.startswith("/")
+    ):
+        await _show_search_results(update, lang, text)
+        return
+
     # Non-command text → gentle hint to use buttons
     if text.startswith("/"):
         msg = t("not_a_command", lang, text=text)
@@ -796,5 +1660,5 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
     await update.effective_message.reply_text(
         msg,
-        reply_markup=build_main_menu(chat.id),
+        reply_markup=build_main_menu(auth),
     )
@@ -0,0 +1,110 @@
+import logging
+import time
+from collections import deque
+from typing import Deque
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Fail fast while a remote endpoint is down.
+
+    CLOSED: calls go through; ``failure_threshold`` consecutive failures open
+    the circuit. OPEN: calls are refused until ``reset_timeout`` seconds have
+    passed. HALF_OPEN: a single trial call is let through; its outcome closes
+    or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30.0) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        """Return True if a call may be attempted now."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+            logger.info("Circuit %s half-open, sending a trial request", self.name)
+        # HALF_OPEN: one trial at a time
+        if self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+
+    def release_trial(self) -> None:
+        """Give up a call without an outcome (e.g. it was cancelled).
+
+        In HALF_OPEN the next call becomes the trial instead.
+        """
+        self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("Circuit %s closed, endpoint is back", self.name)
+        self.state = self.CLOSED
+        self._failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(
+                    "Circuit %s open after %d failure(s), failing fast for %.0fs",
+                    self.name,
+                    self._failures,
+                    self.reset_timeout,
+                )
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Sliding window of call durations, turned into an adaptive timeout.
+
+    The timeout is ``factor`` times the observed p95, clamped to
+    [min_timeout, max_timeout]. Until ``min_samples`` calls were seen, the
+    conservative ``max_timeout`` is used.
+    """
+
+    def __init__(
+        self,
+        min_timeout: float,
+        max_timeout: float,
+        factor: float = 3.0,
+        window: int = 50,
+        min_samples: int = 5,
+    ) -> None:
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.factor = factor
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def p95(self) -> float:
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def timeout(self) -> float:
+        if len(self._samples) < self.min_samples:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, self.p95() * self.factor))
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import secrets
+import time
+from typing import Any, Dict, List, Optional
+
+from config import LockConfig, get_config
+from http_server import HttpRequest, HttpResponse, json_response, start_http_server, text_response
+from nuki import (
+    nuki_callback_add,
+    nuki_callback_list,
+    nuki_callback_remove,
+    nuki_lock_state_cached,
+    set_push_ttl,
+    store_lock_state,
+)
+
+logger = logging.getLogger(__name__)
+
+# Optional push channel: RaspiNukiBridge POSTs every state change to a
+# callback URL. We serve that URL from a small embedded HTTP server and feed
+# the lock state cache in :mod:`nuki`, so /status is answered without a
+# bridge round trip. When a bridge sends no callback for
+# CALLBACK_STALE_AFTER seconds, the states of its locks are polled again and
+# its registration is re-checked; the other bridges are left alone.
+
+CALLBACK_PATH_PREFIX = "/nuki-callback/"
+
+_server: Optional[asyncio.AbstractServer] = None
+_fallback_task: Optional["asyncio.Task[None]"] = None
+_callback_url = ""
+# Monotonic time of the last callback, per bridge (LockConfig.bridge)
+_last_callback_at: Dict[str, float] = {}
+
+
+def _find_lock(payload: Dict[str, Any]) -> Optional[LockConfig]:
+    try:
+        nuki_id = int(payload["nukiId"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    device_type = payload.get("deviceType")
+    for lock in get_config().locks:
+        if lock.nuki_id == nuki_id and (device_type is None or lock.device_type == device_type):
+            return lock
+    return None
+
+
+async def _on_callback(request: HttpRequest) -> HttpResponse:
+    try:
+        payload = request.json()
+    except ValueError:
+        return text_response("invalid json", 400)
+    if not isinstance(payload, dict):
+        return text_response("invalid payload", 400)
+
+    lock = _find_lock(payload)
+    if lock is None:
+        logger.debug("Ignoring callback for unknown lock: %s", payload)
+        # Still 200: the bridge has nothing to retry
+        return json_response({"success": False})
+
+    _last_callback_at[lock.bridge] = time.monotonic()
+    state = {k: v for k, v in payload.items() if k not in ("nukiId", "deviceType")}
+    # Callbacks name the door sensor fields differently from /lockState
+    if "doorsensorState" in state and "doorState" not in state:
+        state["doorState"] = state["doorsensorState"]
+        if "doorsensorStateName" in state:
+            state["doorStateName"] = state["doorsensorStateName"]
+    store_lock_state(lock.key, state)
+    logger.info("Bridge callback for %s: state=%s", lock.key, state.get("stateName", state.get("state")))
+    return json_response({"success": True})
+
+
+def _bridges() -> List[LockConfig]:
+    """One lock per bridge: callbacks are registered per bridge, not per lock."""
+    seen: Dict[str, LockConfig] = {}
+    for lock in get_config().locks:
+        seen.setdefault(lock.bridge, lock)
+    return list(seen.values())
+
+
+async def _register(lock: LockConfig) -> bool:
+    """Make sure our callback URL (and only the current one) is registered.
+
+    Cached states of the bridge's locks are only trusted beyond the normal
+    TTL while it has our callback: without one they would never be refreshed.
+    """
+    registered = await _register_callback(lock)
+    set_push_ttl(lock.bridge, get_config().callback_stale_after if registered else 0.0)
+    return registered
+
+
+async def _register_callback(lock: LockConfig) -> bool:
+    res = await nuki_callback_list(lock)
+    if "error" in res:
+        logger.warning("Cannot list callbacks on bridge %s: %s", lock.bridge, res["error"])
+        return False
+
+    registered = False
+    for cb in res.get("callbacks") or []:
+        url = cb.get("url") or ""
+        if url == _callback_url:
+            registered = True
+        elif url.startswith(get_config().callback_url + CALLBACK_PATH_PREFIX):
+            # Left over from a previous run with a different secret
+            await nuki_callback_remove(lock, cb.get("id"))
+
+    if registered:
+        return True
+    res = await nuki_callback_add(lock, _callback_url)
+    if "error" in res or res.get("success") is False:
+        logger.warning("Cannot register callback on bridge %s: %s", lock.bridge, res)
+        return False
+    logger.info("Registered state callback on bridge %s", lock.bridge)
+    return True
+
+
+async def _check_quiet_bridge(lock: LockConfig, stale_after: float) -> None:
+    """Poll and re-register ``lock``'s bridge if its callbacks went quiet."""
+    bridge = lock.bridge
+    quiet_for = time.monotonic() - _last_callback_at.get(bridge, 0.0)
+    if quiet_for < stale_after:
+        return
+    try:
+        logger.info("No callback from bridge %s for %.0fs, polling lock state", bridge, quiet_for)
+        for other in get_config().locks:
+            if other.bridge == bridge:
+                # Refresh anything that would expire before the next round
+                await nuki_lock_state_cached(other, max_age=stale_after / 2)
+        # The bridge may have restarted and forgotten us
+        await _register(lock)
+    except Exception:
+        logger.exception("Error in fallback polling of bridge %s", bridge)
+
+
+async def _fallback_loop(stale_after: float) -> None:
+    while True:
+        await asyncio.sleep(stale_after / 2)
+        await asyncio.gather(*(_check_quiet_bridge(lock, stale_after) for lock in _bridges()))
+
+
+async def start_callback_receiver() -> None:
+    """Start the callback server and register it with every bridge.
+
+    Does nothing unless CALLBACK_URL is configured.
+    """
+    global _server, _fallback_task, _callback_url
+    cfg = get_config()
+    if not cfg.callback_url or _server is not None:
+        return
+
+    secret = cfg.callback_secret or secrets.token_urlsafe(16)
+    path = CALLBACK_PATH_PREFIX + secret
+    _callback_url = cfg.callback_url + path
+    _server = await start_http_server(
+        cfg.callback_listen_host,
+        cfg.callback_listen_port,
+        {("POST", path): _on_callback},
+    )
+    logger.info(
+        "Bridge callback receiver listening on %s:%s",
+        cfg.callback_listen_host,
+        cfg.callback_listen_port,
+    )
+
+    now = time.monotonic()
+    bridges = _bridges()
+    _last_callback_at.update((lock.bridge, now) for lock in bridges)
+    await asyncio.gather(*(_register(lock) for lock in bridges))
+    _fallback_task = asyncio.create_task(_fallback_loop(cfg.callback_stale_after))
+
+
+async def stop_callback_receiver() -> None:
+    """Stop the callback server and go back to plain polling."""
+    global _server, _fallback_task
+    for lock in _bridges():
+        set_push_ttl(lock.bridge, 0.0)
+    _last_callback_at.clear()
+    if _fallback_task is not None:
+        _fallback_task.cancel()
+        _fallback_task = None
+    if _server is not None:
+        _server.close()
+        await _server.wait_closed()
+        _server = None
@@ -0,0 +1,399 @@
+"""Local RaspiNukiBridge simulator.
+
+Serves /lockState, /lockAction and /callback/{add,list,remove} like the real
+bridge, with realistic state transitions and configurable latency and
+faults, so bridge slowness can be reproduced without a lock or a network.
+
+From tests / benchmarks::
+
+    bridge = FakeBridge(
+        locks=[SimulatedLock(nuki_id=123456789)],
+        token="secret",
+        profile=FaultProfile(latency=0.3, jitter=0.1, busy_rate=0.1),
+    )
+    port = await bridge.start()
+    ...
+    await bridge.stop()
+
+As a standalone process (then point NUKI_BRIDGE_HOST/NUKI_BRIDGE_PORT at it)::
+
+    python bridge_sim.py --port 8080 --token secret --nuki-id 123456789 \\
+        --latency 0.3 --jitter 0.1 --busy-rate 0.1
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from http_server import HttpRequest, HttpResponse, json_response, start_http_server
+
+logger = logging.getLogger(__name__)
+
+STATE_NAMES = {
+    0: "uncalibrated",
+    1: "locked",
+    2: "unlocking",
+    3: "unlocked",
+    4: "locking",
+    5: "unlatched",
+    6: "unlocked (lock 'n' go)",
+    7: "unlatching",
+    254: "motor blocked",
+    255: "undefined",
+}
+DOOR_STATE_NAMES = {
+    0: "unavailable",
+    1: "deactivated",
+    2: "door closed",
+    3: "door opened",
+    4: "door state unknown",
+    5: "calibrating",
+}
+
+# action code → (transitional state, final state)
+ACTIONS = {
+    1: (2, 3),  # unlock
+    2: (4, 1),  # lock
+    3: (7, 5),  # unlatch
+    4: (2, 6),  # lock 'n' go: unlocks, then locks again later
+}
+
+
+@dataclass
+class FaultProfile:
+    """Latency and fault injection for one endpoint (or all of them).
+
+    ``distribution`` is one of "fixed", "uniform" (latency ± jitter),
+    "normal" (mean latency, std dev jitter) or "lognormal" (median latency,
+    jitter = sigma of the underlying normal, gives a long tail).
+    Rates are probabilities in [0, 1], checked in this order: hang, error,
+    busy.
+    """
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    distribution: str = "normal"
+    # Never answer (well, after ``hang_seconds``)
+    hang_rate: float = 0.0
+    hang_seconds: float = 3600.0
+    # HTTP 500
+    error_rate: float = 0.0
+    # HTTP 503, as when the bridge is busy talking BLE to another lock
+    busy_rate: float = 0.0
+
+    def sample_latency(self, rng: random.Random) -> float:
+        if self.distribution == "fixed" or self.jitter <= 0:
+            value = self.latency
+        elif self.distribution == "uniform":
+            value = rng.uniform(self.latency - self.jitter, self.latency + self.jitter)
+        elif self.distribution == "lognormal":
+            value = self.latency * rng.lognormvariate(0.0, self.jitter)
+        else:
+            value = rng.gauss(self.latency, self.jitter)
+        return max(0.0, value)
+
+
+@dataclass
+class SimulatedLock:
+    nuki_id: int
+    device_type: int = 0
+    state: int = 1
+    door_state: int = 2
+    battery_charge: int = 80
+    battery_critical: bool = False
+    # Seconds a motor movement takes (transitional → final state)
+    transition_time: float = 1.5
+    # Seconds the door stays open after an unlatch / lock 'n' go relock delay
+    door_open_time: float = 5.0
+    last_action: Optional[datetime] = None
+
+    def to_state(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "mode": 2,
+            "state": self.state,
+            "stateName": STATE_NAMES.get(self.state, "undefined"),
+            "batteryCritical": self.battery_critical,
+            "batteryChargeState": self.battery_charge,
+            "doorState": self.door_state,
+            "doorStateName": DOOR_STATE_NAMES.get(self.door_state, "unknown"),
+            "success": True,
+        }
+        if self.last_action is not None:
+            data["lastActionDate"] = self.last_action.strftime("%Y-%m-%dT%H:%M:%SZ")
+        return data
+
+    def to_callback(self) -> Dict[str, Any]:
+        # Callbacks use the door sensor naming of the Nuki API
+        return {
+            "nukiId": self.nuki_id,
+            "deviceType": self.device_type,
+            "mode": 2,
+            "state": self.state,
+            "stateName": STATE_NAMES.get(self.state, "undefined"),
+            "batteryCritical": self.battery_critical,
+            "batteryChargeState": self.battery_charge,
+            "doorsensorState": self.door_state,
+            "doorsensorStateName": DOOR_STATE_NAMES.get(self.door_state, "unknown"),
+        }
+
+
+class FakeBridge:
+    """In-process fake RaspiNukiBridge."""
+
+    MAX_CALLBACKS = 3
+
+    def __init__(
+        self,
+        locks: Optional[List[SimulatedLock]] = None,
+        token: str = "",
+        profile: Optional[FaultProfile] = None,
+        endpoint_profiles: Optional[Dict[str, FaultProfile]] = None,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.locks: Dict[int, SimulatedLock] = {
+            lock.nuki_id: lock for lock in (locks or [SimulatedLock(nuki_id=1)])
+        }
+        self.token = token
+        self.profile = profile or FaultProfile()
+        self.endpoint_profiles: Dict[str, FaultProfile] = dict(endpoint_profiles or {})
+        self.callbacks: List[str] = []
+        # Requests received per endpoint, for assertions and benchmarks
+        self.requests: Counter = Counter()
+        self.port = 0
+        self._rng = random.Random(seed)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        # Pending state transitions; each handle removes itself when it fires
+        self._timers: "set[asyncio.TimerHandle]" = set()
+        self._tasks: "set[asyncio.Task[None]]" = set()
+
+    # -- lifecycle ---------------------------------------------------------
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Start serving; returns the bound port (``port=0`` picks a free one)."""
+        routes = {
+            ("GET", "/lockState"): self._endpoint("lockState", self._lock_state),
+            ("GET", "/lockAction"): self._endpoint("lockAction", self._lock_action),
+            ("GET", "/callback/add"): self._endpoint("callback", self._callback_add),
+            ("GET", "/callback/list"): self._endpoint("callback", self._callback_list),
+            ("GET", "/callback/remove"): self._endpoint("callback", self._callback_remove),
+        }
+        self._client = httpx.AsyncClient(timeout=5.0)
+        self._server = await start_http_server(host, port, routes)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Fake bridge listening on %s:%s", host, self.port)
+        return self.port
+
+    async def stop(self) -> None:
+        for timer in list(self._timers):
+            timer.cancel()
+        self._timers.clear()
+        for task in list(self._tasks):
+            task.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # -- test helpers ------------------------------------------------------
+
+    def set_state(
+        self,
+        nuki_id: int,
+        state: Optional[int] = None,
+        door_state: Optional[int] = None,
+        battery_critical: Optional[bool] = None,
+    ) -> None:
+        """Change a lock from "outside" (keypad, app...) and post callbacks."""
+        lock = self.locks[nuki_id]
+        if state is not None:
+            lock.state = state
+            lock.last_action = datetime.now(timezone.utc)
+        if door_state is not None:
+            lock.door_state = door_state
+        if battery_critical is not None:
+            lock.battery_critical = battery_critical
+        self._notify(lock)
+
+    # -- internals ---------------------------------------------------------
+
+    def _endpoint(self, name: str, handler: Any) -> Any:
+        async def _wrapped(request: HttpRequest) -> HttpResponse:
+            self.requests[name] += 1
+            profile = self.endpoint_profiles.get(name, self.profile)
+            await asyncio.sleep(profile.sample_latency(self._rng))
+            roll = self._rng.random()
+            if roll < profile.hang_rate:
+                await asyncio.sleep(profile.hang_seconds)
+            roll -= profile.hang_rate
+            if 0 <= roll < profile.error_rate:
+                return json_response({"success": False, "error": "internal error"}, 500)
+            roll -= profile.error_rate
+            if 0 <= roll < profile.busy_rate:
+                return json_response({"success": False, "error": "bluetooth busy"}, 503)
+            if self.token and request.query.get("token") != self.token:
+                return json_response({"success": False, "error": "unauthorized"}, 401)
+            return await handler(request)
+
+        return _wrapped
+
+    def _find_lock(self, request: HttpRequest) -> Optional[SimulatedLock]:
+        try:
+            return self.locks.get(int(request.query.get("nukiId", "")))
+        except ValueError:
+            return None
+
+    async def _lock_state(self, request: HttpRequest) -> HttpResponse:
+        lock = self._find_lock(request)
+        if lock is None:
+            return json_response({"success": False, "error": "unknown lock"}, 404)
+        return json_response(lock.to_state())
+
+    async def _lock_action(self, request: HttpRequest) -> HttpResponse:
+        lock = self._find_lock(request)
+        if lock is None:
+            return json_response({"success": False, "error": "unknown lock"}, 404)
+        try:
+            action = int(request.query.get("action", ""))
+        except ValueError:
+            action = 0
+        if action not in ACTIONS:
+            return json_response({"success": False, "error": "invalid action"}, 400)
+
+        transitional, final = ACTIONS[action]
+        lock.state = transitional
+        lock.last_action = datetime.now(timezone.utc)
+        self._notify(lock)
+        self._later(lock.transition_time, self._finish_action, lock, action, final)
+        return json_response({"success": True, "batteryCritical": lock.battery_critical})
+
+    def _finish_action(self, lock: SimulatedLock, action: int, final: int) -> None:
+        lock.state = final
+        if action == 3:
+            # Unlatched: the door swings open, then closes again
+            lock.door_state = 3
+            self._later(lock.door_open_time, self._close_door, lock)
+        elif action == 4:
+            # Lock 'n' go relocks after a grace period
+            self._later(lock.door_open_time, self._relock, lock)
+        self._notify(lock)
+
+    def _close_door(self, lock: SimulatedLock) -> None:
+        lock.door_state = 2
+        if lock.state == 5:
+            lock.state = 3
+        self._notify(lock)
+
+    def _relock(self, lock: SimulatedLock) -> None:
+        lock.state = 1
+        self._notify(lock)
+
+    def _later(self, delay: float, func: Any, *args: Any) -> None:
+        loop = asyncio.get_running_loop()
+        handle: Optional[asyncio.TimerHandle] = None
+
+        def _fire() -> None:
+            self._timers.discard(handle)
+            func(*args)
+
+        handle = loop.call_later(delay, _fire)
+        self._timers.add(handle)
+
+    async def _callback_add(self, request: HttpRequest) -> HttpResponse:
+        url = request.query.get("url", "")
+        if not url.startswith(("http://", "https://")):
+            return json_response({"success": False, "message": "invalid url"}, 400)
+        if url in self.callbacks:
+            return json_response({"success": False, "message": "callback already added"})
+        if len(self.callbacks) >= self.MAX_CALLBACKS:
+            return json_response({"success": False, "message": "too many callbacks registered"})
+        self.callbacks.append(url)
+        return json_response({"success": True})
+
+    async def _callback_list(self, request: HttpRequest) -> HttpResponse:
+        return json_response(
+            {"callbacks": [{"id": idx, "url": url} for idx, url in enumerate(self.callbacks)]}
+        )
+
+    async def _callback_remove(self, request: HttpRequest) -> HttpResponse:
+        try:
+            idx = int(request.query.get("id", ""))
+            del self.callbacks[idx]
+        except (ValueError, IndexError):
+            return json_response({"success": False, "message": "invalid id"}, 400)
+        return json_response({"success": True})
+
+    def _notify(self, lock: SimulatedLock) -> None:
+        if not self.callbacks or self._client is None:
+            return
+        payload = lock.to_callback()
+        for url in list(self.callbacks):
+            task = asyncio.ensure_future(self._post_callback(url, payload))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _post_callback(self, url: str, payload: Dict[str, Any]) -> None:
+        assert self._client is not None
+        try:
+            await self._client.post(url, json=payload)
+        except httpx.HTTPError as exc:
+            logger.warning("Callback to %s failed: %s", url, exc)
+
+
+async def _run(args: argparse.Namespace) -> None:
+    profile = FaultProfile(
+        latency=args.latency,
+        jitter=args.jitter,
+        distribution=args.distribution,
+        hang_rate=args.hang_rate,
+        error_rate=args.error_rate,
+        busy_rate=args.busy_rate,
+    )
+    locks = [SimulatedLock(nuki_id=nuki_id) for nuki_id in args.nuki_id or [1]]
+    bridge = FakeBridge(locks=locks, token=args.token, profile=profile, seed=args.seed)
+    await bridge.start(args.host, args.port)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await bridge.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake RaspiNukiBridge for local testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--token", default="", help="expected token (empty: accept any)")
+    parser.add_argument("--nuki-id", type=int, action="append", help="simulated lock (repeatable)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument(
+        "--distribution", choices=["fixed", "uniform", "normal", "lognormal"], default="normal"
+    )
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--busy-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO,
+    )
+    try:
+        asyncio.run(_run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
+import json
 import logging
 import os
-from dataclasses import dataclass
-from typing import List, Optional
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from urllib.parse import urlsplit
 
 from dotenv import load_dotenv
 
@@ -12,14 +14,77 @@ load_dotenv()
 
 
 @dataclass
-class BotConfig:
-    telegram_bot_token: str
+class LockConfig:
+    # Short identifier used in callback data (keep it small: 64 bytes max)
+    key: str
+    name: str
     bridge_host: str
     bridge_port: int
     nuki_token: str
     nuki_id: int
     device_type: int
+
+    @property
+    def bridge(self) -> str:
+        """Identifier of the bridge this lock is paired with."""
+        return f"{self.bridge_host}:{self.bridge_port}"
+
+
+@dataclass
+class BotConfig:
+    telegram_bot_token: str
+    locks: List[LockConfig]
     owners: List[int]
+    # Same IDs as owners, for O(1) admin checks
+    owner_ids: FrozenSet[int] = frozenset()
+    # Seconds a /lockState answer is reused before asking the bridge again
+    state_cache_ttl: float = 5.0
+    # Per-bridge timeout (seconds) for the "all locks" status view
+    status_all_timeout: float = 5.0
+    # Bridge callbacks: public base URL the bridge can reach ("" = disabled)
+    callback_url: str = ""
+    callback_listen_host: str = "0.0.0.0"
+    callback_listen_port: int = 8090
+    # Random path component so only the bridge knows where to post
+    callback_secret: str = ""
+    # Without callbacks for this long, fall back to polling
+    callback_stale_after: float = 300.0
+    # Circuit breaker: consecutive failures before a bridge is considered
+    # offline, and seconds before a trial request is attempted again
+    bridge_failure_threshold: int = 3
+    bridge_reset_timeout: float = 30.0
+    # Adaptive per-endpoint timeout bounds (seconds)
+    bridge_timeout_min: float = 2.0
+    bridge_timeout_max: float = 10.0
+    # Background state watcher and subscriber notifications (opt-in)
+    watcher_enabled: bool = False
+    watcher_poll_interval: float = 60.0
+    # Notify when the door stays open this long (seconds, 0 = never)
+    door_open_alert_after: float = 300.0
+    # Wait for the lock to reach the requested state after an action and
+    # edit the confirmation message with the outcome (opt-in)
+    verify_actions: bool = False
+    verify_timeout: float = 30.0
+    # Edit the "Sending..."/"Reading state..." message with the result
+    # instead of sending a second message
+    progress_edit: bool = True
+    # Updates handled at once (different chats only: each chat's updates
+    # still run one at a time, in order; 1 = fully sequential)
+    concurrent_updates: int = 16
+    # Seconds a "Yes, open" confirmation button stays valid
+    open_confirm_ttl: float = 60.0
+    # Per-chat request limits: kind ("default" or a permission) →
+    # (requests, seconds); empty = unlimited
+    rate_limits: Dict[str, Tuple[int, float]] = field(default_factory=dict)
+    # Outgoing messages: overall and per-chat rates (messages/s), per-chat
+    # burst, and retries of requests refused with RetryAfter
+    telegram_rate: float = 30.0
+    telegram_chat_rate: float = 1.0
+    telegram_chat_burst: int = 3
+    telegram_max_retries: int = 3
+    # Local Prometheus /metrics endpoint (port 0 = disabled)
+    metrics_host: str = "127.0.0.1"
+    metrics_port: int = 0
 
 
 _config: Optional[BotConfig] = None
@@ -37,6 +102,28 @@ def _read_env_int(name: str, default: Optional[int] = None) -> int:
         raise RuntimeError(f"Env variable {name} must be an integer, got {value!r}") from exc
 
 
+def _read_env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except ValueError as exc:
+        raise RuntimeError(f"Env variable {name} must be a number, got {value!r}") from exc
+
+
+def _read_env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    lowered = value.strip().lower()
+    if lowered in ("1", "true", "yes", "on"):
+        return True
+    if lowered in ("0", "false", "no", "off"):
+        return False
+    raise RuntimeError(f"Env variable {name} must be a boolean, got {value!r}")
+
+
 def _read_env_str(name: str, required: bool = True, default: Optional[str] = None) -> str:
     value = os.getenv(name, default)
     if required and (value is None or value == ""):
@@ -45,6 +132,83 @@ def _read_env_str(name: str, required: bool = True, default: Optional[str] = Non
     return value
 
 
+DEFAULT_RATE_LIMITS = (
+    "default=30/60,status=10/60,lock=6/60,unlock=6/60,open=6/60,lockngo=6/60"
+)
+
+
+def _read_rate_limits(name: str, default: str) -> Dict[str, Tuple[int, float]]:
+    """Parse "kind=requests/seconds,..." (e.g. "default=30/60,open=5/60")."""
+    value = os.getenv(name, default)
+    limits: Dict[str, Tuple[int, float]] = {}
+    for raw in value.split(","):
+        raw = raw.strip()
+        if not raw:
+            continue
+        kind, _, rate = raw.partition("=")
+        requests, _, seconds = rate.partition("/")
+        try:
+            limit = (int(requests), float(seconds))
+        except ValueError:
+            limit = (0, 0.0)
+        if not kind.strip() or limit[0] <= 0 or limit[1] <= 0:
+            raise RuntimeError(
+                f"Env variable {name}: invalid entry {raw!r}, expected kind=requests/seconds"
+            )
+        limits[kind.strip()] = limit
+    return limits
+
+
+def _load_locks_file(path: str) -> List[LockConfig]:
+    """Read the list of locks from a JSON file (see locks.json.example).
+
+    Bridge host/port/token may be omitted per lock: the NUKI_BRIDGE_HOST,
+    NUKI_BRIDGE_PORT and NUKI_TOKEN env variables are used as defaults.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f) or {}
+    except Exception as exc:
+        raise RuntimeError(f"Cannot read locks file {path}: {exc}") from exc
+
+    raw_locks = data.get("locks") if isinstance(data, dict) else None
+    if not isinstance(raw_locks, list) or not raw_locks:
+        raise RuntimeError(f"Locks file {path} must contain a non-empty \"locks\" list")
+
+    default_host = _read_env_str("NUKI_BRIDGE_HOST", required=False, default="127.0.0.1")
+    default_port = _read_env_int("NUKI_BRIDGE_PORT", default=8080)
+    default_token = os.getenv("NUKI_TOKEN", "")
+
+    locks: List[LockConfig] = []
+    seen: Dict[str, int] = {}
+    for idx, raw in enumerate(raw_locks):
+        if not isinstance(raw, dict):
+            raise RuntimeError(f"Locks file {path}: entry #{idx} is not an object")
+        try:
+            nuki_id = int(raw["nuki_id"])
+            key = str(raw.get("key") or nuki_id)
+            lock = LockConfig(
+                key=key,
+                name=str(raw.get("name") or key),
+                bridge_host=str(raw.get("bridge_host") or default_host),
+                bridge_port=int(raw.get("bridge_port") or default_port),
+                nuki_token=str(raw.get("nuki_token") or default_token),
+                nuki_id=nuki_id,
+                device_type=int(raw.get("device_type") or 0),
+            )
+        except (KeyError, TypeError, ValueError) as exc:
+            raise RuntimeError(f"Locks file {path}: invalid entry #{idx}: {exc}") from exc
+        if ":" in lock.key:
+            raise RuntimeError(f"Locks file {path}: key {lock.key!r} must not contain ':'")
+        if lock.key in seen:
+            raise RuntimeError(f"Locks file {path}: duplicate key {lock.key!r}")
+        if not lock.nuki_token:
+            raise RuntimeError(f"Locks file {path}: no token for lock {lock.key!r}")
+        seen[lock.key] = idx
+        locks.append(lock)
+    return locks
+
+
 def load_config() -> BotConfig:
     """Load configuration from environment variables.
 
@@ -57,11 +221,29 @@ def load_config() -> BotConfig:
         return _config
 
     telegram_bot_token = _read_env_str("TELEGRAM_BOT_TOKEN")
-    bridge_host = _read_env_str("NUKI_BRIDGE_HOST", required=False, default="127.0.0.1")
-    bridge_port = _read_env_int("NUKI_BRIDGE_PORT", default=8080)
-    nuki_token = _read_env_str("NUKI_TOKEN")
-    nuki_id = _read_env_int("NUKI_ID")
-    device_type = _read_env_int("NUKI_DEVICE_TYPE", default=0)
+    locks_file = os.getenv("NUKI_LOCKS_FILE", "")
+    if locks_file:
+        locks = _load_locks_file(locks_file)
+    else:
+        # Single lock configured directly through the environment
+        locks = [
+            LockConfig(
+                key="main",
+                name=_read_env_str("NUKI_NAME", required=False, default="Nuki"),
+                bridge_host=_read_env_str("NUKI_BRIDGE_HOST", required=False, default="127.0.0.1"),
+                bridge_port=_read_env_int("NUKI_BRIDGE_PORT", default=8080),
+                nuki_token=_read_env_str("NUKI_TOKEN"),
+                nuki_id=_read_env_int("NUKI_ID"),
+                device_type=_read_env_int("NUKI_DEVICE_TYPE", default=0),
+            )
+        ]
+    status_all_timeout = _read_env_float("STATUS_ALL_TIMEOUT", default=5.0)
+
+    callback_url = _read_env_str("CALLBACK_URL", required=False, default="").rstrip("/")
+    callback_listen_port = _read_env_int(
+        "CALLBACK_LISTEN_PORT", default=urlsplit(callback_url).port or 8090
+    )
+    state_cache_ttl = _read_env_float("NUKI_STATE_CACHE_TTL", default=5.0)
 
     owners_env = os.getenv("OWNERS", "")
     owners: List[int] = []
@@ -83,18 +265,42 @@ def load_config() -> BotConfig:
 
     _config = BotConfig(
         telegram_bot_token=telegram_bot_token,
-        bridge_host=bridge_host,
-        bridge_port=bridge_port,
-        nuki_token=nuki_token,
-        nuki_id=nuki_id,
-        device_type=device_type,
+        locks=locks,
         owners=owners,
+        owner_ids=frozenset(owners),
+        state_cache_ttl=state_cache_ttl,
+        status_all_timeout=status_all_timeout,
+        callback_url=callback_url,
+        callback_listen_host=_read_env_str(
+            "CALLBACK_LISTEN_HOST", required=False, default="0.0.0.0"
+        ),
+        callback_listen_port=callback_listen_port,
+        callback_secret=_read_env_str("CALLBACK_SECRET", required=False, default=""),
+        callback_stale_after=_read_env_float("CALLBACK_STALE_AFTER", default=300.0),
+        bridge_failure_threshold=_read_env_int("BRIDGE_FAILURE_THRESHOLD", default=3),
+        bridge_reset_timeout=_read_env_float("BRIDGE_RESET_TIMEOUT", default=30.0),
+        bridge_timeout_min=_read_env_float("BRIDGE_TIMEOUT_MIN", default=2.0),
+        bridge_timeout_max=_read_env_float("BRIDGE_TIMEOUT_MAX", default=10.0),
+        watcher_enabled=_read_env_bool("WATCHER_ENABLED", default=False),
+        watcher_poll_interval=_read_env_float("WATCHER_POLL_INTERVAL", default=60.0),
+        door_open_alert_after=_read_env_float("DOOR_OPEN_ALERT_AFTER", default=300.0),
+        verify_actions=_read_env_bool("VERIFY_ACTIONS", default=False),
+        verify_timeout=_read_env_float("VERIFY_TIMEOUT", default=30.0),
+        progress_edit=_read_env_bool("PROGRESS_EDIT", default=True),
+        open_confirm_ttl=_read_env_float("OPEN_CONFIRM_TTL", default=60.0),
+        concurrent_updates=_read_env_int("CONCURRENT_UPDATES", default=16),
+        rate_limits=_read_rate_limits("RATE_LIMITS", DEFAULT_RATE_LIMITS),
+        telegram_rate=_read_env_float("TELEGRAM_RATE", default=30.0),
+        telegram_chat_rate=_read_env_float("TELEGRAM_CHAT_RATE", default=1.0),
+        telegram_chat_burst=_read_env_int("TELEGRAM_CHAT_BURST", default=3),
+        telegram_max_retries=_read_env_int("TELEGRAM_MAX_RETRIES", default=3),
+        metrics_host=_read_env_str("METRICS_HOST", required=False, default="127.0.0.1"),
+        metrics_port=_read_env_int("METRICS_PORT", default=0),
     )
 
     logger.info(
-        "Configuration loaded. bridge=%s:%s, owners=%s",
-        bridge_host,
-        bridge_port,
+        "Configuration loaded. locks=%s, owners=%s",
+        ", ".join(f"{lock.key}@{lock.bridge}" for lock in locks),
         owners or "[]",
     )
 
@@ -109,3 +315,17 @@ def get_config() -> BotConfig:
     if _config is None:
         raise RuntimeError("Config not loaded. Call load_config() before get_config().")
     return _config
+
+
+def get_lock(key: Optional[str] = None) -> Optional[LockConfig]:
+    """Return the lock with the given key, or the first configured lock.
+
+    :return: the lock, or None if ``key`` does not match any configured lock.
+    """
+    cfg = get_config()
+    if key is None:
+        return cfg.locks[0]
+    for lock in cfg.locks:
+        if lock.key == key:
+            return lock
+    return None
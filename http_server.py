@@ -0,0 +1,133 @@
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable, Dict, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Tiny HTTP/1.1 server on top of asyncio streams, used for the small local
+# endpoints the bot exposes (bridge callbacks, metrics...). One request per
+# connection, no chunked encoding: that is all those endpoints need and it
+# avoids pulling in a web framework.
+
+MAX_HEADER_LINES = 100
+MAX_BODY_SIZE = 64 * 1024
+READ_TIMEOUT = 10.0
+
+
+@dataclass
+class HttpRequest:
+    method: str
+    path: str
+    query: Dict[str, str]
+    headers: Dict[str, str]
+    body: bytes
+    peer: str
+
+    def json(self) -> Any:
+        """Decode the body as JSON (empty body → None)."""
+        if not self.body:
+            return None
+        return json.loads(self.body.decode("utf-8"))
+
+
+# (status, content type, body)
+HttpResponse = Tuple[int, str, bytes]
+Handler = Callable[[HttpRequest], Awaitable[HttpResponse]]
+
+
+def json_response(data: Any, status: int = 200) -> HttpResponse:
+    return status, "application/json", json.dumps(data).encode("utf-8")
+
+
+def text_response(text: str, status: int = 200, content_type: str = "text/plain; charset=utf-8") -> HttpResponse:
+    return status, content_type, text.encode("utf-8")
+
+
+async def _read_request(reader: asyncio.StreamReader, peer: str) -> HttpRequest:
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    method, target, _version = request_line.split(" ", 2)
+
+    headers: Dict[str, str] = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = (await reader.readline()).decode("latin-1")
+        if line in ("\r\n", "\n", ""):
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise ValueError("too many headers")
+
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY_SIZE:
+        raise ValueError("body too large")
+    body = await reader.readexactly(length) if length else b""
+
+    url = urlsplit(target)
+    return HttpRequest(
+        method=method.upper(),
+        path=url.path,
+        query=dict(parse_qsl(url.query)),
+        headers=headers,
+        body=body,
+        peer=peer,
+    )
+
+
+async def _write_response(writer: asyncio.StreamWriter, response: HttpResponse) -> None:
+    status, content_type, body = response
+    try:
+        reason = HTTPStatus(status).phrase
+    except ValueError:
+        reason = ""
+    head = (
+        f"HTTP/1.1 {status} {reason}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: close\r\n"
+        "\r\n"
+    )
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
+
+
+async def start_http_server(
+    host: str, port: int, routes: Dict[Tuple[str, str], Handler]
+) -> asyncio.AbstractServer:
+    """Start serving ``routes`` on host:port.
+
+    :param routes: mapping of (METHOD, path) → async handler.
+    :return: the running server; close it with ``server.close()`` and
+        ``await server.wait_closed()``.
+    """
+
+    async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peername = writer.get_extra_info("peername")
+        peer = peername[0] if peername else "?"
+        try:
+            try:
+                request = await asyncio.wait_for(_read_request(reader, peer), READ_TIMEOUT)
+            except (ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError) as exc:
+                logger.debug("Bad HTTP request from %s: %s", peer, exc)
+                await _write_response(writer, text_response("bad request", 400))
+                return
+
+            handler = routes.get((request.method, request.path))
+            if handler is None:
+                response = text_response("not found", 404)
+            else:
+                try:
+                    response = await handler(request)
+                except Exception:
+                    logger.exception("Error handling %s %s", request.method, request.path)
+                    response = text_response("internal error", 500)
+            await _write_response(writer, response)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(_handle, host, port)
@@ -34,6 +34,10 @@ MESSAGES: Dict[str, Dict[str, str]] = {
         "it": "Comando sconosciuto. Usa i pulsanti qui sotto.",
         "en": "Unknown command. Use the buttons below.",
     },
+    "rate_limited": {
+        "it": "Troppe richieste, riprova tra {seconds} s.",
+        "en": "Too many requests, try again in {seconds} s.",
+    },
     "not_a_command": {
         "it": "\"{text}\" non è un comando. Usa i pulsanti qui sotto.",
         "en": "\"{text}\" is not a command. Use the buttons below.",
@@ -96,6 +100,36 @@ MESSAGES: Dict[str, Dict[str, str]] = {
         "it": "⚠️ Impossibile determinare con certezza l'esito dal bridge.",
         "en": "⚠️ Unable to determine the result from the bridge.",
     },
+    "action_waiting": {
+        "it": "⏳ Attendo conferma dalla serratura...",
+        "en": "⏳ Waiting for the lock to confirm...",
+    },
+    "action_confirmed": {
+        "it": "✅ {state_name} in {seconds}s",
+        "en": "✅ {state_name} in {seconds}s",
+    },
+    "action_not_confirmed": {
+        "it": "⚠️ Nessuna conferma dopo {seconds}s (stato: {state_name})",
+        "en": "⚠️ Not confirmed after {seconds}s (state: {state_name})",
+    },
+    "action_motor_blocked": {
+        "it": "❌ Motore bloccato dopo {seconds}s",
+        "en": "❌ Motor blocked after {seconds}s",
+    },
+    "bridge_offline": {
+        "it": "📴 Il bridge Nuki non risponde. Riprova tra poco.",
+        "en": "📴 The Nuki bridge is not responding. Please try again shortly.",
+    },
+    "bridge_action_timeout": {
+        "it": (
+            "⏳ Il bridge Nuki non ha risposto in tempo: l'azione potrebbe essere "
+            "stata eseguita comunque. Controlla lo stato prima di riprovare."
+        ),
+        "en": (
+            "⏳ The Nuki bridge did not answer in time: the action may have been "
+            "carried out anyway. Check the status before trying again."
+        ),
+    },
     "battery_critical": {
         "it": (
             "🔋 ATTENZIONE: la serratura riporta batteria CRITICA.\n"
@@ -136,6 +170,40 @@ MESSAGES: Dict[str, Dict[str, str]] = {
         "it": "Ultimo aggiornamento (UTC): {ts}",
         "en": "Last update (UTC): {ts}",
     },
+    "lock_not_found": {
+        "it": "Serratura non trovata (configurazione cambiata?).",
+        "en": "Lock not found (configuration changed?).",
+    },
+    "menu_lock": {
+        "it": "Serratura selezionata: {name}",
+        "en": "Selected lock: {name}",
+    },
+    "state_cache_age": {
+        "it": "⏱ Dati letti {age}s fa.",
+        "en": "⏱ Data read {age}s ago.",
+    },
+
+    # State change notifications (watcher.py)
+    "notify_battery_critical": {
+        "it": "🔋 {name}: batteria CRITICA, sostituiscila al più presto.",
+        "en": "🔋 {name}: battery CRITICAL, replace it as soon as possible.",
+    },
+    "notify_unlocked_elsewhere": {
+        "it": "🔓 {name}: serratura aperta da qualcun altro (non dal bot).",
+        "en": "🔓 {name}: unlocked by someone else (not through the bot).",
+    },
+    "notify_door_open": {
+        "it": "🚪 {name}: porta aperta da più di {minutes} min.",
+        "en": "🚪 {name}: door left open for more than {minutes} min.",
+    },
+    "notify_enabled": {
+        "it": "🔔 Notifiche attivate.",
+        "en": "🔔 Notifications enabled.",
+    },
+    "notify_disabled": {
+        "it": "🔕 Notifiche disattivate.",
+        "en": "🔕 Notifications disabled.",
+    },
 
     # Users / admin
     "no_users": {
@@ -146,6 +214,28 @@ MESSAGES: Dict[str, Dict[str, str]] = {
         "it": "Utenti:",
         "en": "Users:",
     },
+    "users_page": {
+        "it": "(pagina {page}/{pages}, {total} utenti)",
+        "en": "(page {page}/{pages}, {total} users)",
+    },
+    "search_users_intro": {
+        "it": (
+            "Invia il nome (o una sua parte) o il chat_id da cercare.\n"
+            "Puoi inviare /cancel per terminare la ricerca."
+        ),
+        "en": (
+            "Send a name (or part of one) or a chat_id to search for.\n"
+            "You can send /cancel to stop searching."
+        ),
+    },
+    "search_results": {
+        "it": "Utenti trovati per \"{query}\":",
+        "en": "Users matching \"{query}\":",
+    },
+    "search_no_results": {
+        "it": "Nessun utente trovato per \"{query}\".",
+        "en": "No users match \"{query}\".",
+    },
     "choose_user_to_edit": {
         "it": "Scegli un utente da modificare:",
         "en": "Choose a user to edit:",
@@ -189,6 +279,102 @@ MESSAGES: Dict[str, Dict[str, str]] = {
         "en": "User {uid} saved with name \"{name}\".",
     },
 
+    # Access windows (admin)
+    "schedules_header": {
+        "it": "🕒 Fasce di accesso di {name} [{uid}]:",
+        "en": "🕒 Access windows of {name} [{uid}]:",
+    },
+    "schedules_none": {
+        "it": "Nessuna fascia: valgono solo i permessi fissi.",
+        "en": "No windows: only the fixed permissions apply.",
+    },
+    "schedule_add_intro": {
+        "it": (
+            "Nuova fascia di accesso. Invia:\n"
+            "<permessi> <giorni> <HH:MM-HH:MM> [dal..al]\n"
+            "Esempi:\n"
+            "open,status mon-fri 08:00-12:00\n"
+            "open sat 22:00-02:00\n"
+            "open * * 2026-07-01..2026-07-15\n"
+            "(* = tutti i giorni / tutto il giorno, orari locali)\n"
+            "\n"
+            "Puoi inviare /cancel per annullare."
+        ),
+        "en": (
+            "New access window. Send:\n"
+            "<permissions> <days> <HH:MM-HH:MM> [from..until]\n"
+            "Examples:\n"
+            "open,status mon-fri 08:00-12:00\n"
+            "open sat 22:00-02:00\n"
+            "open * * 2026-07-01..2026-07-15\n"
+            "(* = every day / the whole day, local time)\n"
+            "\n"
+            "You can send /cancel to abort."
+        ),
+    },
+    "schedule_invalid": {
+        "it": "Fascia non valida: {error}",
+        "en": "Invalid window: {error}",
+    },
+
+    # Audit history (admin)
+    "history_title": {
+        "it": "🕘 Ultimi eventi (UTC), pagina {page}/{pages}:",
+        "en": "🕘 Latest events (UTC), page {page}/{pages}:",
+    },
+    "history_title_user": {
+        "it": "🕘 Eventi di {who} (UTC), pagina {page}/{pages}:",
+        "en": "🕘 Events of {who} (UTC), page {page}/{pages}:",
+    },
+    "history_empty": {
+        "it": "Nessun evento registrato.",
+        "en": "No events recorded.",
+    },
+    "history_usage": {
+        "it": "Uso: /history [chat_id]",
+        "en": "Usage: /history [chat_id]",
+    },
+
+    # Bulk import/export (admin)
+    "export_done": {
+        "it": "{count} utenti esportati.",
+        "en": "{count} users exported.",
+    },
+    "import_intro": {
+        "it": (
+            "Invia ora un file .csv o .jsonl di utenti (come quello di /export).\n"
+            "Colonne: chat_id, name, allowed, lang, notify, schedules.\n"
+            "Gli utenti esistenti vengono aggiornati; se una riga non è valida "
+            "non viene importato nulla.\n"
+            "\n"
+            "Puoi inviare /cancel per annullare."
+        ),
+        "en": (
+            "Now send a .csv or .jsonl users file (like the one from /export).\n"
+            "Columns: chat_id, name, allowed, lang, notify, schedules.\n"
+            "Existing users are updated; if any row is invalid nothing "
+            "is imported.\n"
+            "\n"
+            "You can send /cancel to abort."
+        ),
+    },
+    "import_bad_file": {
+        "it": "File non valido: invia un file .csv o .jsonl in UTF-8.",
+        "en": "Invalid file: send a UTF-8 .csv or .jsonl file.",
+    },
+    "import_too_big": {
+        "it": "File troppo grande (massimo {max_kb} KB).",
+        "en": "File too large (at most {max_kb} KB).",
+    },
+    "import_done": {
+        "it": "✅ Importate {rows} righe: {added} aggiunti, {updated} aggiornati, {deleted} eliminati.",
+        "en": "✅ Imported {rows} rows: {added} added, {updated} updated, {deleted} deleted.",
+    },
+    "import_failed": {
+        "it": "❌ {errors} righe non valide su {rows}: nessun utente importato.",
+        "en": "❌ {errors} of {rows} rows are invalid: no users imported.",
+    },
+
     # Cancel operation
     "operation_cancelled": {
         "it": "Operazione annullata. Sei tornato al menu principale.",
@@ -246,10 +432,22 @@ BUTTONS = {
         "it": "📊 Stato",
         "en": "📊 Status",
     },
+    "status_all": {
+        "it": "📊 Tutte",
+        "en": "📊 All locks",
+    },
     "id": {
         "it": "🆔 ID",
         "en": "🆔 ID",
     },
+    "notify_on": {
+        "it": "🔔 Notifiche: attive",
+        "en": "🔔 Notifications: on",
+    },
+    "notify_off": {
+        "it": "🔕 Notifiche: disattive",
+        "en": "🔕 Notifications: off",
+    },
     "add_user": {
         "it": "➕ Add user",
         "en": "➕ Add user",
@@ -258,6 +456,22 @@ BUTTONS = {
         "it": "📋 Lista utenti",
         "en": "📋 User list",
     },
+    "search_users": {
+        "it": "🔍 Cerca",
+        "en": "🔍 Search",
+    },
+    "page_prev": {
+        "it": "◀️ Precedenti",
+        "en": "◀️ Previous",
+    },
+    "page_next": {
+        "it": "Successivi ▶️",
+        "en": "Next ▶️",
+    },
+    "history": {
+        "it": "🕘 Storico",
+        "en": "🕘 History",
+    },
     "back": {
         "it": "⬅️ Indietro",
         "en": "⬅️ Back",
@@ -286,6 +500,14 @@ BUTTONS = {
         "it": "🗑 Elimina utente",
         "en": "🗑 Delete user",
     },
+    "schedules": {
+        "it": "🕒 Fasce di accesso",
+        "en": "🕒 Access windows",
+    },
+    "schedule_add": {
+        "it": "➕ Aggiungi fascia",
+        "en": "➕ Add window",
+    },
     "perm_back": {
         "it": "⬅️ Indietro",
         "en": "⬅️ Back",
@@ -1,20 +1,36 @@
 import logging
 
+from telegram import Update
 from telegram.ext import (
+    Application,
     ApplicationBuilder,
     CommandHandler,
     CallbackQueryHandler,
     MessageHandler,
+    TypeHandler,
     filters,
 )
 
+from audit import start_audit, stop_audit
 from config import load_config, get_config
-from users import load_users
+from users import flush_users, load_users, start_users_reload, stop_users_reload
+from nuki import start_bridge_client, close_bridge_client
+from bridge_callback import start_callback_receiver, stop_callback_receiver
+from watcher import start_watcher, stop_watcher
+from metrics import MetricsHTTPXRequest, start_metrics_server, stop_metrics_server
+from ratelimit import TelegramRateLimiter
+from update_processor import ChatOrderedUpdateProcessor
 from bot_handlers import (
+    attach_auth,
+    rate_limit,
     cmd_cancel,
     cmd_start,
     cmd_menu, 
     cmd_id,
+    cmd_history,
+    cmd_import,
+    cmd_export,
+    handle_document,
     on_button,
     unknown_command,
     handle_text,
@@ -27,18 +43,73 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+async def _post_init(app: Application) -> None:
+    # Audit log writer and /history index (AUDIT_FILE)
+    await start_audit()
+    # Optional local /metrics endpoint (METRICS_PORT)
+    await start_metrics_server()
+    # Open the pooled bridge connection once the event loop is running
+    await start_bridge_client()
+    # Optional push channel from the bridge (CALLBACK_URL)
+    await start_callback_receiver()
+    # Optional lock state notifications (WATCHER_ENABLED)
+    await start_watcher(app.bot)
+    # Pick up users file changes made by other processes
+    start_users_reload()
+
+
+async def _post_shutdown(app: Application) -> None:
+    await stop_watcher()
+    await stop_callback_receiver()
+    await close_bridge_client()
+    await stop_metrics_server()
+    stop_users_reload()
+    # Write user changes still waiting in the write-behind buffer
+    await flush_users()
+    await stop_audit()
+
+
 def main() -> None:
     # Load configuration and users
     load_config()
     cfg = get_config()
     load_users()
 
-    app = ApplicationBuilder().token(cfg.telegram_bot_token).build()
+    builder = (
+        ApplicationBuilder()
+        .token(cfg.telegram_bot_token)
+        .post_init(_post_init)
+        .post_shutdown(_post_shutdown)
+        # Chats are served concurrently, each chat's updates in order
+        .concurrent_updates(ChatOrderedUpdateProcessor(cfg.concurrent_updates))
+        # Outgoing messages under Telegram's flood limits, RetryAfter retried
+        .rate_limiter(
+            TelegramRateLimiter(
+                overall_rate=cfg.telegram_rate,
+                chat_rate=cfg.telegram_chat_rate,
+                chat_burst=cfg.telegram_chat_burst,
+                max_retries=cfg.telegram_max_retries,
+            )
+        )
+    )
+    if cfg.metrics_port:
+        # Same pool size ApplicationBuilder uses by default
+        builder = builder.request(MetricsHTTPXRequest(connection_pool_size=256))
+    app = builder.build()
+
+    # Resolve who is talking once per update, before any other handler
+    app.add_handler(TypeHandler(Update, attach_auth), group=-2)
+    # Then drop updates of chats over their RATE_LIMITS (one handler runs
+    # per group, hence a group of its own)
+    app.add_handler(TypeHandler(Update, rate_limit), group=-1)
 
     # Commands
     app.add_handler(CommandHandler("start", cmd_start))
     app.add_handler(CommandHandler("id", cmd_id))
     app.add_handler(CommandHandler("menu", cmd_menu))
+    app.add_handler(CommandHandler("history", cmd_history))
+    app.add_handler(CommandHandler("import", cmd_import))
+    app.add_handler(CommandHandler("export", cmd_export))
     app.add_handler(CommandHandler("cancel", cmd_cancel))  
     
     
@@ -48,6 +119,9 @@ def main() -> None:
     # Unknown commands
     app.add_handler(MessageHandler(filters.COMMAND, unknown_command))
 
+    # Uploaded users file after /import
+    app.add_handler(MessageHandler(filters.Document.ALL, handle_document))
+
     # Any text → custom handling (including admin add-user flow)
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
 
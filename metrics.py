@@ -0,0 +1,191 @@
+import asyncio
+import functools
+import logging
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from telegram.request import HTTPXRequest
+
+from config import get_config
+from http_server import HttpRequest, HttpResponse, start_http_server, text_response
+
+logger = logging.getLogger(__name__)
+
+# In-process Prometheus-style metrics, exposed on an optional local /metrics
+# endpoint (METRICS_PORT). Recording is a dict lookup plus a bisect on a
+# dozen bucket bounds, cheap enough to leave on in production.
+
+PREFIX = "nukibot_"
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.bounds = bounds
+        # One slot per bound plus +Inf; cumulated only when rendering
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+# name -> (type, help) of the metrics recorded by the bot
+_help: Dict[str, Tuple[str, str]] = {
+    "handler_seconds": ("histogram", "Time spent in Telegram update handlers."),
+    "bridge_request_seconds": ("histogram", "Latency of RaspiNukiBridge requests."),
+    "telegram_request_seconds": ("histogram", "Latency of Telegram Bot API requests."),
+    "bridge_errors_total": ("counter", "Failed or refused RaspiNukiBridge requests."),
+    "lock_state_cache_total": ("counter", "Lock state reads by cache outcome."),
+    "stranger_drops_total": ("counter", "Updates from unknown chats that were ignored."),
+    "unauthorized_total": ("counter", "Requests refused for missing permissions."),
+    "rate_limited_total": ("counter", "Requests refused by the per-chat rate limits."),
+    "telegram_throttle_seconds": ("histogram", "Time outgoing requests waited for the rate limiter."),
+    "telegram_retry_after_total": ("counter", "Bot API requests retried after a RetryAfter."),
+}
+_histograms: Dict[Tuple[str, LabelKey], Histogram] = {}
+_counters: Dict[Tuple[str, LabelKey], Counter] = {}
+_server: Optional[asyncio.AbstractServer] = None
+
+
+def histogram(name: str, **labels: str) -> Histogram:
+    """Get (or create) the histogram ``name`` for the given label values."""
+    key = (name, tuple(sorted(labels.items())))
+    hist = _histograms.get(key)
+    if hist is None:
+        _help.setdefault(name, ("histogram", ""))
+        hist = _histograms[key] = Histogram()
+    return hist
+
+
+def counter(name: str, **labels: str) -> Counter:
+    """Get (or create) the counter ``name`` for the given label values."""
+    key = (name, tuple(sorted(labels.items())))
+    ctr = _counters.get(key)
+    if ctr is None:
+        _help.setdefault(name, ("counter", ""))
+        ctr = _counters[key] = Counter()
+    return ctr
+
+
+def observe(name: str, seconds: float, **labels: str) -> None:
+    histogram(name, **labels).observe(seconds)
+
+
+def inc(name: str, amount: float = 1.0, **labels: str) -> None:
+    counter(name, **labels).inc(amount)
+
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+
+def timed(name: str, **labels: str) -> Callable[[F], F]:
+    """Decorator recording the duration of an async function in a histogram."""
+
+    def decorator(func: F) -> F:
+        hist = histogram(name, **labels)
+
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                hist.observe(time.perf_counter() - started)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+class MetricsHTTPXRequest(HTTPXRequest):
+    """Telegram request backend recording the latency of each Bot API method."""
+
+    async def do_request(self, url: str, *args: Any, **kwargs: Any) -> Tuple[int, bytes]:
+        method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, *args, **kwargs)
+        finally:
+            observe("telegram_request_seconds", time.perf_counter() - started, method=method)
+
+
+def _format_labels(labels: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ""
+    inner = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in items
+    )
+    return "{" + inner + "}"
+
+
+def render() -> str:
+    """Render all metrics in the Prometheus text exposition format."""
+    lines: List[str] = []
+    by_name: Dict[str, List[Tuple[LabelKey, Any]]] = {}
+    for (name, labels), metric in list(_histograms.items()) + list(_counters.items()):
+        by_name.setdefault(name, []).append((labels, metric))
+
+    for name in sorted(by_name):
+        kind, help_text = _help.get(name, ("untyped", ""))
+        full = PREFIX + name
+        if help_text:
+            lines.append(f"# HELP {full} {help_text}")
+        lines.append(f"# TYPE {full} {kind}")
+        for labels, metric in by_name[name]:
+            if isinstance(metric, Histogram):
+                cumulative = 0
+                for bound, count in zip(metric.bounds + (float("inf"),), metric.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{full}_bucket{_format_labels(labels, (('le', le),))} {cumulative}")
+                lines.append(f"{full}_sum{_format_labels(labels)} {metric.sum}")
+                lines.append(f"{full}_count{_format_labels(labels)} {metric.count}")
+            else:
+                lines.append(f"{full}{_format_labels(labels)} {metric.value}")
+    return "\n".join(lines) + "\n"
+
+
+async def _on_metrics(request: HttpRequest) -> HttpResponse:
+    return text_response(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+async def start_metrics_server() -> None:
+    """Serve /metrics on METRICS_HOST:METRICS_PORT (no-op if the port is 0)."""
+    global _server
+    cfg = get_config()
+    if not cfg.metrics_port or _server is not None:
+        return
+    _server = await start_http_server(
+        cfg.metrics_host, cfg.metrics_port, {("GET", "/metrics"): _on_metrics}
+    )
+    logger.info("Metrics available on http://%s:%s/metrics", cfg.metrics_host, cfg.metrics_port)
+
+
+async def stop_metrics_server() -> None:
+    global _server
+    if _server is not None:
+        _server.close()
+        await _server.wait_closed()
+        _server = None
@@ -1,60 +1,537 @@
+import asyncio
 import logging
+import time
 from datetime import datetime, timezone
-from typing import Any, Dict
+from typing import Any, AsyncIterator, Callable, Dict, FrozenSet, List, Optional, Tuple
 
-import requests
+import httpx
 
-from config import get_config
+import metrics
+from breaker import CircuitBreaker, LatencyTracker
+from config import LockConfig, get_config, get_lock
 from i18n import t
 
 logger = logging.getLogger(__name__)
 
+# Shared HTTP client for all bridge calls. A single long-lived client keeps a
+# small pool of keep-alive connections to each RaspiNukiBridge, so each tap
+# does not pay for a fresh TCP handshake. Started/closed with the Application
+# lifecycle (see :mod:`main`).
+_client: Optional[httpx.AsyncClient] = None
 
-def nuki_lock_action(action: int) -> Dict[str, Any]:
-    """Call the Nuki Bridge /lockAction endpoint.
+# "error_code" set on responses refused because the bridge circuit is open
+BRIDGE_OFFLINE = "bridge_offline"
+# "error_code" of a /lockAction that got no answer in time: the bridge only
+# answers once the motor has finished, so the action may well have happened
+BRIDGE_TIMEOUT = "bridge_timeout"
 
-    :param action: integer action code, see Nuki HTTP API documentation.
-    :return: JSON response as dict, or a dict with key "error" on failure.
+# One circuit breaker per bridge, one latency window per (bridge, endpoint)
+_breakers: Dict[str, CircuitBreaker] = {}
+_latency: Dict[Tuple[str, str], LatencyTracker] = {}
+
+# Lock state cache, keyed by lock key: (monotonic fetch time, state dict).
+_state_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+# In-flight /lockState requests, shared by concurrent callers (single-flight).
+_state_inflight: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+# Bumped on invalidation so a request started before a lock action cannot
+# repopulate the cache with pre-action data.
+_state_generation: Dict[str, int] = {}
+# Bridges whose callbacks are active (see :mod:`bridge_callback`): cached
+# states of their locks are kept current by push updates and stay valid
+# this long. Keyed by LockConfig.bridge.
+_push_ttl: Dict[str, float] = {}
+# Called with (lock key, state) whenever a fresh state enters the cache
+StateListener = Callable[[str, Dict[str, Any]], None]
+_state_listeners: List[StateListener] = []
+# Monotonic time of the last action accepted by the bridge, per lock key
+_last_action_at: Dict[str, float] = {}
+
+# Nuki "motor blocked" state: an action that will never complete
+STATE_MOTOR_BLOCKED = 254
+# Backoff bounds (seconds) when polling for the outcome of an action
+VERIFY_FIRST_DELAY = 0.5
+VERIFY_MAX_DELAY = 4.0
+
+
+class _ActionQueue:
+    """Per-lock command queue: one bridge action at a time.
+
+    ``pending`` holds actions that are queued but not yet sent, keyed by
+    action code, so identical requests collapse into a single bridge call.
+    """
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.pending: Dict[int, "asyncio.Future[Dict[str, Any]]"] = {}
+        self.depth = 0
+
+
+_action_queues: Dict[str, _ActionQueue] = {}
+
+
+async def start_bridge_client() -> None:
+    """Create the shared bridge HTTP client (idempotent)."""
+    global _client
+    if _client is not None:
+        return
+    _client = httpx.AsyncClient(
+        timeout=httpx.Timeout(get_config().bridge_timeout_max),
+        limits=httpx.Limits(
+            max_connections=8,
+            max_keepalive_connections=8,
+            keepalive_expiry=60.0,
+        ),
+    )
+    logger.info("Nuki bridge client started")
+
+
+async def close_bridge_client() -> None:
+    """Close the shared bridge HTTP client and its connection pool."""
+    global _client
+    if _client is None:
+        return
+    client, _client = _client, None
+    await client.aclose()
+    logger.info("Nuki bridge client closed")
+
+
+def _get_client() -> httpx.AsyncClient:
+    if _client is None:
+        raise RuntimeError(
+            "Bridge client not started. Call start_bridge_client() first."
+        )
+    return _client
+
+
+def _resolve_lock(lock: Optional[LockConfig]) -> LockConfig:
+    if lock is not None:
+        return lock
+    default = get_lock()
+    assert default is not None
+    return default
+
+
+async def _bridge_get(
+    lock: LockConfig, endpoint: str, params: Dict[str, Any], idempotent: bool = True
+) -> Dict[str, Any]:
+    """GET a bridge endpoint and decode its JSON body.
+
+    Calls go through the bridge's circuit breaker (refused immediately while
+    the bridge is considered offline) and use a timeout adapted to the p95
+    latency observed for this endpoint. Non-``idempotent`` calls
+    (/lockAction) wait up to BRIDGE_TIMEOUT_MAX instead, and their timeouts
+    do not count as bridge failures: a slow motor is not a bridge outage.
+
+    :return: JSON response as dict, or a dict with key "error" on failure
+        ("error_code" is BRIDGE_OFFLINE when the call was not attempted,
+        BRIDGE_TIMEOUT when a non-idempotent call timed out).
     """
     cfg = get_config()
-    url = f"http://{cfg.bridge_host}:{cfg.bridge_port}/lockAction"
-    params = {
-        "nukiId": cfg.nuki_id,
-        "deviceType": cfg.device_type,
-        "token": cfg.nuki_token,
-        "action": action,
-    }
+    breaker = _breakers.get(lock.bridge)
+    if breaker is None:
+        breaker = _breakers[lock.bridge] = CircuitBreaker(
+            lock.bridge, cfg.bridge_failure_threshold, cfg.bridge_reset_timeout
+        )
+    tracker = _latency.get((lock.bridge, endpoint))
+    if tracker is None:
+        tracker = _latency[(lock.bridge, endpoint)] = LatencyTracker(
+            cfg.bridge_timeout_min, cfg.bridge_timeout_max
+        )
+
+    if not breaker.allow():
+        logger.debug("Bridge %s offline, not calling /%s", lock.bridge, endpoint)
+        metrics.inc("bridge_errors_total", endpoint=endpoint, kind="offline")
+        return {"error": "bridge offline", "error_code": BRIDGE_OFFLINE}
 
+    url = f"http://{lock.bridge_host}:{lock.bridge_port}/{endpoint}"
+    timeout = tracker.timeout() if idempotent else cfg.bridge_timeout_max
+    started = time.monotonic()
+    try:
+        resp = await _get_client().get(url, params=params, timeout=timeout)
+    except Exception as exc:
+        elapsed = time.monotonic() - started
+        timed_out = not idempotent and isinstance(exc, httpx.TimeoutException)
+        if timed_out:
+            # Inconclusive: the next call becomes the half-open trial instead
+            breaker.release_trial()
+        else:
+            breaker.record_failure()
+        # A timeout still says something about latency: let it push the
+        # adaptive timeout up towards the maximum
+        tracker.observe(elapsed)
+        metrics.observe("bridge_request_seconds", elapsed, endpoint=endpoint)
+        metrics.inc("bridge_errors_total", endpoint=endpoint, kind="transport")
+        logger.error(
+            "Error calling Nuki /%s (%s, timeout %.1fs): %s",
+            endpoint,
+            lock.key,
+            timeout,
+            exc,
+        )
+        if timed_out:
+            return {"error": str(exc) or type(exc).__name__, "error_code": BRIDGE_TIMEOUT}
+        return {"error": str(exc) or type(exc).__name__}
+    except BaseException:
+        # Cancelled: a half-open breaker must not wait for this trial forever
+        breaker.release_trial()
+        raise
+
+    # The bridge answered: it is up, whatever the status code
+    elapsed = time.monotonic() - started
+    breaker.record_success()
+    tracker.observe(elapsed)
+    metrics.observe("bridge_request_seconds", elapsed, endpoint=endpoint)
     try:
-        resp = requests.get(url, params=params, timeout=10)
         resp.raise_for_status()
         data = resp.json()
-        logger.debug("Nuki /lockAction response: %s", data)
+        logger.debug("Nuki /%s response (%s): %s", endpoint, lock.key, data)
         return data
     except Exception as exc:
-        logger.error("Error calling Nuki /lockAction: %s", exc)
+        metrics.inc("bridge_errors_total", endpoint=endpoint, kind="http")
+        logger.error("Error calling Nuki /%s (%s): %s", endpoint, lock.key, exc)
         return {"error": str(exc)}
 
 
-def nuki_lock_state() -> Dict[str, Any]:
-    """Call the Nuki Bridge /lockState endpoint."""
-    cfg = get_config()
-    url = f"http://{cfg.bridge_host}:{cfg.bridge_port}/lockState"
+async def _send_lock_action(lock: LockConfig, action: int) -> Dict[str, Any]:
     params = {
-        "nukiId": cfg.nuki_id,
-        "deviceType": cfg.device_type,
-        "token": cfg.nuki_token,
+        "nukiId": lock.nuki_id,
+        "deviceType": lock.device_type,
+        "token": lock.nuki_token,
+        "action": action,
     }
+    data = await _bridge_get(lock, "lockAction", params, idempotent=False)
+    # After a timeout the bolt may have moved all the same: the watcher must
+    # not report it as done elsewhere, nor the cache serve the old state
+    if "error" not in data or data.get("error_code") == BRIDGE_TIMEOUT:
+        _last_action_at[lock.key] = time.monotonic()
+        invalidate_lock_state(lock.key)
+    return data
 
+
+async def _run_queued_action(
+    queue: _ActionQueue, lock: LockConfig, action: int, enqueued_at: float
+) -> Dict[str, Any]:
     try:
-        resp = requests.get(url, params=params, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        logger.debug("Nuki /lockState response: %s", data)
-        return data
-    except Exception as exc:
-        logger.error("Error calling Nuki /lockState: %s", exc)
-        return {"error": str(exc)}
+        async with queue.lock:
+            # From now on the action is in flight: a new identical request
+            # must be queued behind it, not merged into it.
+            if queue.pending.get(action) is asyncio.current_task():
+                del queue.pending[action]
+            logger.info(
+                "Nuki lockAction %s for %s started after %.2fs in queue",
+                action,
+                lock.key,
+                time.monotonic() - enqueued_at,
+            )
+            return await _send_lock_action(lock, action)
+    finally:
+        queue.depth -= 1
+
+
+async def nuki_lock_action(
+    action: int, lock: Optional[LockConfig] = None
+) -> Dict[str, Any]:
+    """Call the Nuki Bridge /lockAction endpoint.
+
+    Actions for the same lock go through a queue and are sent one at a time;
+    an action identical to one still waiting in the queue is not sent twice,
+    its callers all receive the same response. Any accepted action
+    invalidates the cached lock state.
+
+    :param action: integer action code, see Nuki HTTP API documentation.
+    :param lock: target lock, defaults to the first configured one.
+    :return: JSON response as dict, or a dict with key "error" on failure.
+    """
+    lock = _resolve_lock(lock)
+    queue = _action_queues.setdefault(lock.key, _ActionQueue())
+
+    fut = queue.pending.get(action)
+    if fut is not None:
+        logger.info(
+            "Nuki lockAction %s for %s already queued, sharing its result (depth=%d)",
+            action,
+            lock.key,
+            queue.depth,
+        )
+    else:
+        queue.depth += 1
+        fut = asyncio.ensure_future(
+            _run_queued_action(queue, lock, action, time.monotonic())
+        )
+        queue.pending[action] = fut
+        logger.info(
+            "Nuki lockAction %s for %s queued (depth=%d)",
+            action,
+            lock.key,
+            queue.depth,
+        )
+
+    return await asyncio.shield(fut)
+
+
+def invalidate_lock_state(lock_key: str) -> None:
+    """Drop the cached state for a lock and detach any in-flight read."""
+    _state_cache.pop(lock_key, None)
+    _state_inflight.pop(lock_key, None)
+    _state_generation[lock_key] = _state_generation.get(lock_key, 0) + 1
+
+
+async def _fetch_lock_state(lock: LockConfig) -> Dict[str, Any]:
+    params = {
+        "nukiId": lock.nuki_id,
+        "deviceType": lock.device_type,
+        "token": lock.nuki_token,
+    }
+    generation = _state_generation.get(lock.key, 0)
+    data = await _bridge_get(lock, "lockState", params)
+    if "error" not in data and _state_generation.get(lock.key, 0) == generation:
+        _state_cache[lock.key] = (time.monotonic(), data)
+        _notify_state_listeners(lock.key, data)
+    return data
+
+
+def nuki_lock_state_is_fresh(lock: Optional[LockConfig] = None) -> bool:
+    """True if nuki_lock_state_cached() would answer from the cache now."""
+    lock = _resolve_lock(lock)
+    cached = _state_cache.get(lock.key)
+    if cached is None:
+        return False
+    ttl = max(get_config().state_cache_ttl, _push_ttl.get(lock.bridge, 0.0))
+    return time.monotonic() - cached[0] <= ttl
+
+
+async def nuki_lock_state_cached(
+    lock: Optional[LockConfig] = None,
+    max_age: Optional[float] = None,
+) -> Tuple[Dict[str, Any], float]:
+    """Return the lock state and its age in seconds.
+
+    A cached answer younger than ``max_age`` (default: the configured TTL) is
+    returned without touching the bridge. Otherwise concurrent callers share a
+    single in-flight /lockState request.
+    """
+    lock = _resolve_lock(lock)
+    key = lock.key
+    if max_age is None:
+        ttl = max(get_config().state_cache_ttl, _push_ttl.get(lock.bridge, 0.0))
+    else:
+        ttl = max_age
+
+    cached = _state_cache.get(key)
+    if cached is not None:
+        age = time.monotonic() - cached[0]
+        if age <= ttl:
+            metrics.inc("lock_state_cache_total", result="hit")
+            return cached[1], age
+
+    fut = _state_inflight.get(key)
+    if fut is not None:
+        metrics.inc("lock_state_cache_total", result="coalesced")
+    else:
+        metrics.inc("lock_state_cache_total", result="miss")
+        fut = asyncio.ensure_future(_fetch_lock_state(lock))
+        _state_inflight[key] = fut
+
+        def _done(done: "asyncio.Future[Dict[str, Any]]") -> None:
+            if _state_inflight.get(key) is done:
+                del _state_inflight[key]
+
+        fut.add_done_callback(_done)
+
+    # Shield the shared request: one caller giving up must not cancel it
+    # for everyone else waiting on it.
+    data = await asyncio.shield(fut)
+    return data, 0.0
+
+
+def set_push_ttl(bridge: str, seconds: float) -> None:
+    """Let cached states of ``bridge``'s locks live ``seconds``: push updates
+    refresh them.
+
+    0 restores plain TTL caching for that bridge (no callback channel).
+    """
+    if seconds > 0:
+        _push_ttl[bridge] = seconds
+    else:
+        _push_ttl.pop(bridge, None)
+
+
+def store_lock_state(lock_key: str, data: Dict[str, Any]) -> None:
+    """Merge a pushed state update into the cache of ``lock_key``."""
+    cached = _state_cache.get(lock_key)
+    merged: Dict[str, Any] = dict(cached[1]) if cached else {}
+    merged.update(data)
+    # A read started before this update must not overwrite it
+    _state_generation[lock_key] = _state_generation.get(lock_key, 0) + 1
+    _state_cache[lock_key] = (time.monotonic(), merged)
+    _notify_state_listeners(lock_key, merged)
+
+
+def add_state_listener(listener: StateListener) -> None:
+    """Register a callback run on every fresh state (polled or pushed).
+
+    Listeners run synchronously on the event loop: keep them cheap.
+    """
+    _state_listeners.append(listener)
+
+
+def remove_state_listener(listener: StateListener) -> None:
+    if listener in _state_listeners:
+        _state_listeners.remove(listener)
+
+
+def _notify_state_listeners(lock_key: str, data: Dict[str, Any]) -> None:
+    for listener in list(_state_listeners):
+        try:
+            listener(lock_key, data)
+        except Exception:
+            logger.exception("Error in lock state listener %r", listener)
+
+
+def seconds_since_last_action(lock_key: str) -> Optional[float]:
+    """Seconds since the bot last sent an accepted action to this lock."""
+    at = _last_action_at.get(lock_key)
+    return None if at is None else time.monotonic() - at
+
+
+async def nuki_wait_for_state(
+    lock: LockConfig,
+    targets: FrozenSet[int],
+    timeout: float,
+    late_targets: FrozenSet[int] = frozenset(),
+    late_after: FrozenSet[int] = frozenset(),
+) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """Wait until ``lock`` reports one of the ``targets`` states.
+
+    ``late_targets`` only count once one of the ``late_after`` states was
+    seen: an unlatch ends "unlocked", which may also be the state the lock
+    was in before the action.
+
+    Pushed updates are picked up as soon as they arrive; without a callback
+    channel the bridge is polled with exponential backoff. Returns the last
+    state seen (None if none) and whether it reached a target or the
+    "motor blocked" state.
+    """
+    loop = asyncio.get_running_loop()
+    reached: "asyncio.Future[Dict[str, Any]]" = loop.create_future()
+    last: Optional[Dict[str, Any]] = None
+    moving = False
+
+    def _listener(lock_key: str, data: Dict[str, Any]) -> None:
+        nonlocal last, moving
+        if lock_key != lock.key:
+            return
+        last = data
+        state = data.get("state")
+        moving = moving or state in late_after
+        if reached.done():
+            return
+        if state in targets or state == STATE_MOTOR_BLOCKED or (moving and state in late_targets):
+            reached.set_result(data)
+
+    add_state_listener(_listener)
+    cached = _state_cache.get(lock.key)
+    if cached is not None:
+        # Accepting the action emptied the cache: anything there came after
+        _listener(lock.key, cached[1])
+    deadline = loop.time() + timeout
+    delay = VERIFY_FIRST_DELAY
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return last, False
+            # With push updates there is no need to poll until the very end
+            pushed = lock.bridge in _push_ttl
+            wait = remaining if pushed else min(delay, remaining)
+            try:
+                return await asyncio.wait_for(asyncio.shield(reached), wait), True
+            except asyncio.TimeoutError:
+                pass
+            if pushed:
+                # One last read in case a callback got lost
+                await nuki_lock_state_cached(lock, max_age=0)
+                return (reached.result(), True) if reached.done() else (last, False)
+            # Fresh reads reach the listener above
+            await nuki_lock_state_cached(lock, max_age=0)
+            if reached.done():
+                return reached.result(), True
+            delay = min(delay * 2, VERIFY_MAX_DELAY)
+    finally:
+        remove_state_listener(_listener)
+
+
+async def nuki_lock_state(lock: Optional[LockConfig] = None) -> Dict[str, Any]:
+    """Call the Nuki Bridge /lockState endpoint (through the state cache)."""
+    data, _age = await nuki_lock_state_cached(lock)
+    return data
+
+
+async def nuki_lock_state_all(
+    timeout: Optional[float] = None,
+) -> AsyncIterator[Tuple[LockConfig, Dict[str, Any], float]]:
+    """Read the state of every configured lock, yielding results as they arrive.
+
+    Bridges are queried concurrently; locks sharing a bridge are read one
+    after the other (the bridge relays them over a single BLE radio). Each
+    bridge gets ``timeout`` seconds (default: STATUS_ALL_TIMEOUT) for all its
+    locks; locks it did not answer for in time are yielded with an "error".
+
+    Yields ``(lock, state, age)`` tuples, like :func:`nuki_lock_state_cached`.
+    """
+    cfg = get_config()
+    if timeout is None:
+        timeout = cfg.status_all_timeout
+
+    by_bridge: Dict[str, List[LockConfig]] = {}
+    for lock in cfg.locks:
+        by_bridge.setdefault(lock.bridge, []).append(lock)
+
+    results: "asyncio.Queue[Tuple[LockConfig, Dict[str, Any], float]]" = asyncio.Queue()
+
+    async def _poll_bridge(locks: List[LockConfig]) -> None:
+        pending = list(locks)
+
+        async def _read_all() -> None:
+            while pending:
+                data, age = await nuki_lock_state_cached(pending[0])
+                results.put_nowait((pending.pop(0), data, age))
+
+        try:
+            await asyncio.wait_for(_read_all(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Bridge %s did not answer within %.1fs", locks[0].bridge, timeout
+            )
+            for lock in pending:
+                results.put_nowait((lock, {"error": f"timeout ({timeout:g}s)"}, 0.0))
+
+    tasks = [asyncio.ensure_future(_poll_bridge(locks)) for locks in by_bridge.values()]
+    try:
+        for _ in range(len(cfg.locks)):
+            yield await results.get()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def nuki_callback_list(lock: LockConfig) -> Dict[str, Any]:
+    """Call the bridge /callback/list endpoint."""
+    return await _bridge_get(lock, "callback/list", {"token": lock.nuki_token})
+
+
+async def nuki_callback_add(lock: LockConfig, url: str) -> Dict[str, Any]:
+    """Register ``url`` as a state change callback on the lock's bridge."""
+    return await _bridge_get(
+        lock, "callback/add", {"url": url, "token": lock.nuki_token}
+    )
+
+
+async def nuki_callback_remove(lock: LockConfig, callback_id: int) -> Dict[str, Any]:
+    """Remove a registered callback from the lock's bridge."""
+    return await _bridge_get(
+        lock, "callback/remove", {"id": callback_id, "token": lock.nuki_token}
+    )
 
 
 def summarize_state(data: Dict[str, Any], lang: str = "it") -> str:
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Coroutine, Dict, Hashable, List, Optional, Tuple, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Token buckets for the bot's own flood control:
+#   - InboundLimiter: how often each chat may use the bot, per kind of
+#     request (see RATE_LIMITS in config.py); extra taps are refused
+#   - TelegramRateLimiter: spreads outgoing messages under Telegram's limits
+#     (about 30 messages/s overall and 1/s per chat) and retries requests
+#     refused with RetryAfter
+
+# Buckets kept per limiter (least recently used chats are forgotten first)
+MAX_BUCKETS = 10000
+# Telegram methods that send or change messages (throttled outbound)
+MESSAGE_METHOD_PREFIXES = ("send", "edit", "copy", "forward")
+# Longer RetryAfter waits fail the request instead of holding the handler
+MAX_RETRY_AFTER = 60.0
+
+
+class TokenBucket:
+    """``capacity`` tokens, refilled at ``rate`` tokens per second."""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, rate: float) -> None:
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now: float) -> float:
+        """Take a token if there is one.
+
+        :return: 0 if taken, else the seconds until one is available.
+        """
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def reserve(self, now: float) -> float:
+        """Take a token, possibly in advance.
+
+        :return: the seconds to wait before using it (0 = right away).
+        Concurrent callers get increasing delays, in call order.
+        """
+        self._refill(now)
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+
+class _Buckets:
+    """LRU-bounded token buckets by key."""
+
+    def __init__(self, max_size: int = MAX_BUCKETS) -> None:
+        self._buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+        self._max_size = max_size
+
+    def get(self, key: Hashable, capacity: float, rate: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(capacity, rate)
+            if len(self._buckets) > self._max_size:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+
+class InboundLimiter:
+    """Per-chat request limits, by kind of request.
+
+    ``limits`` maps a kind (a permission name, or "default") to
+    (requests, seconds): bursts of up to ``requests``, refilled evenly over
+    ``seconds``. Kinds without an entry use "default"; no entry = unlimited.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[int, float]]) -> None:
+        self._limits = limits
+        self._buckets = _Buckets()
+        # (chat_id, kind) already told to slow down, until a request passes
+        self._warned: "OrderedDict[Tuple[int, str], None]" = OrderedDict()
+
+    def check(self, chat_id: int, kind: str) -> Tuple[float, bool]:
+        """Account a request of ``chat_id``.
+
+        :return: (0 if allowed, else seconds until it would be, whether the
+            chat should be told: only on the first refusal in a row).
+        """
+        if kind not in self._limits:
+            kind = "default"
+        limit = self._limits.get(kind)
+        if limit is None:
+            return 0.0, False
+        requests, seconds = limit
+        key = (chat_id, kind)
+        wait = self._buckets.get(key, requests, requests / seconds).try_take(time.monotonic())
+        if not wait:
+            self._warned.pop(key, None)
+            return 0.0, False
+        metrics.inc("rate_limited_total", kind=kind)
+        if key in self._warned:
+            return wait, False
+        self._warned[key] = None
+        if len(self._warned) > MAX_BUCKETS:
+            self._warned.popitem(last=False)
+        return wait, True
+
+
+class TelegramRateLimiter(BaseRateLimiter[None]):
+    """Outbound throttling for the Bot API, with RetryAfter handling.
+
+    Messages wait for a token of the global bucket (``overall_rate`` per
+    second) and of their chat's bucket (``chat_rate`` per second, bursts of
+    ``chat_burst``). A RetryAfter pauses that chat (or every request, for
+    requests without a chat) and the request is retried up to
+    ``max_retries`` times (if the wait is at most MAX_RETRY_AFTER) before
+    the error reaches the handler.
+    """
+
+    def __init__(
+        self,
+        overall_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: int = 3,
+        max_retries: int = 3,
+    ) -> None:
+        self._overall = TokenBucket(max(overall_rate, 1.0), overall_rate)
+        self._chats = _Buckets()
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._max_retries = max_retries
+        # Monotonic time until which requests must wait, per chat (None = all)
+        self._paused: Dict[Optional[Any], float] = {}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def _throttle(self, chat_id: Optional[Any], is_message: bool) -> None:
+        now = time.monotonic()
+        if self._paused:
+            # Forget pauses that are over
+            self._paused = {key: until for key, until in self._paused.items() if until > now}
+        wait = max(self._paused.get(None, 0.0), self._paused.get(chat_id, 0.0)) - now
+        if is_message and self._overall.rate > 0:
+            wait = max(wait, self._overall.reserve(now))
+            if chat_id is not None and self._chat_rate > 0:
+                bucket = self._chats.get(chat_id, self._chat_burst, self._chat_rate)
+                wait = max(wait, bucket.reserve(now))
+        if wait > 0:
+            metrics.observe("telegram_throttle_seconds", wait)
+            await asyncio.sleep(wait)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[None],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        chat_id = data.get("chat_id")
+        is_message = endpoint.startswith(MESSAGE_METHOD_PREFIXES)
+        for attempt in range(self._max_retries + 1):
+            await self._throttle(chat_id, is_message)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as exc:
+                delay = float(exc.retry_after)
+                if attempt >= self._max_retries or delay > MAX_RETRY_AFTER:
+                    raise
+                metrics.inc("telegram_retry_after_total")
+                logger.warning(
+                    "Telegram flood control on %s (chat %s): retrying in %.1fs",
+                    endpoint,
+                    chat_id,
+                    delay,
+                )
+                self._paused[chat_id] = time.monotonic() + delay
+        raise AssertionError("unreachable")
@@ -0,0 +1,231 @@
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Scheduled access windows: extra permissions a user only has on some
+# weekdays, between two times of day, optionally within a date range.
+# Times are the bot host's local time. A window ending before it starts
+# (22:00-06:00) runs past midnight and belongs to the day it starts on.
+#
+# Rules are stored with the user (see users.py, "schedules" key):
+#   {"allowed": ["open"], "days": ["mon", "tue"], "start": "08:00",
+#    "end": "12:00", "from": "2026-07-01", "until": "2026-07-15"}
+# "days" defaults to every day, "start"/"end" to the whole day and
+# "from"/"until" (inclusive dates) to no limit.
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+ALL_DAYS = (1 << len(WEEKDAYS)) - 1
+DAY_MINUTES = 24 * 60
+
+
+def _parse_time(raw: str) -> int:
+    """'HH:MM' → minutes since midnight (24:00 allowed as end of day)."""
+    hours, sep, minutes = raw.partition(":")
+    if not sep or not hours.isdigit() or not minutes.isdigit() or len(minutes) != 2:
+        raise ValueError(f"invalid time {raw!r}, expected HH:MM")
+    value = int(hours) * 60 + int(minutes)
+    if int(minutes) >= 60 or value > DAY_MINUTES:
+        raise ValueError(f"invalid time {raw!r}")
+    return value
+
+
+def _format_time(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _parse_days(raw: Iterable[str]) -> int:
+    """Weekday names and ranges ("mon", "mon-fri", "sat-sun") → bitmask."""
+    mask = 0
+    for part in raw:
+        first, _, last = part.strip().lower().partition("-")
+        if first not in WEEKDAYS or (last and last not in WEEKDAYS):
+            raise ValueError(f"invalid days {part!r}, expected e.g. mon-fri,sun")
+        start = WEEKDAYS.index(first)
+        end = WEEKDAYS.index(last) if last else start
+        for offset in range((end - start) % len(WEEKDAYS) + 1):
+            mask |= 1 << ((start + offset) % len(WEEKDAYS))
+    return mask
+
+
+def _format_days(mask: int) -> str:
+    """Bitmask → "mon-wed,fri" (runs of three or more days as ranges)."""
+    parts: List[str] = []
+    i = 0
+    while i < len(WEEKDAYS):
+        if not mask & (1 << i):
+            i += 1
+            continue
+        j = i
+        while j + 1 < len(WEEKDAYS) and mask & (1 << (j + 1)):
+            j += 1
+        if j - i >= 2:
+            parts.append(f"{WEEKDAYS[i]}-{WEEKDAYS[j]}")
+        else:
+            parts.extend(WEEKDAYS[i:j + 1])
+        i = j + 1
+    return ",".join(parts)
+
+
+def _parse_date(raw: Optional[str]) -> Optional[date]:
+    if not raw:
+        return None
+    try:
+        return date.fromisoformat(raw)
+    except ValueError:
+        raise ValueError(f"invalid date {raw!r}, expected YYYY-MM-DD") from None
+
+
+class ScheduleRule:
+    """One access window granting ``allowed`` permissions while it is open."""
+
+    __slots__ = ("allowed", "days", "start", "end", "date_from", "date_until")
+
+    def __init__(
+        self,
+        allowed: Tuple[str, ...],
+        days: int = ALL_DAYS,
+        start: int = 0,
+        end: int = DAY_MINUTES,
+        date_from: Optional[date] = None,
+        date_until: Optional[date] = None,
+    ) -> None:
+        if not allowed:
+            raise ValueError("a window needs at least one permission")
+        if not days:
+            raise ValueError("a window needs at least one weekday")
+        if start >= DAY_MINUTES:
+            raise ValueError("a window cannot start at 24:00")
+        if start == end:
+            raise ValueError("a window's start and end must differ")
+        if date_from and date_until and date_from > date_until:
+            raise ValueError("a window's date range ends before it starts")
+        self.allowed = allowed
+        self.days = days
+        self.start = start
+        self.end = end
+        self.date_from = date_from
+        self.date_until = date_until
+
+    @classmethod
+    def from_dict(cls, raw: Dict) -> "ScheduleRule":
+        """Build a rule from its stored form, raising ValueError if invalid."""
+        if not isinstance(raw, dict):
+            raise ValueError("a window must be an object")
+        allowed = raw.get("allowed") or []
+        days = raw.get("days")
+        if not isinstance(allowed, list) or not (days is None or isinstance(days, list)):
+            raise ValueError("invalid window")
+        return cls(
+            tuple(str(perm) for perm in allowed),
+            _parse_days(days) if days is not None else ALL_DAYS,
+            _parse_time(raw.get("start") or "00:00"),
+            _parse_time(raw.get("end") or "24:00"),
+            _parse_date(raw.get("from")),
+            _parse_date(raw.get("until")),
+        )
+
+    def to_dict(self) -> Dict:
+        """The stored form of this rule (defaults left out)."""
+        raw: Dict = {"allowed": list(self.allowed)}
+        if self.days != ALL_DAYS:
+            raw["days"] = [day for i, day in enumerate(WEEKDAYS) if self.days & (1 << i)]
+        if (self.start, self.end) != (0, DAY_MINUTES):
+            raw["start"] = _format_time(self.start)
+            raw["end"] = _format_time(self.end)
+        if self.date_from:
+            raw["from"] = self.date_from.isoformat()
+        if self.date_until:
+            raw["until"] = self.date_until.isoformat()
+        return raw
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, ScheduleRule) and all(
+            getattr(self, slot) == getattr(other, slot) for slot in self.__slots__
+        )
+
+    def __repr__(self) -> str:
+        return f"ScheduleRule({self.describe()!r})"
+
+    def describe(self) -> str:
+        """Render the rule in the syntax accepted by parse_rule()."""
+        days = "*" if self.days == ALL_DAYS else _format_days(self.days)
+        if (self.start, self.end) == (0, DAY_MINUTES):
+            hours = "*"
+        else:
+            hours = f"{_format_time(self.start)}-{_format_time(self.end)}"
+        text = f"{','.join(self.allowed)} {days} {hours}"
+        if self.date_from or self.date_until:
+            text += " {}..{}".format(
+                self.date_from.isoformat() if self.date_from else "",
+                self.date_until.isoformat() if self.date_until else "",
+            )
+        return text
+
+    def _covers(self, day: date) -> bool:
+        """True if a window starts on ``day``."""
+        if not self.days & (1 << day.weekday()):
+            return False
+        if self.date_from and day < self.date_from:
+            return False
+        return not (self.date_until and day > self.date_until)
+
+    def is_active(self, now: datetime) -> bool:
+        """True if ``now`` (local time) falls inside one of the windows."""
+        minute = now.hour * 60 + now.minute
+        today = now.date()
+        if self.start < self.end:
+            return self.start <= minute < self.end and self._covers(today)
+        # Past midnight: today's window from start, or yesterday's until end
+        if minute >= self.start and self._covers(today):
+            return True
+        return minute < self.end and self._covers(today - timedelta(days=1))
+
+    def next_change(self, now: datetime) -> Optional[datetime]:
+        """The first window start or end after ``now``, None if there is none."""
+        today = now.date()
+        if self.date_until and today > self.date_until + timedelta(days=1):
+            return None
+        if self.date_from and today < self.date_from:
+            return datetime.combine(self.date_from, time()) + timedelta(minutes=self.start)
+        # Every weekday comes up within a week; one more day covers a
+        # window past midnight
+        for offset in range(len(WEEKDAYS) + 2):
+            day = today + timedelta(days=offset)
+            midnight = datetime.combine(day, time())
+            for minutes in sorted((self.start, self.end)):
+                moment = midnight + timedelta(minutes=minutes)
+                if moment > now:
+                    return moment
+        return None
+
+
+def parse_rule(text: str) -> ScheduleRule:
+    """Parse the admin syntax ``<perms> <days> <HH:MM-HH:MM> [from..until]``.
+
+    ``*`` stands for every day / the whole day; either date may be left
+    out, e.g. ``open,status mon-fri 08:00-12:00 2026-07-01..``.
+    """
+    parts = text.split()
+    if len(parts) not in (3, 4):
+        raise ValueError("expected <permissions> <days> <HH:MM-HH:MM> [from..until]")
+    perms, days, hours = parts[:3]
+    start, end = 0, DAY_MINUTES
+    if hours != "*":
+        first, sep, last = hours.partition("-")
+        if not sep:
+            raise ValueError(f"invalid hours {hours!r}, expected HH:MM-HH:MM")
+        start, end = _parse_time(first), _parse_time(last)
+    date_from = date_until = None
+    if len(parts) == 4:
+        first, sep, last = parts[3].partition("..")
+        if not sep:
+            raise ValueError(f"invalid dates {parts[3]!r}, expected YYYY-MM-DD..YYYY-MM-DD")
+        date_from, date_until = _parse_date(first), _parse_date(last)
+    return ScheduleRule(
+        tuple(perm for perm in perms.lower().split(",") if perm),
+        ALL_DAYS if days == "*" else _parse_days(days.split(",")),
+        start,
+        end,
+        date_from,
+        date_until,
+    )
+
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import pytest
+
+# The bot modules live at the top level of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Read at import time by users.py / audit.py: keep tests away from real files
+_tmp = tempfile.mkdtemp(prefix="nukibot-tests-")
+os.environ["USERS_FILE"] = os.path.join(_tmp, "users.json")
+os.environ["AUDIT_FILE"] = ""
+
+import config  # noqa: E402
+import nuki  # noqa: E402
+import users  # noqa: E402
+from config import BotConfig, LockConfig  # noqa: E402
+from telegram.request import BaseRequest, RequestData  # noqa: E402
+
+TOKEN = "secret"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_lock(port: int, key: str = "main", nuki_id: int = 1) -> LockConfig:
+    return LockConfig(
+        key=key,
+        name=key,
+        bridge_host="127.0.0.1",
+        bridge_port=port,
+        nuki_token=TOKEN,
+        nuki_id=nuki_id,
+        device_type=0,
+    )
+
+
+async def wait_until(predicate: Callable[[], bool], timeout: float = 3.0) -> None:
+    """Poll ``predicate`` until it holds, failing the test after ``timeout``."""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def set_config(monkeypatch: pytest.MonkeyPatch) -> Callable[..., BotConfig]:
+    """Install a BotConfig for the test: set_config(locks=[...], **fields)."""
+
+    def _set(**fields: Any) -> BotConfig:
+        fields.setdefault("locks", [make_lock(1)])
+        cfg = BotConfig(telegram_bot_token="1:test", owners=[10], owner_ids=frozenset({10}), **fields)
+        monkeypatch.setattr(config, "_config", cfg)
+        return cfg
+
+    return _set
+
+
+@pytest.fixture(autouse=True)
+def fresh_nuki_state(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Start every test with empty bridge caches, breakers and queues."""
+    for name in (
+        "_breakers",
+        "_latency",
+        "_state_cache",
+        "_state_inflight",
+        "_state_generation",
+        "_last_action_at",
+        "_action_queues",
+    ):
+        monkeypatch.setattr(nuki, name, {})
+    monkeypatch.setattr(nuki, "_state_listeners", [])
+    monkeypatch.setattr(nuki, "_push_ttl", {})
+    monkeypatch.setattr(nuki, "_client", None)
+
+
+@pytest.fixture
+def fresh_users(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Start with no users, no pending writes and a store in a fresh directory."""
+    path = os.path.join(tempfile.mkdtemp(dir=_tmp), "users.json")
+    monkeypatch.setattr(users, "USERS_FILE", path)
+    for name in ("_users", "_scheduled_perms", "_schedule_due"):
+        monkeypatch.setattr(users, name, {})
+    for name in ("_sorted_index", "_search_index", "_schedule_heap", "_pending_records"):
+        monkeypatch.setattr(users, name, [])
+    monkeypatch.setattr(users, "_changed", set())
+    monkeypatch.setattr(users, "_rewrite_all", False)
+    monkeypatch.setattr(users, "_save_timer", None)
+    monkeypatch.setattr(users, "_save_failures", 0)
+    monkeypatch.setattr(users, "_save_lock", None)
+    monkeypatch.setattr(users, "_store", None)
+
+
+class RecordingRequest(BaseRequest):
+    """Telegram Bot API backend answering locally and recording the calls."""
+
+    def __init__(self) -> None:
+        self.calls: List[Tuple[str, Dict[str, Any]]] = []
+        self._message_id = 100
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    @property
+    def read_timeout(self) -> float:
+        return 5.0
+
+    async def do_request(
+        self, url: str, method: str, request_data: Any = None, **kwargs: Any
+    ) -> Tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if isinstance(request_data, RequestData) else {}
+        self.calls.append((endpoint, params))
+        if endpoint == "getMe":
+            result: Any = {"id": 1, "is_bot": True, "first_name": "bot", "username": "bot"}
+        elif endpoint in ("sendMessage", "editMessageText"):
+            self._message_id += 1
+            result = {
+                "message_id": params.get("message_id") or self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(params["chat_id"]), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    def texts(self) -> List[str]:
+        return [
+            params.get("text", "")
+            for endpoint, params in self.calls
+            if endpoint in ("sendMessage", "editMessageText")
+        ]
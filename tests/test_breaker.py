@@ -0,0 +1,121 @@
+import asyncio
+
+import breaker
+import nuki
+from breaker import CircuitBreaker
+from bridge_sim import FakeBridge, FaultProfile, SimulatedLock
+from conftest import TOKEN, make_lock, wait_until
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _open_breaker(monkeypatch) -> "tuple[CircuitBreaker, Clock]":
+    clock = Clock()
+    monkeypatch.setattr(breaker.time, "monotonic", clock)
+    cb = CircuitBreaker("bridge", failure_threshold=2, reset_timeout=30.0)
+    for _ in range(2):
+        assert cb.allow()
+        cb.record_failure()
+    assert cb.state == CircuitBreaker.OPEN
+    return cb, clock
+
+
+def test_open_half_open_closed(monkeypatch):
+    cb, clock = _open_breaker(monkeypatch)
+    assert not cb.allow()
+    clock.now += 30.0
+    # One trial at a time
+    assert cb.allow()
+    assert cb.state == CircuitBreaker.HALF_OPEN
+    assert not cb.allow()
+    cb.record_success()
+    assert cb.state == CircuitBreaker.CLOSED
+    assert cb.allow() and cb.allow()
+
+
+def test_failed_trial_reopens(monkeypatch):
+    cb, clock = _open_breaker(monkeypatch)
+    clock.now += 30.0
+    assert cb.allow()
+    cb.record_failure()
+    assert cb.state == CircuitBreaker.OPEN
+    assert not cb.allow()
+    clock.now += 29.0
+    assert not cb.allow()
+    clock.now += 1.0
+    assert cb.allow()
+
+
+def test_released_trial_lets_the_next_call_through(monkeypatch):
+    cb, clock = _open_breaker(monkeypatch)
+    clock.now += 30.0
+    assert cb.allow()
+    cb.release_trial()
+    assert cb.state == CircuitBreaker.HALF_OPEN
+    assert cb.allow()
+
+
+def test_cancelled_trial_request_releases_the_trial(set_config):
+    async def scenario() -> None:
+        bridge = FakeBridge(token=TOKEN, profile=FaultProfile(latency=10.0, distribution="fixed"))
+        port = await bridge.start()
+        lock = make_lock(port)
+        set_config(locks=[lock], bridge_reset_timeout=0.0)
+        await nuki.start_bridge_client()
+        try:
+            cb = nuki._breakers[lock.bridge] = CircuitBreaker(lock.bridge, 1, 0.0)
+            cb.record_failure()
+            assert cb.state == CircuitBreaker.OPEN
+            # The trial request hangs and is cancelled (as the callback
+            # fallback task is on shutdown)
+            task = asyncio.ensure_future(nuki.nuki_callback_list(lock))
+            await wait_until(lambda: bridge.requests["callback"] == 1)
+            assert not cb.allow()
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            assert cb.state == CircuitBreaker.HALF_OPEN
+            assert cb.allow()
+        finally:
+            await nuki.close_bridge_client()
+            await bridge.stop()
+
+    asyncio.run(scenario())
+
+
+def test_slow_lock_action_is_not_cut_short_or_counted_as_failure(set_config):
+    async def scenario() -> None:
+        bridge = FakeBridge(
+            token=TOKEN,
+            locks=[SimulatedLock(nuki_id=1, transition_time=0.05)],
+            endpoint_profiles={"lockAction": FaultProfile(latency=0.5, distribution="fixed")},
+        )
+        lock = make_lock(await bridge.start())
+        set_config(
+            locks=[lock],
+            bridge_failure_threshold=1,
+            bridge_timeout_min=0.2,
+            bridge_timeout_max=1.0,
+        )
+        await nuki.start_bridge_client()
+        try:
+            # Waits past the adaptive timeout (0.2s) up to the maximum
+            res = await nuki.nuki_lock_action(1, lock)
+            assert res["success"] is True
+
+            bridge.endpoint_profiles["lockAction"] = FaultProfile(latency=2.0, distribution="fixed")
+            res = await nuki.nuki_lock_action(2, lock)
+            assert res["error_code"] == nuki.BRIDGE_TIMEOUT
+            assert nuki._breakers[lock.bridge].state == CircuitBreaker.CLOSED
+            # The action may have happened: it is not "done elsewhere"
+            assert nuki.seconds_since_last_action(lock.key) < 0.5
+        finally:
+            await nuki.close_bridge_client()
+            await bridge.stop()
+
+    asyncio.run(scenario())
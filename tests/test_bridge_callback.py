@@ -0,0 +1,146 @@
+import asyncio
+from types import SimpleNamespace
+
+from telegram import Update
+from telegram.ext import ExtBot
+
+import bot_handlers
+import bridge_callback
+import nuki
+from bridge_sim import FakeBridge, SimulatedLock
+from conftest import TOKEN, RecordingRequest, free_port, make_lock, wait_until
+
+
+async def _start(set_config, stale_after: float = 60.0) -> FakeBridge:
+    bridge = FakeBridge(locks=[SimulatedLock(nuki_id=1)], token=TOKEN)
+    port = await bridge.start()
+    listen_port = free_port()
+    set_config(
+        locks=[make_lock(port)],
+        callback_url=f"http://127.0.0.1:{listen_port}",
+        callback_listen_host="127.0.0.1",
+        callback_listen_port=listen_port,
+        callback_secret="s3cret",
+        callback_stale_after=stale_after,
+    )
+    await nuki.start_bridge_client()
+    await bridge_callback.start_callback_receiver()
+    return bridge
+
+
+async def _stop(bridge: FakeBridge) -> None:
+    await bridge_callback.stop_callback_receiver()
+    await nuki.close_bridge_client()
+    await bridge.stop()
+
+
+def test_pushed_state_reaches_the_cache(set_config):
+    async def scenario() -> None:
+        bridge = await _start(set_config)
+        try:
+            assert bridge.callbacks == [bridge_callback._callback_url]
+            bridge.set_state(1, state=3, door_state=3)
+            await wait_until(lambda: nuki._state_cache.get("main", (0, {}))[1].get("state") == 3)
+            state = nuki._state_cache["main"][1]
+            # Callback field names are mapped to the /lockState ones
+            assert state["doorState"] == 3
+            assert nuki.nuki_lock_state_is_fresh()
+            assert bridge.requests["lockState"] == 0
+        finally:
+            await _stop(bridge)
+
+    asyncio.run(scenario())
+
+
+def test_cmd_status_answers_pushed_state_without_bridge_call(set_config):
+    async def scenario() -> None:
+        bridge = await _start(set_config)
+        request = RecordingRequest()
+        bot = ExtBot("1:test", request=request, get_updates_request=RecordingRequest())
+        await bot.initialize()
+        try:
+            bridge.set_state(1, state=1)
+            await wait_until(lambda: "main" in nuki._state_cache)
+            update = Update.de_json(
+                {
+                    "update_id": 1,
+                    "message": {
+                        "message_id": 1,
+                        "date": 0,
+                        "chat": {"id": 10, "type": "private"},
+                        "text": "/status",
+                    },
+                },
+                bot,
+            )
+            await bot_handlers.cmd_status(update, SimpleNamespace())
+            assert bridge.requests["lockState"] == 0
+            # One answer, no "Reading state..." message first
+            texts = request.texts()
+            assert len(texts) == 1 and "locked" in texts[0]
+        finally:
+            await bot.shutdown()
+            await _stop(bridge)
+
+    asyncio.run(scenario())
+
+
+def test_polling_resumes_when_callbacks_go_stale(set_config):
+    async def scenario() -> None:
+        bridge = await _start(set_config, stale_after=0.2)
+        try:
+            assert list(nuki._push_ttl.values()) == [0.2]
+            # The bridge restarts and forgets the callback; nothing is pushed
+            bridge.callbacks.clear()
+            await wait_until(lambda: bridge.requests["lockState"] >= 1)
+            await wait_until(lambda: bool(bridge.callbacks))
+            assert "main" in nuki._state_cache
+        finally:
+            await _stop(bridge)
+
+    asyncio.run(scenario())
+
+
+def test_only_the_quiet_bridge_is_polled(set_config):
+    async def scenario() -> None:
+        busy = FakeBridge(locks=[SimulatedLock(nuki_id=1)], token=TOKEN)
+        quiet = FakeBridge(locks=[SimulatedLock(nuki_id=2)], token=TOKEN)
+        busy_lock = make_lock(await busy.start(), key="front", nuki_id=1)
+        quiet_lock = make_lock(await quiet.start(), key="back", nuki_id=2)
+        listen_port = free_port()
+        set_config(
+            locks=[busy_lock, quiet_lock],
+            callback_url=f"http://127.0.0.1:{listen_port}",
+            callback_listen_host="127.0.0.1",
+            callback_listen_port=listen_port,
+            callback_secret="s3cret",
+            callback_stale_after=0.3,
+        )
+        await nuki.start_bridge_client()
+        await bridge_callback.start_callback_receiver()
+
+        async def keep_pushing() -> None:
+            state = 1
+            while True:
+                state = 4 - state
+                busy.set_state(1, state=state)
+                await asyncio.sleep(0.05)
+
+        pusher = asyncio.ensure_future(keep_pushing())
+        try:
+            assert nuki._push_ttl == {busy_lock.bridge: 0.3, quiet_lock.bridge: 0.3}
+            # The second bridge restarts and forgets the callback
+            quiet.callbacks.clear()
+            await wait_until(lambda: quiet.requests["lockState"] >= 1)
+            await wait_until(lambda: bool(quiet.callbacks))
+            assert busy.requests["lockState"] == 0
+            # Listed and added once, at startup
+            assert busy.requests["callback"] == 2
+        finally:
+            pusher.cancel()
+            await bridge_callback.stop_callback_receiver()
+            await nuki.close_bridge_client()
+            await busy.stop()
+            await quiet.stop()
+
+    asyncio.run(scenario())
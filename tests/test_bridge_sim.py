@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+import nuki
+from bridge_sim import FakeBridge, FaultProfile, SimulatedLock
+from conftest import TOKEN, make_lock, wait_until
+
+
+async def _start(set_config, **bridge_args) -> "tuple[FakeBridge, object]":
+    bridge = FakeBridge(token=TOKEN, seed=1, **bridge_args)
+    port = await bridge.start()
+    lock = make_lock(port)
+    set_config(locks=[lock])
+    await nuki.start_bridge_client()
+    return bridge, lock
+
+
+async def _stop(bridge: FakeBridge) -> None:
+    await nuki.close_bridge_client()
+    await bridge.stop()
+
+
+def test_latency_is_paid_once_per_cache_ttl(set_config):
+    async def scenario() -> None:
+        bridge, lock = await _start(
+            set_config, profile=FaultProfile(latency=0.2, distribution="fixed")
+        )
+        try:
+            started = time.monotonic()
+            # Concurrent reads share one request
+            results = await asyncio.gather(*(nuki.nuki_lock_state_cached(lock) for _ in range(3)))
+            assert time.monotonic() - started >= 0.2
+            assert all(data["state"] == 1 for data, _age in results)
+            started = time.monotonic()
+            data, _age = await nuki.nuki_lock_state_cached(lock)
+            assert time.monotonic() - started < 0.1
+            assert bridge.requests["lockState"] == 1
+        finally:
+            await _stop(bridge)
+
+    asyncio.run(scenario())
+
+
+def test_bridge_errors_are_reported_not_raised(set_config):
+    async def scenario() -> None:
+        bridge, lock = await _start(set_config, profile=FaultProfile(error_rate=1.0))
+        try:
+            res = await nuki.nuki_lock_action(1, lock)
+            assert "error" in res
+            data, _age = await nuki.nuki_lock_state_cached(lock)
+            assert "error" in data
+            # Failed reads are not cached
+            assert "main" not in nuki._state_cache
+            assert bridge.locks[1].state == 1
+        finally:
+            await _stop(bridge)
+
+    asyncio.run(scenario())
+
+
+def test_ble_busy_then_action_completes(set_config):
+    async def scenario() -> None:
+        bridge, lock = await _start(
+            set_config,
+            locks=[SimulatedLock(nuki_id=1, transition_time=0.05)],
+            endpoint_profiles={"lockAction": FaultProfile(busy_rate=1.0)},
+        )
+        try:
+            res = await nuki.nuki_lock_action(1, lock)
+            assert "error" in res and "503" in res["error"]
+            assert bridge.locks[1].state == 1
+
+            bridge.endpoint_profiles.clear()
+            res = await nuki.nuki_lock_action(1, lock)
+            assert res["success"] is True
+            data, _age = await nuki.nuki_lock_state_cached(lock)
+            assert data["state"] in (2, 3)
+
+            await wait_until(lambda: bridge.locks[1].state == 3)
+            data, _age = await nuki.nuki_lock_state_cached(lock, max_age=0)
+            assert data["state"] == 3
+            # Fired transitions do not stay behind
+            await wait_until(lambda: not bridge._timers)
+        finally:
+            await _stop(bridge)
+
+    asyncio.run(scenario())
@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+import pytest
+from telegram.error import RetryAfter
+
+import ratelimit
+from ratelimit import InboundLimiter, TelegramRateLimiter, TokenBucket
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_reserve_hands_out_increasing_delays():
+    bucket = TokenBucket(capacity=2, rate=4.0)
+    now = bucket.updated
+    assert [bucket.reserve(now) for _ in range(5)] == [0.0, 0.0, 0.25, 0.5, 0.75]
+    # Tokens reserved in advance are paid back before new ones are free
+    assert bucket.reserve(now + 0.5) == pytest.approx(0.5)
+
+
+def test_inbound_limiter_warns_once_per_refusal_streak(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    limiter = InboundLimiter({"default": (1, 10.0)})
+    assert limiter.check(7, "open") == (0.0, False)
+    wait, warn = limiter.check(7, "open")
+    assert wait == pytest.approx(10.0) and warn
+    assert limiter.check(7, "open")[1] is False
+    # Other chats have their own bucket
+    assert limiter.check(8, "open") == (0.0, False)
+    clock.now += 10.0
+    assert limiter.check(7, "open") == (0.0, False)
+    assert limiter.check(7, "open")[1] is True
+
+
+def test_retry_after_is_retried_then_paused_chat_is_forgotten():
+    async def scenario() -> None:
+        limiter = TelegramRateLimiter(chat_rate=0, max_retries=2)
+        calls = []
+
+        async def callback() -> bool:
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise RetryAfter(0.1)
+            return True
+
+        data = {"chat_id": 5}
+        assert await limiter.process_request(callback, (), {}, "sendMessage", data, None) is True
+        assert len(calls) == 2 and calls[1] - calls[0] >= 0.1
+        # The pause is over: the next request drops it
+        await limiter.process_request(callback, (), {}, "sendMessage", data, None)
+        assert limiter._paused == {}
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("delay, max_retries, expected_calls", [(0.01, 2, 3), (120.0, 2, 1)])
+def test_retry_after_is_raised(delay, max_retries, expected_calls):
+    async def scenario() -> None:
+        limiter = TelegramRateLimiter(max_retries=max_retries)
+        calls = 0
+
+        async def callback() -> bool:
+            nonlocal calls
+            calls += 1
+            raise RetryAfter(delay)
+
+        with pytest.raises(RetryAfter):
+            await limiter.process_request(callback, (), {}, "sendMessage", {"chat_id": 5}, None)
+        assert calls == expected_calls
+
+    asyncio.run(scenario())
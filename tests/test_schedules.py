@@ -0,0 +1,102 @@
+from datetime import datetime
+
+import pytest
+
+import users
+from schedules import ScheduleRule, parse_rule
+
+def at(day: int, hour: int, minute: int = 0) -> datetime:
+    """October 2026: the 12th is a Monday."""
+    return datetime(2026, 10, day, hour, minute)
+
+
+def test_start_and_end_must_differ():
+    with pytest.raises(ValueError, match="must differ"):
+        parse_rule("open * 08:00-08:00")
+    with pytest.raises(ValueError, match="24:00"):
+        parse_rule("open * 24:00-06:00")
+    # Ending before the start is fine: the window runs past midnight
+    assert parse_rule("open * 22:00-06:00").start == 22 * 60
+
+
+def test_past_midnight_window_belongs_to_its_start_day():
+    rule = parse_rule("open mon 22:00-06:00")
+    assert not rule.is_active(at(12, 5, 59))  # Sunday night's window
+    assert not rule.is_active(at(12, 21, 59))
+    assert rule.is_active(at(12, 22))
+    assert rule.is_active(at(13, 5, 59))
+    assert not rule.is_active(at(13, 6))
+
+
+def test_date_range_is_inclusive():
+    rule = parse_rule("open * 08:00-12:00 2026-10-13..2026-10-14")
+    assert not rule.is_active(at(12, 9))
+    assert rule.is_active(at(13, 9))
+    assert rule.is_active(at(14, 11, 59))
+    assert not rule.is_active(at(15, 9))
+    assert rule.next_change(at(10, 9)) == at(13, 8)
+    assert rule.next_change(at(14, 12)) is not None
+    assert rule.next_change(at(16, 0)) is None
+
+
+def test_past_midnight_window_outlives_its_until_date():
+    rule = parse_rule("open * 22:00-06:00 ..2026-10-12")
+    assert rule.is_active(at(13, 5))
+    assert rule.next_change(at(13, 5)) == at(13, 6)
+    assert not rule.is_active(at(13, 23))
+
+
+class Clock(datetime):
+    current = at(12, 7)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current if tz is None else cls.current.astimezone(tz)
+
+
+@pytest.fixture
+def clock(fresh_users, monkeypatch):
+    monkeypatch.setattr(Clock, "current", at(12, 7))
+    monkeypatch.setattr(users, "datetime", Clock)
+    monkeypatch.setattr(users.time, "time", lambda: Clock.current.timestamp())
+    return Clock
+
+
+def test_heap_entries_are_invalidated_by_later_updates(clock):
+    users.add_or_update_user(1, "Anna")
+    assert users.add_schedule(1, ScheduleRule(("open",), start=8 * 60, end=12 * 60))
+    assert users.get_scheduled_permissions(1) == []
+    assert users._schedule_due[1] == at(12, 8).timestamp()
+
+    clock.current = at(12, 8)
+    assert users.get_scheduled_permissions(1) == ["open"]
+    assert users._schedule_due[1] == at(12, 12).timestamp()
+
+    # Removing the window leaves its heap entry behind, no longer due
+    clock.current = at(12, 9)
+    assert users.remove_schedule(1, 0)
+    assert users.get_scheduled_permissions(1) == []
+    assert 1 not in users._schedule_due
+    assert users._schedule_heap == [(at(12, 12).timestamp(), 1)]
+
+    # The stale entry is dropped without re-evaluating the user
+    clock.current = at(12, 12, 30)
+    users._refresh_schedules()
+    assert users._schedule_heap == [] and users._schedule_due == {}
+
+
+def test_earlier_boundary_supersedes_queued_one(clock):
+    users.add_or_update_user(1, "Anna")
+    users.add_schedule(1, ScheduleRule(("open",), start=8 * 60, end=12 * 60))
+    users.add_schedule(1, ScheduleRule(("lock",), start=7 * 60 + 30, end=9 * 60))
+    assert users._schedule_due[1] == at(12, 7, 30).timestamp()
+    assert len(users._schedule_heap) == 2
+
+    clock.current = at(12, 7, 45)
+    assert users.get_scheduled_permissions(1) == ["lock"]
+    clock.current = at(12, 8)
+    assert sorted(users.get_scheduled_permissions(1)) == ["lock", "open"]
+    clock.current = at(12, 9)
+    assert users.get_scheduled_permissions(1) == ["open"]
+    # Entries already due, live or superseded, were popped on the way
+    assert min(users._schedule_heap)[0] > clock.current.timestamp()
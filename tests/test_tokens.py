@@ -0,0 +1,56 @@
+import pytest
+
+import tokens
+from tokens import TokenStore
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(tokens.time, "monotonic", clock)
+    return clock
+
+
+def test_token_expires_at_its_ttl(clock):
+    store: TokenStore[str] = TokenStore()
+    kept = store.issue(1, "open", ttl=30.0)
+    expired = store.issue(1, "lock", ttl=30.0)
+    clock.now += 29.999
+    assert store.pop(1, kept) == "open"
+    clock.now += 0.001
+    assert store.pop(1, expired) is None
+    assert len(store) == 0
+
+
+def test_token_of_another_chat_is_refused(clock):
+    store: TokenStore[str] = TokenStore()
+    token = store.issue(1, "open", ttl=30.0)
+    assert store.pop(2, token) is None
+    # Still usable where it was issued
+    assert store.pop(1, token) == "open"
+
+
+def test_sixth_token_evicts_the_oldest(clock):
+    store: TokenStore[int] = TokenStore()
+    issued = [store.issue(1, n, ttl=30.0) for n in range(6)]
+    assert len(store) == 5
+    assert store.pop(1, issued[0]) is None
+    assert [store.pop(1, token) for token in issued[1:]] == [1, 2, 3, 4, 5]
+    # Other chats have their own quota
+    other = store.issue(2, 9, ttl=30.0)
+    assert store.pop(2, other) == 9
+
+
+def test_token_is_single_use(clock):
+    store: TokenStore[str] = TokenStore()
+    token = store.issue(1, "open", ttl=30.0)
+    assert store.pop(1, token) == "open"
+    assert store.pop(1, token) is None
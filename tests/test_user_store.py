@@ -0,0 +1,140 @@
+import json
+import os
+import sqlite3
+import threading
+
+import pytest
+
+from user_store import JsonUserStore, SqliteUserStore
+
+
+def _record(chat_id: int, user) -> dict:
+    return {
+        "ts": "2026-01-01T00:00:00Z",
+        "actor": 10,
+        "op": "update",
+        "chat_id": chat_id,
+        "user": user,
+    }
+
+
+@pytest.fixture
+def path(tmp_path) -> str:
+    return str(tmp_path / "users.json")
+
+
+def _edit_by_hand(path: str, users: dict) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"users": users}, f)
+    # Make sure it is newer than the journal whatever the mtime granularity
+    st = os.stat(path + ".journal")
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_journal_is_replayed_over_the_snapshot(path):
+    store = JsonUserStore(path, journal_max_bytes=1024)
+    assert store.save({1: {"name": "a"}, 2: {"name": "b"}}, replace_all=True)
+    assert store.save({2: None}, records=[_record(2, None)])
+    assert os.path.exists(store.journal_path)
+    assert JsonUserStore(path, 1024).load() == {"1": {"name": "a"}}
+
+
+def test_hand_edited_snapshot_wins_over_older_journal(path):
+    store = JsonUserStore(path, journal_max_bytes=1024)
+    store.save({1: {"name": "a"}, 2: {"name": "b"}}, replace_all=True)
+    store.save({2: {"name": "b2"}}, records=[_record(2, {"name": "b2"})])
+    # User 2 deleted by hand while the journal still has a change for it
+    _edit_by_hand(path, {"1": {"name": "a", "perms": []}})
+    assert JsonUserStore(path, 1024).load() == {"1": {"name": "a", "perms": []}}
+    assert not os.path.exists(store.journal_path)
+    with open(store.history_path, encoding="utf-8") as f:
+        assert [json.loads(line)["chat_id"] for line in f] == [2]
+
+
+def test_full_rewrite_retires_a_leftover_journal(path):
+    old = JsonUserStore(path, journal_max_bytes=1024)
+    old.save({1: {"name": "a"}}, records=[_record(1, {"name": "a"})])
+    store = JsonUserStore(path)
+    assert store.full_rewrite
+    assert store.load() == {"1": {"name": "a"}}
+    assert store.save({1: {"name": "a"}, 3: {"name": "c"}}, replace_all=True)
+    assert not os.path.exists(store.journal_path)
+    assert JsonUserStore(path).load() == {"1": {"name": "a"}, "3": {"name": "c"}}
+
+
+def test_compaction_keeps_records_appended_by_another_process(path):
+    bot = JsonUserStore(path, journal_max_bytes=1024)
+    bot.save({1: {"name": "a"}}, replace_all=True)
+    cli = JsonUserStore(path, journal_max_bytes=1024)
+    table = cli.load()
+    # The bot appends a user after the CLI read the files...
+    assert bot.save({5: {"name": "e"}}, records=[_record(5, {"name": "e"})])
+    # ...and the CLI writes its whole table back
+    table["2"] = {"name": "b"}
+    assert cli.save(
+        {int(k): v for k, v in table.items()}, replace_all=True, records=[_record(2, {"name": "b"})]
+    )
+    merged = JsonUserStore(path).load()
+    assert merged == {"1": {"name": "a"}, "2": {"name": "b"}, "5": {"name": "e"}}
+    # The bot's next reload notices the change
+    assert bot.signature() != bot.seen_signature
+
+
+def test_append_after_external_rewrite_is_merged(path):
+    bot = JsonUserStore(path, journal_max_bytes=1024)
+    bot.save({1: {"name": "a"}, 2: {"name": "b"}}, replace_all=True)
+    bot.save({2: {"name": "b2"}}, records=[_record(2, {"name": "b2"})])
+    # Another process removes user 1 before the bot's next append
+    cli = JsonUserStore(path)
+    cli.load()
+    cli.save({2: {"name": "b2"}}, replace_all=True)
+    assert bot.save({3: {"name": "c"}}, records=[_record(3, {"name": "c"})])
+    assert JsonUserStore(path, 1024).load() == {"2": {"name": "b2"}, "3": {"name": "c"}}
+
+
+def test_saves_wait_for_the_lock(path):
+    store = JsonUserStore(path)
+    other = JsonUserStore(path)
+    done = threading.Event()
+
+    def save() -> None:
+        other.save({1: {"name": "a"}}, replace_all=True)
+        done.set()
+
+    with store._locked():
+        thread = threading.Thread(target=save)
+        thread.start()
+        assert not done.wait(0.2)
+    thread.join(2.0)
+    assert done.is_set()
+
+
+def test_sqlite_history_is_pruned_past_the_limit(tmp_path):
+    store = SqliteUserStore(str(tmp_path / "users.db"), history_max_bytes=2000)
+    for n in range(40):
+        user = {"name": f"user {n}", "allowed": ["open"]}
+        assert store.save({n: user}, records=[_record(n, user)])
+    kept = [row[0] for row in store._conn.execute("SELECT chat_id FROM user_history ORDER BY id")]
+    # The newest records survive, within the limit
+    assert kept and kept == list(range(40 - len(kept), 40))
+    assert store._history_size <= 2000
+    assert len(store.load()) == 40
+
+
+def test_sqlite_upgrade_drops_unused_indexes(tmp_path):
+    path = str(tmp_path / "users.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        "CREATE TABLE users (chat_id INTEGER PRIMARY KEY, name TEXT NOT NULL DEFAULT '',"
+        " lang TEXT NOT NULL DEFAULT 'it', notify INTEGER NOT NULL DEFAULT 0);"
+        "CREATE INDEX users_name ON users (name COLLATE NOCASE, chat_id);"
+        "INSERT INTO users (chat_id, name) VALUES (1, 'a');"
+        "PRAGMA user_version=3;"
+    )
+    conn.close()
+    store = SqliteUserStore(path)
+    indexes = {
+        row[0] for row in store._conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+    }
+    assert "users_name" not in indexes
+    assert store.load()[1]["name"] == "a"
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+
+import users
+from conftest import wait_until
+from user_store import UserStore
+
+
+class FlakyStore(UserStore):
+    """In-memory store whose first ``failures`` saves fail."""
+
+    def __init__(self, failures: int) -> None:
+        super().__init__("memory")
+        self.failures = failures
+        self.saved: dict = {}
+        self.attempts = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def save(self, rows, replace_all=False, records=()) -> bool:
+        self.release.wait()
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            return False
+        if replace_all:
+            self.saved = {}
+        self.saved.update(rows)
+        return True
+
+
+def test_failed_save_is_retried_with_backoff(fresh_users, monkeypatch):
+    monkeypatch.setattr(users, "USERS_SAVE_DELAY", 0.02)
+    store = users._store = FlakyStore(failures=2)
+
+    async def scenario() -> None:
+        users.add_or_update_user(42, "Anna", ["lock"])
+        await wait_until(lambda: users._save_failures == 1)
+        # Nothing else changes: the retry is scheduled by the failure itself
+        assert store.attempts == 1 and users._save_timer is not None
+        await wait_until(lambda: 42 in store.saved)
+        assert store.attempts == 3
+        assert users._save_failures == 0
+        assert not users._changed and not users._pending_records
+        await wait_until(lambda: not users._flush_tasks)
+
+    asyncio.run(scenario())
+
+
+def test_flush_tasks_are_kept_until_done(fresh_users, monkeypatch):
+    monkeypatch.setattr(users, "USERS_SAVE_DELAY", 0.0)
+    store = users._store = FlakyStore(failures=0)
+
+    store.release.clear()
+
+    async def scenario() -> None:
+        users.add_or_update_user(42, "Anna")
+        await wait_until(lambda: users._save_timer is None)
+        # The write is running in a worker thread, only the set holds its task
+        assert len(users._flush_tasks) == 1
+        store.release.set()
+        await wait_until(lambda: not users._flush_tasks)
+        assert 42 in store.saved
+
+    asyncio.run(scenario())
+
+
+def test_search_falls_back_to_substrings(fresh_users):
+    for chat_id, name in ((1, "Anna Rossi"), (2, "Giovanna"), (3, "Nando"), (4, "Bob")):
+        users.add_or_update_user(chat_id, name)
+    assert [cid for cid, _user in users.search_users("nan")] == [3]
+    # No name or word starts with "nna": found inside the names
+    assert [cid for cid, _user in users.search_users("nna")] == [1, 2]
+    assert [cid for cid, _user in users.search_users("nna", limit=1)] == [1]
+    assert users.search_users("xyz") == []
+
+
+def test_flush_users_retries_then_reports_unsaved_users(fresh_users, monkeypatch, caplog):
+    monkeypatch.setattr(users, "USERS_SAVE_DELAY", 0.01)
+    store = users._store = FlakyStore(failures=users.FLUSH_ATTEMPTS)
+
+    async def scenario() -> None:
+        users.add_or_update_user(42, "Anna")
+        await users.flush_users()
+
+    asyncio.run(scenario())
+    assert store.attempts == users.FLUSH_ATTEMPTS
+    # Nothing left waiting on a loop that is gone
+    assert users._save_timer is None
+    errors = [r.getMessage() for r in caplog.records if r.levelname == "ERROR"]
+    assert errors and "[42]" in errors[-1]
+
+
+def test_flush_users_succeeds_on_a_later_attempt(fresh_users, monkeypatch):
+    monkeypatch.setattr(users, "USERS_SAVE_DELAY", 0.01)
+    store = users._store = FlakyStore(failures=1)
+
+    async def scenario() -> None:
+        users.add_or_update_user(42, "Anna")
+        await users.flush_users()
+
+    asyncio.run(scenario())
+    assert 42 in store.saved and not users._changed
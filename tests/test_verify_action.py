@@ -0,0 +1,78 @@
+import asyncio
+
+import nuki
+from bot_handlers import ACTION_LATE_TARGET_STATES, ACTION_TARGET_STATES
+from bridge_sim import FakeBridge, SimulatedLock
+from conftest import TOKEN, make_lock
+
+OPEN_LATE, OPEN_AFTER = ACTION_LATE_TARGET_STATES["open"]
+
+
+async def _start(set_config, sim_lock: SimulatedLock) -> "tuple[FakeBridge, object]":
+    bridge = FakeBridge(locks=[sim_lock], token=TOKEN)
+    port = await bridge.start()
+    lock = make_lock(port)
+    set_config(locks=[lock])
+    await nuki.start_bridge_client()
+    return bridge, lock
+
+
+async def _stop(bridge: FakeBridge) -> None:
+    await nuki.close_bridge_client()
+    await bridge.stop()
+
+
+def test_open_is_not_confirmed_by_the_starting_state(set_config):
+    async def scenario() -> None:
+        # Already unlocked, and the latch never moves
+        bridge, lock = await _start(set_config, SimulatedLock(nuki_id=1, state=3))
+        try:
+            data, reached = await nuki.nuki_wait_for_state(
+                lock, ACTION_TARGET_STATES["open"], 0.8, OPEN_LATE, OPEN_AFTER
+            )
+            assert not reached
+            assert data is not None and data["state"] == 3
+        finally:
+            await _stop(bridge)
+
+    asyncio.run(scenario())
+
+
+def test_open_is_confirmed_once_unlatching_was_seen(set_config):
+    async def scenario() -> None:
+        bridge, lock = await _start(
+            set_config, SimulatedLock(nuki_id=1, state=3, transition_time=0.7, door_open_time=0.1)
+        )
+        try:
+            res = await nuki.nuki_lock_action(3, lock)
+            assert res["success"] is True
+            data, reached = await nuki.nuki_wait_for_state(
+                lock, ACTION_TARGET_STATES["open"], 3.0, OPEN_LATE, OPEN_AFTER
+            )
+            assert reached
+            assert data is not None and data["state"] in (5, 3)
+        finally:
+            await _stop(bridge)
+
+    asyncio.run(scenario())
+
+
+def test_pushed_late_target_needs_the_lock_moving(set_config):
+    async def scenario() -> None:
+        set_config()
+        nuki.set_push_ttl(nuki._resolve_lock(None).bridge, 60.0)
+        waiter = asyncio.ensure_future(
+            nuki.nuki_wait_for_state(
+                nuki._resolve_lock(None), ACTION_TARGET_STATES["open"], 5.0, OPEN_LATE, OPEN_AFTER
+            )
+        )
+        await asyncio.sleep(0)
+        nuki.store_lock_state("main", {"state": 3})
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        nuki.store_lock_state("main", {"state": 7})
+        nuki.store_lock_state("main", {"state": 3})
+        data, reached = await asyncio.wait_for(waiter, 1.0)
+        assert reached and data["state"] == 3
+
+    asyncio.run(scenario())
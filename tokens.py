@@ -0,0 +1,75 @@
+import heapq
+import secrets
+import time
+from collections import OrderedDict
+from typing import Dict, Generic, List, Optional, Tuple, TypeVar
+
+# Single-use tokens carried by confirmation buttons ("Yes, open"), each
+# valid for a limited time and only in the chat it was issued to.
+#
+# Lookups are a dict access; expiry is a heap of (deadline, token) popped
+# lazily on each call, so abandoned confirmations do not pile up. Each chat
+# keeps at most max_per_chat tokens (the oldest goes first), which bounds
+# memory by the number of users.
+
+# Tokens kept per chat by default
+MAX_PER_CHAT = 5
+
+V = TypeVar("V")
+
+
+class TokenStore(Generic[V]):
+    """Expiring single-use tokens, each bound to a chat and a value."""
+
+    def __init__(self, max_per_chat: int = MAX_PER_CHAT) -> None:
+        self._max_per_chat = max_per_chat
+        # token -> (chat ID, value, monotonic deadline)
+        self._tokens: Dict[str, Tuple[int, V, float]] = {}
+        # (deadline, token); entries of tokens already used are skipped
+        self._expiry: List[Tuple[float, str]] = []
+        # chat ID -> its tokens, oldest first
+        self._by_chat: Dict[int, "OrderedDict[str, None]"] = {}
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def _discard(self, token: str) -> Optional[Tuple[int, V, float]]:
+        entry = self._tokens.pop(token, None)
+        if entry is None:
+            return None
+        chat_tokens = self._by_chat[entry[0]]
+        del chat_tokens[token]
+        if not chat_tokens:
+            del self._by_chat[entry[0]]
+        return entry
+
+    def _expire(self, now: float) -> None:
+        while self._expiry and self._expiry[0][0] <= now:
+            self._discard(heapq.heappop(self._expiry)[1])
+        # Used tokens leave their heap entry behind: rebuild if those dominate
+        if len(self._expiry) > 2 * len(self._tokens) + 64:
+            self._expiry = [(entry[2], token) for token, entry in self._tokens.items()]
+            heapq.heapify(self._expiry)
+
+    def issue(self, chat_id: int, value: V, ttl: float) -> str:
+        """Create a token for ``chat_id``, valid for ``ttl`` seconds."""
+        now = time.monotonic()
+        self._expire(now)
+        token = secrets.token_urlsafe(16)
+        deadline = now + ttl
+        self._tokens[token] = (chat_id, value, deadline)
+        heapq.heappush(self._expiry, (deadline, token))
+        chat_tokens = self._by_chat.setdefault(chat_id, OrderedDict())
+        chat_tokens[token] = None
+        while len(chat_tokens) > self._max_per_chat:
+            self._discard(next(iter(chat_tokens)))
+        return token
+
+    def pop(self, chat_id: int, token: str) -> Optional[V]:
+        """Use a token: its value, or None if unknown, expired or not ``chat_id``'s."""
+        self._expire(time.monotonic())
+        entry = self._tokens.get(token)
+        if entry is None or entry[0] != chat_id:
+            return None
+        self._discard(token)
+        return entry[1]
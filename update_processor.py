@@ -0,0 +1,76 @@
+import asyncio
+from typing import Any, Awaitable, Dict, List, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# Concurrent update processing that keeps each chat's updates in order.
+#
+# Updates of different chats run side by side (up to max_concurrent_updates
+# at once), so a slow bridge call only delays the chat that made it. Updates
+# of the same chat run one at a time in arrival order: conversation state in
+# user_data (add-user wizard, open confirmation tokens...) is never touched
+# by two handlers at once.
+
+# Updates admitted at once, running or waiting for an earlier update of their
+# chat; past this, new updates wait before being admitted
+MAX_QUEUED_UPDATES = 1000
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Run updates concurrently, but in order within each chat."""
+
+    __slots__ = ("_limit", "_running", "_chats")
+
+    def __init__(self, max_concurrent_updates: int) -> None:
+        # Read by the base class (and Application.concurrent_updates) through
+        # the max_concurrent_updates property
+        self._limit = max_concurrent_updates
+        # The base class semaphore is taken before do_process_update: it only
+        # bounds admitted updates, so updates waiting for their chat do not
+        # hold the slots other chats need to run
+        super().__init__(max(max_concurrent_updates, MAX_QUEUED_UPDATES))
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        # chat ID -> [lock, updates of the chat admitted]; dropped when idle
+        self._chats: Dict[int, List[Any]] = {}
+
+    @property
+    def max_concurrent_updates(self) -> int:
+        return self._limit
+
+    @staticmethod
+    def _chat_id(update: object) -> Optional[int]:
+        """Key ordering updates: the chat, or the user for inline messages."""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: "Awaitable[Any]") -> None:
+        chat_id = self._chat_id(update)
+        if chat_id is None:
+            async with self._running:
+                await coroutine
+            return
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            entry = self._chats[chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # asyncio.Lock wakes waiters first come, first served
+            async with entry[0]:
+                async with self._running:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[chat_id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
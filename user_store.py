@@ -0,0 +1,472 @@
+import json
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+logger = logging.getLogger(__name__)
+
+# Storage backends for the users table (see :mod:`users`). The in-memory
+# table in users.py answers every read; a backend only loads it at startup
+# and persists the rows that changed.
+#
+# The backend is picked from the USERS_FILE extension: ".db", ".sqlite" and
+# ".sqlite3" use SQLite, anything else the historical users.json format.
+#
+# Changes made by other processes are detected by comparing signature()
+# with seen_signature, the signature of the data last loaded or written here.
+
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+# Rows handed to UserStore.save: chat_id -> user dict, or None if deleted
+Rows = Dict[int, Optional[Dict]]
+# Journal records, one per mutation: {"ts", "actor", "op", "chat_id",
+# "user": resulting user dict or None if deleted, plus op details}
+Record = Dict[str, Any]
+
+
+class UserStore:
+    """Interface of a users storage backend."""
+
+    # True if save() always needs the whole table, not just changed rows
+    full_rewrite = True
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.seen_signature: Any = None
+
+    def signature(self) -> Any:
+        """Cheap fingerprint of the stored data, None if there is none."""
+        raise NotImplementedError
+
+    def load(self) -> Dict:
+        """Return the raw stored users: {chat_id: user dict}."""
+        raise NotImplementedError
+
+    def save(self, rows: Rows, replace_all: bool = False, records: Iterable[Record] = ()) -> bool:
+        """Persist ``rows``; with ``replace_all`` they are the whole table.
+
+        ``records`` describe the mutations that led to ``rows``.
+
+        :return: True on success (errors are logged, not raised).
+        """
+        raise NotImplementedError
+
+    def needs_compaction(self) -> bool:
+        """True if the next save should rewrite the whole table."""
+        return False
+
+    def close(self) -> None:
+        pass
+
+
+class JsonUserStore(UserStore):
+    """users.json snapshot plus an append-only journal of changes.
+
+    Each mutation is appended to ``<path>.journal`` as one JSON line holding
+    the resulting user, so a write costs the same whatever the table size.
+    Loading replays the journal over the snapshot. Once the journal passes
+    ``journal_max_bytes`` the next save compacts it: the snapshot is rewritten
+    (temp file + os.replace) and the records move to ``<path>.history``.
+    ``journal_max_bytes=0`` rewrites the whole file on every save instead.
+
+    A snapshot newer than the journal was written by someone else (e.g. edited
+    by hand) after the last append: the journal predates it, so it is retired
+    to the history instead of being replayed over the edit.
+
+    The bot and users_cli.py share the files: reads and writes hold an
+    advisory lock on ``<path>.lock``, and a save finding the files changed
+    since they were last read here merges its changes into what is there
+    instead of overwriting it (the next reload then picks up the result).
+    """
+
+    def __init__(self, path: str, journal_max_bytes: int = 0) -> None:
+        super().__init__(path)
+        self.journal_path = path + ".journal"
+        self.history_path = path + ".history"
+        self.lock_path = path + ".lock"
+        self.journal_max_bytes = journal_max_bytes
+        self.full_rewrite = journal_max_bytes <= 0
+        self._journal_size = 0
+
+    @staticmethod
+    def _stat(path: str) -> Any:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def signature(self) -> Any:
+        snapshot, journal = self._stat(self.path), self._stat(self.journal_path)
+        if snapshot is None and journal is None:
+            return None
+        return (snapshot, journal)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold the lock shared with the other processes using the files."""
+        with open(self.lock_path, "a+") as f:
+            if os.name == "nt":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if os.name == "nt":
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+                else:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def load(self) -> Dict:
+        with self._locked():
+            self._drop_stale_journal()
+            self.seen_signature = self.signature()
+            if self.seen_signature is None:
+                logger.warning("Users file %s not found, starting with empty user list.", self.path)
+                return {}
+            return self._read()
+
+    def _drop_stale_journal(self) -> None:
+        snapshot, journal = self._stat(self.path), self._stat(self.journal_path)
+        if snapshot is not None and journal is not None and snapshot[0] > journal[0]:
+            logger.warning(
+                "%s changed after %s was written, not replaying the journal",
+                self.path,
+                self.journal_path,
+            )
+            self._retire_journal()
+
+    def _read(self) -> Dict:
+        users: Dict = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f) or {}
+            users = dict(data.get("users") or {})
+        self._journal_size = 0
+        if os.path.exists(self.journal_path):
+            replayed = 0
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._journal_size += len(line.encode("utf-8"))
+                    try:
+                        record = json.loads(line)
+                        key = str(int(record["chat_id"]))
+                    except (ValueError, KeyError, TypeError):
+                        # Typically the tail of an interrupted append
+                        logger.warning("Skipping invalid record in %s: %r", self.journal_path, line)
+                        continue
+                    if record.get("user") is None:
+                        users.pop(key, None)
+                    else:
+                        users[key] = record["user"]
+                    replayed += 1
+            logger.info("Replayed %d change(s) from %s", replayed, self.journal_path)
+        return users
+
+    def save(self, rows: Rows, replace_all: bool = False, records: Iterable[Record] = ()) -> bool:
+        try:
+            with self._locked():
+                if self.signature() != self.seen_signature:
+                    self._merge(rows, replace_all, list(records))
+                    return True
+                if replace_all or self.full_rewrite:
+                    self._write_snapshot(rows, records)
+                else:
+                    self._append(records)
+                self.seen_signature = self.signature()
+            return True
+        except Exception as exc:
+            logger.error("Error saving users to %s: %s", self.path, exc)
+            return False
+
+    def _merge(self, rows: Rows, replace_all: bool, records: List[Record]) -> None:
+        """Write our changes over files another process changed meanwhile.
+
+        seen_signature is left alone, so the caller's next reload sees the
+        other process's changes.
+        """
+        self._drop_stale_journal()
+        users = self._read() if self.signature() is not None else {}
+        # The whole table would undo the other changes: apply only ours
+        if replace_all:
+            rows = {record["chat_id"]: record["user"] for record in records}
+        for chat_id, cfg in rows.items():
+            if cfg is None:
+                users.pop(str(chat_id), None)
+            else:
+                users[str(chat_id)] = cfg
+        logger.warning(
+            "%s was changed by another process, merging %d change(s) into it",
+            self.path,
+            len(rows),
+        )
+        self._write_snapshot(users, records)
+
+    def needs_compaction(self) -> bool:
+        return not self.full_rewrite and self._journal_size > self.journal_max_bytes
+
+    def _append(self, records: Iterable[Record]) -> None:
+        lines = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        if not lines:
+            return
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_size += len(lines.encode("utf-8"))
+
+    def _write_snapshot(self, rows: Rows, records: Iterable[Record] = ()) -> None:
+        data = {
+            "users": {str(chat_id): cfg for chat_id, cfg in rows.items() if cfg is not None}
+        }
+        tmp_file = self.path + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.path)
+        logger.info("Users saved to %s", self.path)
+        # The snapshot now includes every journaled change. Records are
+        # full rows, so a crash before the journal is gone only replays them
+        # again on top of the same values.
+        if not self.full_rewrite:
+            self._retire_journal(records)
+        elif os.path.exists(self.journal_path):
+            # Left over from when journaling was enabled
+            self._retire_journal()
+
+    def _retire_journal(self, records: Iterable[Record] = ()) -> None:
+        """Move the journal, plus ``records``, to the history file."""
+        history = ""
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as src:
+                history = src.read()
+        history += "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        if history:
+            with open(self.history_path, "a", encoding="utf-8") as dst:
+                dst.write(history)
+                dst.flush()
+                os.fsync(dst.fileno())
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+            logger.info("Moved %s to %s", self.journal_path, self.history_path)
+        self._journal_size = 0
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    chat_id INTEGER PRIMARY KEY,
+    name    TEXT NOT NULL DEFAULT '',
+    lang    TEXT NOT NULL DEFAULT 'it',
+    notify  INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS user_permissions (
+    chat_id    INTEGER NOT NULL REFERENCES users (chat_id) ON DELETE CASCADE,
+    permission TEXT NOT NULL,
+    PRIMARY KEY (chat_id, permission)
+);
+CREATE TABLE IF NOT EXISTS user_history (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts      TEXT NOT NULL,
+    actor   INTEGER,
+    op      TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    record  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS user_history_chat_id ON user_history (chat_id, id);
+CREATE TABLE IF NOT EXISTS user_schedules (
+    chat_id  INTEGER NOT NULL REFERENCES users (chat_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    rule     TEXT NOT NULL,
+    PRIMARY KEY (chat_id, position)
+);
+-- Lookups are served from the in-memory table (see users.py): secondary
+-- indexes would only slow writes down
+DROP INDEX IF EXISTS users_name;
+DROP INDEX IF EXISTS user_permissions_permission;
+"""
+SCHEMA_VERSION = 4
+
+
+class SqliteUserStore(UserStore):
+    """SQLite database with one row per user, granted permission and window.
+
+    Changes are written as single-row upserts/deletes in one transaction,
+    together with their records in the user_history table. Once the records
+    pass ``history_max_bytes`` the oldest are dropped, keeping the newest
+    half (0 = keep them all). A new database is seeded from the users.json
+    next to it, if there is one.
+    """
+
+    full_rewrite = False
+
+    def __init__(self, path: str, history_max_bytes: int = 0) -> None:
+        super().__init__(path)
+        self.history_max_bytes = history_max_bytes
+        self._history_size = 0
+        # Writes happen in a worker thread, one at a time (see users._flush)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < SCHEMA_VERSION:
+            with self._conn:
+                self._conn.executescript(_SCHEMA)
+                self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+            if version == 0:
+                self._migrate_json(os.path.splitext(path)[0] + ".json")
+        self._history_size = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(record)), 0) FROM user_history"
+        ).fetchone()[0]
+
+    def signature(self) -> Any:
+        # Changes only when another connection commits: our own writes
+        # never look like external changes
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _migrate_json(self, json_path: str) -> None:
+        if not os.path.exists(json_path):
+            return
+        try:
+            raw = JsonUserStore(json_path).load()
+        except Exception as exc:
+            logger.error("Cannot migrate users from %s: %s", json_path, exc)
+            return
+        rows: Rows = {}
+        for key, cfg in raw.items():
+            try:
+                rows[int(key)] = cfg if isinstance(cfg, dict) else None
+            except (TypeError, ValueError):
+                logger.warning("Ignoring invalid user key in %s: %r", json_path, key)
+        if self.save({k: v for k, v in rows.items() if v is not None}):
+            logger.info("Migrated %d users from %s to %s", len(rows), json_path, self.path)
+
+    def load(self) -> Dict:
+        users: Dict[int, Dict] = {}
+        # One read transaction: both tables from the same snapshot
+        self._conn.execute("BEGIN")
+        try:
+            self.seen_signature = self.signature()
+            for chat_id, name, lang, notify in self._conn.execute(
+                "SELECT chat_id, name, lang, notify FROM users"
+            ):
+                users[chat_id] = {"name": name, "allowed": [], "lang": lang, "notify": bool(notify)}
+            for chat_id, permission in self._conn.execute(
+                "SELECT chat_id, permission FROM user_permissions"
+            ):
+                if chat_id in users:
+                    users[chat_id]["allowed"].append(permission)
+            for chat_id, rule in self._conn.execute(
+                "SELECT chat_id, rule FROM user_schedules ORDER BY chat_id, position"
+            ):
+                if chat_id in users:
+                    users[chat_id].setdefault("schedules", []).append(json.loads(rule))
+        finally:
+            self._conn.execute("COMMIT")
+        return users
+
+    def save(self, rows: Rows, replace_all: bool = False, records: Iterable[Record] = ()) -> bool:
+        history = [
+            (r["ts"], r.get("actor"), r["op"], r["chat_id"], json.dumps(r, ensure_ascii=False))
+            for r in records
+        ]
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO user_history (ts, actor, op, chat_id, record) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    history,
+                )
+                if replace_all:
+                    keep = [chat_id for chat_id, cfg in rows.items() if cfg is not None]
+                    self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep (chat_id INTEGER)")
+                    self._conn.execute("DELETE FROM keep")
+                    self._conn.executemany(
+                        "INSERT INTO keep (chat_id) VALUES (?)", ((c,) for c in keep)
+                    )
+                    self._conn.execute(
+                        "DELETE FROM users WHERE chat_id NOT IN (SELECT chat_id FROM keep)"
+                    )
+                for chat_id, cfg in rows.items():
+                    if cfg is None:
+                        self._conn.execute("DELETE FROM users WHERE chat_id = ?", (chat_id,))
+                        continue
+                    self._conn.execute(
+                        "INSERT INTO users (chat_id, name, lang, notify) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (chat_id) DO UPDATE SET "
+                        "name = excluded.name, lang = excluded.lang, notify = excluded.notify",
+                        (
+                            chat_id,
+                            cfg.get("name") or "",
+                            cfg.get("lang") or "it",
+                            int(bool(cfg.get("notify"))),
+                        ),
+                    )
+                    self._conn.execute(
+                        "DELETE FROM user_permissions WHERE chat_id = ?", (chat_id,)
+                    )
+                    self._conn.executemany(
+                        "INSERT INTO user_permissions (chat_id, permission) VALUES (?, ?)",
+                        ((chat_id, perm) for perm in cfg.get("allowed") or []),
+                    )
+                    self._conn.execute(
+                        "DELETE FROM user_schedules WHERE chat_id = ?", (chat_id,)
+                    )
+                    self._conn.executemany(
+                        "INSERT INTO user_schedules (chat_id, position, rule) VALUES (?, ?, ?)",
+                        (
+                            (chat_id, position, json.dumps(rule, ensure_ascii=False))
+                            for position, rule in enumerate(cfg.get("schedules") or [])
+                        ),
+                    )
+            logger.debug("Saved %d user row(s) to %s", len(rows), self.path)
+        except sqlite3.Error as exc:
+            logger.error("Error saving users to %s: %s", self.path, exc)
+            return False
+        self._history_size += sum(len(row[4]) for row in history)
+        if self.history_max_bytes > 0 and self._history_size > self.history_max_bytes:
+            self._prune_history()
+        return True
+
+    def _prune_history(self) -> None:
+        """Drop the oldest history records, keeping about half the limit."""
+        try:
+            with self._conn:
+                self._conn.execute(
+                    "DELETE FROM user_history WHERE id <= ("
+                    " SELECT id FROM ("
+                    "  SELECT id, SUM(LENGTH(record)) OVER (ORDER BY id DESC) AS newer"
+                    "  FROM user_history"
+                    " ) WHERE newer > ? ORDER BY id DESC LIMIT 1"
+                    ")",
+                    (self.history_max_bytes // 2,),
+                )
+            self._history_size = self._conn.execute(
+                "SELECT COALESCE(SUM(LENGTH(record)), 0) FROM user_history"
+            ).fetchone()[0]
+        except sqlite3.Error as exc:
+            # The records are kept: nothing lost, tried again next save
+            logger.error("Error pruning the user history in %s: %s", self.path, exc)
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def open_user_store(path: str, journal_max_bytes: int = 0) -> UserStore:
+    """Return the backend for ``path``, chosen by its file extension.
+
+    ``journal_max_bytes`` also bounds the SQLite user_history table.
+    """
+    if path.lower().endswith(SQLITE_EXTENSIONS):
+        return SqliteUserStore(path, journal_max_bytes)
+    return JsonUserStore(path, journal_max_bytes)
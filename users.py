@@ -1,13 +1,34 @@
-import json
+import asyncio
+import heapq
 import logging
 import os
-from typing import Dict, List, Optional, Tuple, Iterable, Set
+import sys
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple, Union
 
+from audit import audit
 from config import get_config
+from schedules import ScheduleRule
+from user_store import Record, Rows, UserStore, open_user_store
 
 logger = logging.getLogger(__name__)
 
+# users.json, or a .db/.sqlite file for the SQLite backend (see user_store.py)
 USERS_FILE = os.getenv("USERS_FILE", "users.json")
+# Mutations within this many seconds are written to disk together
+USERS_SAVE_DELAY = float(os.getenv("USERS_SAVE_DELAY", "1.0"))
+# Longest wait before retrying a failed write
+SAVE_RETRY_MAX_DELAY = 60.0
+# Writes attempted by flush_users() before giving up (at shutdown)
+FLUSH_ATTEMPTS = 3
+# Seconds between checks for changes made to USERS_FILE by other processes
+# (0 = never reload)
+USERS_RELOAD_INTERVAL = float(os.getenv("USERS_RELOAD_INTERVAL", "5.0"))
+# users.json only: changes are appended to a journal, compacted into the
+# snapshot once it passes this size (0 = rewrite the whole file every time)
+USERS_JOURNAL_MAX_BYTES = int(os.getenv("USERS_JOURNAL_MAX_BYTES", str(1024 * 1024)))
 
 # Internal permission keys (English only):
 #   - "lock"     → lock the door
@@ -17,27 +38,120 @@ USERS_FILE = os.getenv("USERS_FILE", "users.json")
 #   - "status"   → read state
 ALL_PERMISSIONS: List[str] = ["lock", "unlock", "open", "lockngo", "status"]
 
-# In-memory store:
-# {
-#   chat_id (int): {
-#       "name": "Some Name",
-#       "allowed": ["lock", "status"],
-#       "lang": "it" | "en"
-#   },
-#   ...
-# }
-_users: Dict[int, Dict] = {}
-
-
-def _clean_permissions(perms: Iterable[str]) -> List[str]:
-    """Keep only known permission identifiers and deduplicate them."""
-    cleaned: Set[str] = set()
+# Permissions are kept as a bitmask: one bit per ALL_PERMISSIONS entry
+PERMISSION_BITS: Dict[str, int] = {perm: 1 << i for i, perm in enumerate(ALL_PERMISSIONS)}
+ALL_PERMISSIONS_MASK = (1 << len(ALL_PERMISSIONS)) - 1
+
+
+def _permission_mask(perms: Iterable[str]) -> int:
+    """Bitmask of the known permission identifiers in ``perms``."""
+    mask = 0
     for raw in perms:
-        if not isinstance(raw, str):
-            continue
-        if raw in ALL_PERMISSIONS:
-            cleaned.add(raw)
-    return list(cleaned)
+        if isinstance(raw, str):
+            mask |= PERMISSION_BITS.get(raw, 0)
+    return mask
+
+
+class User:
+    """A known chat: name, permission bitmask, language, notifications.
+
+    ``schedules`` are extra permissions granted only during access windows
+    (see schedules.py); ``perms`` is what the user always has.
+
+    Supports read-only dict-style access (``user["name"]``,
+    ``user.get("allowed")``) with the keys of the users.json format, so
+    older callers of get_user_cfg()/get_users_sorted() keep working.
+    """
+
+    __slots__ = ("name", "perms", "lang", "notify", "schedules")
+
+    def __init__(
+        self,
+        name: str = "",
+        perms: int = 0,
+        lang: str = "it",
+        notify: bool = False,
+        schedules: Tuple[ScheduleRule, ...] = (),
+    ) -> None:
+        self.name = name
+        self.perms = perms
+        # Few distinct values shared by every user
+        self.lang = sys.intern(lang)
+        self.notify = notify
+        self.schedules = schedules
+
+    def can(self, perm: str) -> bool:
+        return bool(self.perms & PERMISSION_BITS.get(perm, 0))
+
+    @property
+    def allowed(self) -> List[str]:
+        """Granted permission identifiers, in ALL_PERMISSIONS order."""
+        return [perm for perm, bit in PERMISSION_BITS.items() if self.perms & bit]
+
+    def to_dict(self) -> Dict:
+        """The users.json representation of this user."""
+        raw = {"name": self.name, "allowed": self.allowed, "lang": self.lang, "notify": self.notify}
+        if self.schedules:
+            raw["schedules"] = [rule.to_dict() for rule in self.schedules]
+        return raw
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self.__slots__ or key == "allowed":
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self.__slots__ or key == "allowed":
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __repr__(self) -> str:
+        return f"User({self.name!r}, allowed={self.allowed!r}, lang={self.lang!r}, notify={self.notify!r})"
+
+
+# In-memory store: chat_id (int) -> User
+_users: Dict[int, User] = {}
+
+# Kept sorted as users are added, renamed and deleted (see _index_add):
+#   _sorted_index: (lowercase name, chat_id) → admin list order
+#   _search_index: (token, chat_id) for the whole name and each of its
+#                  words → prefix search with a bisect
+_sorted_index: List[Tuple[str, int]] = []
+_search_index: List[Tuple[str, int]] = []
+
+# Scheduled permissions index, kept current by _refresh_schedules():
+#   _scheduled_perms: chat_id → permissions its open windows grant now
+#   _schedule_heap:   (next window boundary timestamp, chat_id); entries
+#                     not matching _schedule_due are stale and skipped
+# Checks only look at the top of the heap, a user's windows are evaluated
+# again when they change or one of their boundaries passes.
+_scheduled_perms: Dict[int, int] = {}
+_schedule_heap: List[Tuple[float, int]] = []
+_schedule_due: Dict[int, float] = {}
+
+# Called with the chat ID of a user that changed (None = possibly all of
+# them) after every mutation, import and reload
+UserListener = Callable[[Optional[int]], None]
+_user_listeners: List[UserListener] = []
+
+_store: Optional[UserStore] = None
+
+# Write-behind state: mutations record the changed chat IDs and schedule a
+# single delayed write, done in a worker thread (see _schedule_save /
+# flush_users). _rewrite_all asks for the whole table to be written.
+_changed: Set[int] = set()
+# Journal records of the mutations not written yet (see _record)
+_pending_records: List[Record] = []
+_rewrite_all = False
+_save_timer: Optional[asyncio.TimerHandle] = None
+# Running flush tasks, referenced until done so they are not garbage collected
+_flush_tasks: "Set[asyncio.Task[None]]" = set()
+# Consecutive failed writes; retries back off up to SAVE_RETRY_MAX_DELAY
+_save_failures = 0
+_save_lock: Optional[asyncio.Lock] = None
+_reload_task: "Optional[asyncio.Task[None]]" = None
+# Signature of a users file that failed validation, not retried until it changes
+_rejected_signature: Any = None
 
 
 def load_users() -> None:
@@ -46,26 +160,145 @@ def load_users() -> None:
     Missing file → empty dict.
     """
     global _users
-    if not os.path.exists(USERS_FILE):
-        logger.warning("Users file %s not found, starting with empty user list.", USERS_FILE)
-        _users = {}
-        return
-
     try:
-        with open(USERS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f) or {}
+        raw_users = _get_store().load()
+        _users = _parse_users(raw_users)
     except Exception as exc:
         logger.error("Error reading users file %s: %s", USERS_FILE, exc)
         _users = {}
+        _rebuild_index()
+        _rebuild_schedules()
+        _notify_user_listeners(None)
+        return
+    _rebuild_index()
+    _rebuild_schedules()
+    _notify_user_listeners(None)
+    logger.info("Loaded %d users from %s", len(_users), USERS_FILE)
+
+
+def add_user_listener(listener: UserListener) -> None:
+    """Register a callback run whenever a user is added, changed or deleted.
+
+    Listeners run synchronously: keep them cheap.
+    """
+    _user_listeners.append(listener)
+
+
+def remove_user_listener(listener: UserListener) -> None:
+    if listener in _user_listeners:
+        _user_listeners.remove(listener)
+
+
+def _notify_user_listeners(chat_id: Optional[int]) -> None:
+    for listener in list(_user_listeners):
+        try:
+            listener(chat_id)
+        except Exception:
+            logger.exception("Error in user listener %r", listener)
+
+
+def _index_tokens(name: str) -> Set[str]:
+    lowered = (name or "").lower()
+    return {lowered, *lowered.split()}
+
+
+def _index_add(chat_id: int, name: str) -> None:
+    insort(_sorted_index, ((name or "").lower(), chat_id))
+    for token in _index_tokens(name):
+        insort(_search_index, (token, chat_id))
+
+
+def _remove_sorted(index: List[Tuple[str, int]], entry: Tuple[str, int]) -> None:
+    pos = bisect_left(index, entry)
+    if pos < len(index) and index[pos] == entry:
+        del index[pos]
+
+
+def _index_remove(chat_id: int, name: str) -> None:
+    _remove_sorted(_sorted_index, ((name or "").lower(), chat_id))
+    for token in _index_tokens(name):
+        _remove_sorted(_search_index, (token, chat_id))
+
+
+def _rebuild_index() -> None:
+    _sorted_index[:] = sorted(((u.name or "").lower(), cid) for cid, u in _users.items())
+    _search_index[:] = sorted(
+        (token, cid) for cid, u in _users.items() for token in _index_tokens(u.name)
+    )
+
+
+def _update_schedule(chat_id: int, now: Optional[datetime] = None) -> None:
+    """Evaluate the windows of ``chat_id`` and queue its next boundary."""
+    user = _users.get(chat_id)
+    _schedule_due.pop(chat_id, None)
+    _scheduled_perms.pop(chat_id, None)
+    if user is None or not user.schedules:
         return
+    now = now or datetime.now()
+    mask = 0
+    next_change: Optional[datetime] = None
+    for rule in user.schedules:
+        if rule.is_active(now):
+            mask |= _permission_mask(rule.allowed)
+        change = rule.next_change(now)
+        if change is not None and (next_change is None or change < next_change):
+            next_change = change
+    if mask:
+        _scheduled_perms[chat_id] = mask
+    if next_change is not None:
+        due = next_change.timestamp()
+        _schedule_due[chat_id] = due
+        heapq.heappush(_schedule_heap, (due, chat_id))
+
+
+def _rebuild_schedules() -> None:
+    _scheduled_perms.clear()
+    _schedule_due.clear()
+    _schedule_heap.clear()
+    now = datetime.now()
+    for chat_id, user in _users.items():
+        if user.schedules:
+            _update_schedule(chat_id, now)
+
+
+def _refresh_schedules() -> None:
+    """Re-evaluate the users whose next window boundary has passed."""
+    if not _schedule_heap or _schedule_heap[0][0] > time.time():
+        return
+    now = datetime.now()
+    timestamp = now.timestamp()
+    while _schedule_heap and _schedule_heap[0][0] <= timestamp:
+        due, chat_id = heapq.heappop(_schedule_heap)
+        if _schedule_due.get(chat_id) == due:
+            _update_schedule(chat_id, now)
+
 
-    raw_users = data.get("users") or {}
-    users: Dict[int, Dict] = {}
+def _effective_perms(chat_id: int, user: User) -> int:
+    """Permissions of ``user`` right now: fixed plus open windows."""
+    _refresh_schedules()
+    return user.perms | _scheduled_perms.get(chat_id, 0)
+
+
+def _parse_schedules(chat_id: int, raw: Any) -> Tuple[ScheduleRule, ...]:
+    if not isinstance(raw, list):
+        return ()
+    rules = []
+    for raw_rule in raw:
+        try:
+            rules.append(ScheduleRule.from_dict(raw_rule))
+        except ValueError as exc:
+            logger.warning("Ignoring invalid access window for %s: %s", chat_id, exc)
+    return tuple(rules)
+
+
+def _parse_users(raw_users: Dict) -> Dict[int, User]:
+    """Validate raw stored users, skipping invalid entries."""
+    users: Dict[int, User] = {}
     for key, cfg in raw_users.items():
         try:
             chat_id = int(key)
         except (TypeError, ValueError):
-            logger.warning("Ignoring invalid user key in users.json: %r", key)
+            logger.warning("Ignoring invalid user key in %s: %r", USERS_FILE, key)
             continue
         if not isinstance(cfg, dict):
             logger.warning("Ignoring invalid user config for %s: not an object", key)
@@ -76,45 +309,289 @@ def load_users() -> None:
         if not isinstance(allowed_raw, list):
             allowed_raw = []
         lang = cfg.get("lang") or "it"
+        notify = bool(cfg.get("notify", False))
+        schedules = _parse_schedules(chat_id, cfg.get("schedules"))
 
-        allowed = _clean_permissions(allowed_raw)
+        users[chat_id] = User(name, _permission_mask(allowed_raw), lang, notify, schedules)
 
-        users[chat_id] = {
-            "name": name,
-            "allowed": allowed,
-            "lang": lang,
-        }
+    return users
 
-    _users = users
-    logger.info("Loaded %d users from %s", len(_users), USERS_FILE)
+
+def _get_store() -> UserStore:
+    global _store
+    if _store is None:
+        _store = open_user_store(USERS_FILE, USERS_JOURNAL_MAX_BYTES)
+    return _store
+
+
+def _rows(chat_ids: Optional[Iterable[int]] = None) -> Rows:
+    """Copy the given users (all if None) for the store; None = deleted."""
+    if chat_ids is None:
+        return {chat_id: user.to_dict() for chat_id, user in _users.items()}
+    return {
+        chat_id: _users[chat_id].to_dict() if chat_id in _users else None
+        for chat_id in chat_ids
+    }
 
 
 def save_users() -> None:
-    """Persist current users to USERS_FILE.
+    """Persist all current users to USERS_FILE right away (blocking).
 
     Data is always saved using the English internal permission identifiers.
     """
-    data = {
-        "users": {
-            str(chat_id): cfg for chat_id, cfg in _users.items()
+    global _rewrite_all
+    records = list(_pending_records)
+    _pending_records.clear()
+    _changed.clear()
+    _rewrite_all = False
+    if not _get_store().save(_rows(), replace_all=True, records=records):
+        _pending_records[:0] = records
+        _rewrite_all = True
+
+
+def _record(op: str, chat_id: int, actor: Optional[int], **details: Any) -> None:
+    """Journal a mutation of ``chat_id`` made by ``actor`` and schedule a save."""
+    _journal(op, chat_id, actor, **details)
+    audit("user", actor, op=op, target=chat_id, **details)
+    _notify_user_listeners(chat_id)
+    _schedule_save(chat_id)
+
+
+def _journal(op: str, chat_id: int, actor: Optional[int], **details: Any) -> None:
+    """Queue the journal record of a mutation, written with the next save.
+
+    The record carries the resulting user (None once deleted), so replaying
+    records in order rebuilds the table.
+    """
+    user = _users.get(chat_id)
+    _pending_records.append(
+        {
+            "ts": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "actor": actor,
+            "op": op,
+            "chat_id": chat_id,
+            **details,
+            "user": user.to_dict() if user is not None else None,
         }
-    }
-    tmp_file = USERS_FILE + ".tmp"
+    )
+
+
+def _schedule_save(chat_id: int) -> None:
+    """Mark a user as changed and schedule a write-behind flush.
+
+    Outside a running event loop (scripts, tests) the store is written at once.
+    """
+    _changed.add(chat_id)
+    _schedule_flush()
+
+
+def _schedule_flush(delay: Optional[float] = None) -> None:
+    global _save_timer
     try:
-        with open(tmp_file, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        os.replace(tmp_file, USERS_FILE)
-        logger.info("Users saved to %s", USERS_FILE)
-    except Exception as exc:
-        logger.error("Error saving users to %s: %s", USERS_FILE, exc)
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        save_users()
+        return
+    if _save_timer is None:
+        _save_timer = loop.call_later(
+            USERS_SAVE_DELAY if delay is None else delay, _start_flush
+        )
+
+
+def _start_flush() -> None:
+    task = asyncio.ensure_future(_flush())
+    _flush_tasks.add(task)
+    task.add_done_callback(_flush_done)
+
+
+def _flush_done(task: "asyncio.Task[None]") -> None:
+    _flush_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Writing users failed", exc_info=task.exception())
+
+
+async def _flush(reschedule: bool = True) -> bool:
+    """Write the pending changes; False if that failed.
+
+    With ``reschedule`` a failed write is retried later, with backoff.
+    """
+    global _rewrite_all, _save_timer, _save_lock, _save_failures
+    _save_timer = None
+    if _save_lock is None:
+        _save_lock = asyncio.Lock()
+    # One write at a time, always of the latest data
+    async with _save_lock:
+        if not _changed and not _rewrite_all:
+            return True
+        store = _get_store()
+        replace_all = _rewrite_all or store.full_rewrite or store.needs_compaction()
+        changed = set(_changed)
+        records = list(_pending_records)
+        _changed.clear()
+        _pending_records.clear()
+        _rewrite_all = False
+        rows = _rows(None if replace_all else changed)
+        ok = await asyncio.get_running_loop().run_in_executor(
+            None, store.save, rows, replace_all, records
+        )
+        if not ok:
+            _changed.update(changed)
+            _pending_records[:0] = records
+            _rewrite_all = _rewrite_all or replace_all
+            _save_failures += 1
+            if reschedule:
+                # Retry: nothing else may touch the users for a long time
+                _schedule_flush(_retry_delay())
+            return False
+        _save_failures = 0
+        if reschedule and store.needs_compaction():
+            # Compact in a follow-up write, off the path of this change
+            _rewrite_all = True
+            _schedule_flush()
+        return True
 
 
-def get_users() -> Dict[int, Dict]:
+def _retry_delay() -> float:
+    return min(USERS_SAVE_DELAY * 2**_save_failures, SAVE_RETRY_MAX_DELAY)
+
+
+async def flush_users() -> None:
+    """Write pending user changes now (call on shutdown).
+
+    A failed write is retried here, up to FLUSH_ATTEMPTS times: a retry left
+    to the event loop would never run once it stops.
+    """
+    global _save_timer
+    if _save_timer is not None:
+        _save_timer.cancel()
+        _save_timer = None
+    for attempt in range(FLUSH_ATTEMPTS):
+        if attempt:
+            await asyncio.sleep(_retry_delay())
+        if await _flush(reschedule=False):
+            return
+    logger.error(
+        "Could not save the changes of users %s to %s: they are lost",
+        sorted(_changed),
+        USERS_FILE,
+    )
+
+
+def _same_user(a: User, b: User) -> bool:
+    return (a.name, a.perms, a.lang, a.notify, a.schedules) == (
+        b.name,
+        b.perms,
+        b.lang,
+        b.notify,
+        b.schedules,
+    )
+
+
+async def reload_users_if_changed() -> bool:
+    """Reload USERS_FILE if another process changed it since we last saw it.
+
+    Only the entries that differ are replaced; users with local changes not
+    yet written keep them. Invalid data leaves the current table untouched.
+
+    :return: True if the in-memory table was updated.
+    """
+    global _users, _save_lock, _rejected_signature
+    store = _get_store()
+    loop = asyncio.get_running_loop()
+    if _save_lock is None:
+        _save_lock = asyncio.Lock()
+    # Never race our own writes: they update seen_signature when done
+    async with _save_lock:
+        signature = await loop.run_in_executor(None, store.signature)
+        if signature in (store.seen_signature, _rejected_signature):
+            return False
+        if signature is None:
+            logger.warning("Users file %s disappeared, keeping current users", USERS_FILE)
+            return False
+        try:
+            raw_users = await loop.run_in_executor(None, store.load)
+            fresh = _parse_users(raw_users)
+        except Exception as exc:
+            # Warn once per bad version of the file
+            _rejected_signature = signature
+            logger.warning("Not reloading users from %s: %s", USERS_FILE, exc)
+            return False
+
+    current = _users
+    merged: Dict[int, User] = {}
+    added = changed = 0
+    for chat_id, user in fresh.items():
+        old = current.get(chat_id)
+        if chat_id in _changed or (old is not None and _same_user(old, user)):
+            if old is not None:
+                merged[chat_id] = old
+            continue
+        merged[chat_id] = user
+        if old is None:
+            added += 1
+        else:
+            changed += 1
+    removed = 0
+    for chat_id, old in current.items():
+        if chat_id in merged:
+            continue
+        if chat_id in _changed:
+            merged[chat_id] = old
+        elif chat_id not in fresh:
+            removed += 1
+    for chat_id in current.keys() | merged.keys():
+        old, new = current.get(chat_id), merged.get(chat_id)
+        if old is new:
+            continue
+        if old is not None:
+            _index_remove(chat_id, old.name)
+        if new is not None:
+            _index_add(chat_id, new.name)
+    _users = merged
+    for chat_id in current.keys() | merged.keys():
+        if current.get(chat_id) is not merged.get(chat_id):
+            _update_schedule(chat_id)
+            _notify_user_listeners(chat_id)
+    logger.info(
+        "Reloaded users from %s: %d added, %d changed, %d removed",
+        USERS_FILE,
+        added,
+        changed,
+        removed,
+    )
+    return True
+
+
+async def _reload_loop(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await reload_users_if_changed()
+        except Exception:
+            logger.exception("Error reloading users from %s", USERS_FILE)
+
+
+def start_users_reload() -> None:
+    """Start watching USERS_FILE for external changes (USERS_RELOAD_INTERVAL)."""
+    global _reload_task
+    if USERS_RELOAD_INTERVAL <= 0 or _reload_task is not None:
+        return
+    _reload_task = asyncio.ensure_future(_reload_loop(USERS_RELOAD_INTERVAL))
+
+
+def stop_users_reload() -> None:
+    global _reload_task
+    if _reload_task is not None:
+        _reload_task.cancel()
+        _reload_task = None
+
+
+def get_users() -> Dict[int, User]:
     """Return the internal users mapping (copy)."""
     return dict(_users)
 
 
-def get_all_users() -> Dict[int, Dict]:
+def get_all_users() -> Dict[int, User]:
     """Backward-compatible alias used by older code.
 
     Returns the same as get_users().
@@ -122,15 +599,74 @@ def get_all_users() -> Dict[int, Dict]:
     return get_users()
 
 
-def get_users_sorted() -> List[Tuple[int, Dict]]:
-    """Return a list of (chat_id, cfg) sorted by name then ID."""
-    return sorted(
-        _users.items(),
-        key=lambda item: ((item[1].get("name") or "").lower(), item[0]),
-    )
+def get_users_sorted() -> List[Tuple[int, User]]:
+    """Return a list of (chat_id, user) sorted by name then ID."""
+    return [(chat_id, _users[chat_id]) for _name, chat_id in _sorted_index]
+
 
+def get_users_page(
+    page: int, page_size: int, exclude: FrozenSet[int] = frozenset()
+) -> Tuple[List[Tuple[int, User]], int]:
+    """Return one page of get_users_sorted(), skipping ``exclude``.
 
-def format_user_line(chat_id: int, cfg: Dict) -> str:
+    :return: (users on the page, total number of listed users).
+    """
+    # Positions of the excluded users in the index (few: the owners)
+    skipped = sorted(
+        bisect_left(_sorted_index, ((_users[cid].name or "").lower(), cid))
+        for cid in exclude
+        if cid in _users
+    )
+    total = len(_sorted_index) - len(skipped)
+    # Translate the first visible offset into an index position
+    pos = max(page, 0) * page_size
+    for skip in skipped:
+        if skip <= pos:
+            pos += 1
+    result: List[Tuple[int, User]] = []
+    while pos < len(_sorted_index) and len(result) < page_size:
+        chat_id = _sorted_index[pos][1]
+        if chat_id not in exclude:
+            result.append((chat_id, _users[chat_id]))
+        pos += 1
+    return result, total
+
+
+def search_users(query: str, limit: int = 20) -> List[Tuple[int, User]]:
+    """Users whose name, or a word of it, starts with ``query``.
+
+    When fewer than ``limit`` do, users with ``query`` anywhere in their name
+    are returned too ("nna" finds "Anna"). A numeric query also matches the
+    chat ID exactly. Results are in get_users_sorted() order, at most
+    ``limit`` of them.
+    """
+    query = query.strip().lower()
+    if not query:
+        return []
+    found: Set[int] = set()
+    if query.lstrip("-").isdigit() and int(query) in _users:
+        found.add(int(query))
+    pos = bisect_left(_search_index, (query, -(1 << 63)))
+    while pos < len(_search_index) and _search_index[pos][0].startswith(query):
+        found.add(_search_index[pos][1])
+        if len(found) > limit:
+            break
+        pos += 1
+    if len(found) < limit:
+        # Substring matches include the prefix ones: a scan in name order,
+        # only for queries that few names start with
+        scanned = 0
+        for name, cid in _sorted_index:
+            if query in name:
+                found.add(cid)
+                scanned += 1
+                if scanned == limit:
+                    break
+    matches = sorted(((_users[cid].name or "").lower(), cid) for cid in found)
+    return [(cid, _users[cid]) for _name, cid in matches[:limit]]
+
+
+def format_user_line(chat_id: int, cfg: Union[User, Dict]) -> str:
     """Helper to render a user line for admin lists."""
     name = cfg.get("name") or "(no name)"
     allowed = cfg.get("allowed") or []
@@ -148,8 +684,7 @@ def is_known(chat_id: int) -> bool:
 
 def is_admin(chat_id: int) -> bool:
     """Return True if the chat_id is in the owners list."""
-    cfg = get_config()
-    return chat_id in cfg.owners
+    return chat_id in get_config().owner_ids
 
 
 def can_do(chat_id: int, command: str) -> bool:
@@ -160,117 +695,278 @@ def can_do(chat_id: int, command: str) -> bool:
     """
     if is_admin(chat_id):
         return True
-    cfg = _users.get(chat_id)
-    if not cfg:
+    user = _users.get(chat_id)
+    if user is None:
         return False
-    allowed: Iterable[str] = cfg.get("allowed") or []
-    return command in allowed
+    return bool(_effective_perms(chat_id, user) & PERMISSION_BITS.get(command, 0))
+
+
+class AuthContext:
+    """What a chat may do, resolved once per incoming update.
+
+    A snapshot: later changes to the user store do not affect it, so a
+    handler sees one consistent view for the whole update.
+    """
 
+    __slots__ = ("chat_id", "is_admin", "is_known", "perms", "lang", "notify", "name")
+
+    def __init__(
+        self,
+        chat_id: int,
+        is_admin: bool,
+        is_known: bool,
+        perms: int,
+        lang: str,
+        notify: bool,
+        name: str,
+    ) -> None:
+        self.chat_id = chat_id
+        self.is_admin = is_admin
+        self.is_known = is_known
+        self.perms = perms
+        self.lang = lang
+        self.notify = notify
+        self.name = name
+
+    @property
+    def is_stranger(self) -> bool:
+        """Neither an admin nor a known user."""
+        return not (self.is_admin or self.is_known)
+
+    def can(self, perm: str) -> bool:
+        """Same rule as can_do(): admins can do anything."""
+        return self.is_admin or bool(self.perms & PERMISSION_BITS.get(perm, 0))
+
+    @property
+    def allowed(self) -> List[str]:
+        return [perm for perm, bit in PERMISSION_BITS.items() if self.perms & bit]
+
+
+def get_auth(chat_id: int) -> AuthContext:
+    """Build the AuthContext of ``chat_id`` from the current user store."""
+    user = _users.get(chat_id)
+    admin = is_admin(chat_id)
+    if user is None:
+        # Unknown users → fixed English
+        return AuthContext(chat_id, admin, False, 0, "en", False, "")
+    return AuthContext(
+        chat_id,
+        admin,
+        True,
+        _effective_perms(chat_id, user),
+        user.lang or "it",
+        user.notify,
+        user.name,
+    )
 
-def get_user_cfg(chat_id: int) -> Optional[Dict]:
-    """Return raw user config dict or None."""
+
+def get_user_cfg(chat_id: int) -> Optional[User]:
+    """Return the user record (dict-style readable) or None."""
     return _users.get(chat_id)
 
 
-def add_or_update_user(chat_id: int, name: str, allowed: Optional[List[str]] = None) -> None:
+def add_or_update_user(
+    chat_id: int,
+    name: str,
+    allowed: Optional[List[str]] = None,
+    actor: Optional[int] = None,
+) -> None:
     """Create or update a user with the given name and allowed permissions.
 
     The 'allowed' list must use the English permission identifiers.
+    ``actor`` (here and in the other mutations) is the chat ID of whoever
+    made the change, kept in the journal.
     """
-    if allowed is None:
-        allowed = []
-    allowed_clean = _clean_permissions(allowed)
-    cfg = _users.get(chat_id) or {}
-    cfg["name"] = name
-    cfg["allowed"] = allowed_clean
-    # Preserve existing lang if present, otherwise default to Italian
-    cfg.setdefault("lang", "it")
-    _users[chat_id] = cfg
-    save_users()
-
-
-def delete_user(chat_id: int) -> bool:
+    perms = _permission_mask(allowed or [])
+    user = _users.get(chat_id)
+    if user is None:
+        # New users default to Italian
+        _users[chat_id] = User(name, perms)
+        _index_add(chat_id, name)
+        _record("add", chat_id, actor)
+    else:
+        # Preserve existing lang and notifications
+        if user.name != name:
+            _index_remove(chat_id, user.name)
+            _index_add(chat_id, name)
+        user.name = name
+        user.perms = perms
+        _record("update", chat_id, actor)
+
+
+def delete_user(chat_id: int, actor: Optional[int] = None) -> bool:
     """Delete a user.
 
     :return: True if deleted, False if not present.
     """
-    if chat_id in _users:
-        del _users[chat_id]
-        save_users()
+    user = _users.pop(chat_id, None)
+    if user is not None:
+        _index_remove(chat_id, user.name)
+        _update_schedule(chat_id)
+        _record("delete", chat_id, actor)
         return True
     return False
 
 
-def toggle_permission(chat_id: int, perm: str) -> bool:
+def toggle_permission(chat_id: int, perm: str, actor: Optional[int] = None) -> bool:
     """Toggle a single permission for a user (English identifier)."""
-    if perm not in ALL_PERMISSIONS:
+    bit = PERMISSION_BITS.get(perm)
+    if bit is None:
         return False
-    cfg = _users.get(chat_id)
-    if not cfg:
+    user = _users.get(chat_id)
+    if user is None:
         return False
-    allowed: List[str] = list(cfg.get("allowed") or [])
-    if perm in allowed:
-        allowed.remove(perm)
-    else:
-        allowed.append(perm)
-    cfg["allowed"] = _clean_permissions(allowed)
-    _users[chat_id] = cfg
-    save_users()
+    user.perms ^= bit
+    _record("toggle", chat_id, actor, perm=perm)
     return True
 
 
-def grant_all_permissions(chat_id: int) -> bool:
+def grant_all_permissions(chat_id: int, actor: Optional[int] = None) -> bool:
     """Grant all permissions to the given user."""
-    cfg = _users.get(chat_id)
-    if not cfg:
+    user = _users.get(chat_id)
+    if user is None:
         return False
-    current: Set[str] = set(cfg.get("allowed") or [])
-    target: Set[str] = set(ALL_PERMISSIONS)
-    if current == target:
+    if user.perms == ALL_PERMISSIONS_MASK:
         return False
-    cfg["allowed"] = list(target)
-    _users[chat_id] = cfg
-    save_users()
+    user.perms = ALL_PERMISSIONS_MASK
+    _record("grant_all", chat_id, actor)
     return True
 
 
-def revoke_all_permissions(chat_id: int) -> bool:
+def revoke_all_permissions(chat_id: int, actor: Optional[int] = None) -> bool:
     """Remove all permissions for the given user."""
-    cfg = _users.get(chat_id)
-    if not cfg:
+    user = _users.get(chat_id)
+    if user is None:
+        return False
+    if not user.perms:
         return False
-    old_allowed = cfg.get("allowed") or []
-    if not old_allowed:
+    user.perms = 0
+    _record("revoke_all", chat_id, actor)
+    return True
+
+
+def add_schedule(chat_id: int, rule: ScheduleRule, actor: Optional[int] = None) -> bool:
+    """Add an access window to a user.
+
+    :raises ValueError: if the rule grants an unknown permission.
+    """
+    unknown = [perm for perm in rule.allowed if perm not in PERMISSION_BITS]
+    if unknown:
+        raise ValueError(f"unknown permission(s): {', '.join(unknown)}")
+    user = _users.get(chat_id)
+    if user is None:
+        return False
+    user.schedules = user.schedules + (rule,)
+    _update_schedule(chat_id)
+    _record("schedule_add", chat_id, actor, schedule=rule.to_dict())
+    return True
+
+
+def remove_schedule(chat_id: int, index: int, actor: Optional[int] = None) -> bool:
+    """Remove the ``index``-th access window of a user."""
+    user = _users.get(chat_id)
+    if user is None or not 0 <= index < len(user.schedules):
         return False
-    cfg["allowed"] = []
-    _users[chat_id] = cfg
-    save_users()
+    rule = user.schedules[index]
+    user.schedules = user.schedules[:index] + user.schedules[index + 1:]
+    _update_schedule(chat_id)
+    _record("schedule_remove", chat_id, actor, schedule=rule.to_dict())
     return True
 
 
+def get_scheduled_permissions(chat_id: int) -> List[str]:
+    """Permissions ``chat_id`` has right now through its access windows."""
+    _refresh_schedules()
+    mask = _scheduled_perms.get(chat_id, 0)
+    return [perm for perm, bit in PERMISSION_BITS.items() if mask & bit]
+
+
+def import_users(rows: Rows, actor: Optional[int] = None) -> Tuple[int, int, int]:
+    """Apply a batch of users (users.json dicts, None = delete) at once.
+
+    Unlike the single-user mutations, the batch is saved with one full
+    write: a snapshot replace for users.json, one transaction for SQLite.
+    Rows are expected to be validated already (see users_cli.py).
+
+    :return: (added, updated, deleted) counts.
+    """
+    global _rewrite_all
+    parsed = _parse_users({chat_id: cfg for chat_id, cfg in rows.items() if cfg is not None})
+    added = updated = deleted = 0
+    for chat_id, cfg in rows.items():
+        old = _users.get(chat_id)
+        new = parsed.get(chat_id)
+        if new is None and (cfg is not None or old is None):
+            continue
+        if old is not None and new is not None and _same_user(old, new):
+            continue
+        if old is not None:
+            _index_remove(chat_id, old.name)
+        if new is None:
+            del _users[chat_id]
+            deleted += 1
+        else:
+            _users[chat_id] = new
+            _index_add(chat_id, new.name)
+            if old is None:
+                added += 1
+            else:
+                updated += 1
+        _update_schedule(chat_id)
+        _journal("import", chat_id, actor)
+        _notify_user_listeners(chat_id)
+        _changed.add(chat_id)
+    audit("user", actor, op="import", added=added, updated=updated, deleted=deleted)
+    _rewrite_all = True
+    _schedule_flush()
+    return added, updated, deleted
+
+
 def get_user_lang(chat_id: int) -> str:
     """Return the preferred language for this user.
 
     Unknown users (not present in users.json) → forced English.
     """
-    cfg = _users.get(chat_id)
-    if not cfg:
+    user = _users.get(chat_id)
+    if user is None:
         # Unknown users → fixed English
         return "en"
-    return cfg.get("lang") or "it"
+    return user.lang or "it"
 
 
-def set_user_lang(chat_id: int, lang: str) -> None:
+def set_user_lang(chat_id: int, lang: str, actor: Optional[int] = None) -> None:
     """Set the preferred language for this user.
 
     Does not create new users: only works if chat_id already exists in _users.
     """
-    cfg = _users.get(chat_id)
-    if not cfg:
+    user = _users.get(chat_id)
+    if user is None:
         # Do not save anything for unknown users
         logger.info("Ignoring set_user_lang for unknown chat_id %s", chat_id)
         return
 
-    cfg["lang"] = lang
-    _users[chat_id] = cfg
-    save_users()
+    user.lang = sys.intern(lang)
+    _record("lang", chat_id, actor, lang=lang)
+
+
+
+def is_subscribed(chat_id: int) -> bool:
+    """Return True if the user wants lock state notifications."""
+    user = _users.get(chat_id)
+    return user is not None and user.notify
+
+
+def set_user_notify(chat_id: int, enabled: bool, actor: Optional[int] = None) -> bool:
+    """Subscribe/unsubscribe a known user to lock state notifications."""
+    user = _users.get(chat_id)
+    if user is None:
+        logger.info("Ignoring set_user_notify for unknown chat_id %s", chat_id)
+        return False
+    user.notify = enabled
+    _record("notify", chat_id, actor, notify=enabled)
+    return True
+
+
+def get_subscribers() -> List[int]:
+    """Return the chat IDs subscribed to lock state notifications."""
+    return [chat_id for chat_id, user in _users.items() if user.notify]
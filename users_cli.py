@@ -0,0 +1,279 @@
+"""Bulk import/export of the users store as CSV or JSON lines.
+
+    python users_cli.py export [-f csv|jsonl] [-o FILE]
+    python users_cli.py import FILE [-f csv|jsonl] [--replace] [--dry-run] [--skip-invalid]
+
+Imports are validated row by row and applied with a single write (see
+users.import_users); with any invalid row nothing is applied unless
+--skip-invalid is given. A running bot picks up the result through its
+users file reload (USERS_RELOAD_INTERVAL).
+"""
+
+import argparse
+import csv
+import json
+import logging
+import sys
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from i18n import SUPPORTED_LANGS
+from schedules import ScheduleRule, parse_rule
+from user_store import Rows
+from users import (
+    ALL_PERMISSIONS,
+    get_user_cfg,
+    get_users_sorted,
+    import_users,
+    load_users,
+)
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "jsonl")
+CSV_FIELDS = ["chat_id", "name", "allowed", "lang", "notify", "schedules"]
+# CSV "schedules" cells hold windows in the admin syntax, separated by ";"
+SCHEDULE_SEPARATOR = ";"
+
+
+@dataclass
+class ImportReport:
+    """Outcome of an import: row count, per-row errors, applied changes."""
+
+    rows: int = 0
+    # (line number, message)
+    errors: List[Tuple[int, str]] = field(default_factory=list)
+    applied: bool = False
+    added: int = 0
+    updated: int = 0
+    deleted: int = 0
+
+
+def guess_format(filename: str, default: str = "csv") -> str:
+    """Import/export format from a file name (.csv, .jsonl/.json)."""
+    name = filename.lower()
+    if name.endswith((".jsonl", ".json", ".ndjson")):
+        return "jsonl"
+    if name.endswith(".csv"):
+        return "csv"
+    return default
+
+
+def _read_rows(lines: Iterable[str], fmt: str) -> Iterator[Tuple[int, Any]]:
+    """Yield (line number, raw row) one at a time."""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_num, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_num, json.loads(line)
+        except ValueError as exc:
+            yield line_num, exc
+
+
+def _parse_bool(raw: Any) -> bool:
+    if isinstance(raw, bool):
+        return raw
+    value = str(raw).strip().lower()
+    if value in {"1", "true", "yes", "y", "on"}:
+        return True
+    if value in {"0", "false", "no", "n", "off"}:
+        return False
+    raise ValueError(f"invalid notify value {raw!r}")
+
+
+def _parse_permissions(raw: Any) -> List[str]:
+    if isinstance(raw, str):
+        perms = raw.replace(",", " ").split()
+    elif isinstance(raw, list) and all(isinstance(perm, str) for perm in raw):
+        perms = raw
+    else:
+        raise ValueError("allowed must be a list of permissions")
+    unknown = [perm for perm in perms if perm not in ALL_PERMISSIONS]
+    if unknown:
+        raise ValueError(f"unknown permission(s): {', '.join(unknown)}")
+    return list(dict.fromkeys(perms))
+
+
+def _parse_schedules(raw: Any) -> List[Dict]:
+    if isinstance(raw, str):
+        rules = [parse_rule(part) for part in raw.split(SCHEDULE_SEPARATOR) if part.strip()]
+    elif isinstance(raw, list):
+        rules = [ScheduleRule.from_dict(rule) for rule in raw]
+    else:
+        raise ValueError("schedules must be a list of windows")
+    for rule in rules:
+        unknown = [perm for perm in rule.allowed if perm not in ALL_PERMISSIONS]
+        if unknown:
+            raise ValueError(f"unknown permission(s) in window: {', '.join(unknown)}")
+    return [rule.to_dict() for rule in rules]
+
+
+def _validate_row(raw: Any) -> Tuple[int, Dict]:
+    """Turn a raw row into (chat_id, users.json dict), raising ValueError.
+
+    Missing (or, in CSV, empty) name/lang/notify keep the current values
+    of an existing user; a present "allowed"/"schedules" replaces them.
+    """
+    if isinstance(raw, Exception):
+        raise ValueError(f"invalid JSON: {raw}")
+    if not isinstance(raw, dict):
+        raise ValueError("row must be an object")
+    try:
+        chat_id = int(str(raw.get("chat_id")).strip())
+    except ValueError:
+        raise ValueError(f"invalid chat_id {raw.get('chat_id')!r}") from None
+
+    current = get_user_cfg(chat_id)
+    cfg = current.to_dict() if current is not None else {
+        "name": f"user_{chat_id}",
+        "allowed": [],
+        "lang": "it",
+        "notify": False,
+    }
+    name = raw.get("name")
+    if name not in (None, ""):
+        cfg["name"] = str(name).strip()
+    if raw.get("allowed") is not None:
+        cfg["allowed"] = _parse_permissions(raw["allowed"])
+    lang = raw.get("lang")
+    if lang not in (None, ""):
+        if lang not in SUPPORTED_LANGS:
+            raise ValueError(f"unsupported lang {lang!r}")
+        cfg["lang"] = lang
+    notify = raw.get("notify")
+    if notify not in (None, ""):
+        cfg["notify"] = _parse_bool(notify)
+    if raw.get("schedules") is not None:
+        schedules = _parse_schedules(raw["schedules"])
+        if schedules:
+            cfg["schedules"] = schedules
+        else:
+            cfg.pop("schedules", None)
+    return chat_id, cfg
+
+
+def import_stream(
+    lines: Iterable[str],
+    fmt: str,
+    replace: bool = False,
+    skip_invalid: bool = False,
+    dry_run: bool = False,
+    actor: Optional[int] = None,
+) -> ImportReport:
+    """Validate rows from ``lines`` and apply them in one write.
+
+    ``replace`` deletes the users missing from the input. Nothing is
+    applied on ``dry_run``, or if any row is invalid and not ``skip_invalid``.
+    """
+    report = ImportReport()
+    rows: Rows = {}
+    seen: Dict[int, int] = {}
+    for line_num, raw in _read_rows(lines, fmt):
+        report.rows += 1
+        try:
+            chat_id, cfg = _validate_row(raw)
+            if chat_id in seen:
+                raise ValueError(f"duplicate chat_id {chat_id} (line {seen[chat_id]})")
+        except ValueError as exc:
+            report.errors.append((line_num, str(exc)))
+            continue
+        seen[chat_id] = line_num
+        rows[chat_id] = cfg
+
+    if replace:
+        for chat_id, _user in get_users_sorted():
+            rows.setdefault(chat_id, None)
+    if dry_run or (report.errors and not skip_invalid):
+        return report
+    report.added, report.updated, report.deleted = import_users(rows, actor=actor)
+    report.applied = True
+    return report
+
+
+def export_stream(out: TextIO, fmt: str) -> int:
+    """Write every user to ``out``, one row at a time.
+
+    :return: number of users written.
+    """
+    count = 0
+    writer = csv.DictWriter(out, fieldnames=CSV_FIELDS) if fmt == "csv" else None
+    if writer is not None:
+        writer.writeheader()
+    for chat_id, user in get_users_sorted():
+        if writer is not None:
+            writer.writerow(
+                {
+                    "chat_id": chat_id,
+                    "name": user.name,
+                    "allowed": " ".join(user.allowed),
+                    "lang": user.lang,
+                    "notify": "true" if user.notify else "false",
+                    "schedules": f"{SCHEDULE_SEPARATOR} ".join(
+                        rule.describe() for rule in user.schedules
+                    ),
+                }
+            )
+        else:
+            out.write(json.dumps({"chat_id": chat_id, **user.to_dict()}, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Import or export the bot users.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="write all users as CSV or JSON lines")
+    export.add_argument("-f", "--format", choices=FORMATS)
+    export.add_argument("-o", "--output", default="-", help="output file (default: stdout)")
+
+    imp = sub.add_parser("import", help="add or update users from CSV or JSON lines")
+    imp.add_argument("file", help="input file, - for stdin")
+    imp.add_argument("-f", "--format", choices=FORMATS)
+    imp.add_argument("--replace", action="store_true", help="delete users missing from the file")
+    imp.add_argument("--dry-run", action="store_true", help="only validate the file")
+    imp.add_argument(
+        "--skip-invalid", action="store_true", help="apply the valid rows even if some are not"
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format="%(levelname)s - %(message)s", level=logging.WARNING)
+    load_users()
+
+    if args.command == "export":
+        fmt = args.format or guess_format(args.output)
+        if args.output == "-":
+            count = export_stream(sys.stdout, fmt)
+        else:
+            with open(args.output, "w", encoding="utf-8", newline="") as f:
+                count = export_stream(f, fmt)
+        print(f"Exported {count} user(s)", file=sys.stderr)
+        return 0
+
+    fmt = args.format or guess_format(args.file)
+    if args.file == "-":
+        report = import_stream(sys.stdin, fmt, args.replace, args.skip_invalid, args.dry_run)
+    else:
+        with open(args.file, encoding="utf-8-sig", newline="") as f:
+            report = import_stream(f, fmt, args.replace, args.skip_invalid, args.dry_run)
+
+    for line_num, message in report.errors:
+        print(f"line {line_num}: {message}", file=sys.stderr)
+    if report.applied:
+        print(
+            f"Imported {report.rows - len(report.errors)} of {report.rows} row(s): "
+            f"{report.added} added, {report.updated} updated, {report.deleted} deleted",
+            file=sys.stderr,
+        )
+    else:
+        print(f"Checked {report.rows} row(s), nothing imported", file=sys.stderr)
+    return 1 if report.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from telegram import Bot
+from telegram.error import TelegramError
+
+from config import LockConfig, get_config, get_lock
+from i18n import t
+from nuki import (
+    add_state_listener,
+    nuki_lock_state_cached,
+    remove_state_listener,
+    seconds_since_last_action,
+    summarize_state,
+)
+from users import can_do, get_subscribers, get_user_lang
+
+logger = logging.getLogger(__name__)
+
+# Opt-in background watcher (WATCHER_ENABLED). Every fresh lock state, polled
+# here or pushed by the bridge (see bridge_callback.py), is compared with the
+# previous one; interesting transitions are sent to subscribed users.
+
+# Nuki lock states meaning "not locked" / door sensor "door opened"
+UNLOCKED_STATES = frozenset({3, 5, 6, 7})
+DOOR_OPENED = 3
+# An unlock within this many seconds of a bot action is attributed to the bot
+OWN_ACTION_WINDOW = 30.0
+# Telegram allows ~30 messages/s overall: send in batches, pausing in between
+SEND_BATCH_SIZE = 20
+SEND_BATCH_PAUSE = 1.0
+
+# Per lock key: (state, doorState, batteryCritical) last seen
+_last_seen: Dict[str, Tuple[Any, Any, Any]] = {}
+_door_timers: Dict[str, asyncio.TimerHandle] = {}
+# (event message key, lock key, state) waiting to be sent
+_outbox: "Optional[asyncio.Queue[Tuple[str, str, Dict[str, Any]]]]" = None
+_tasks: List["asyncio.Task[None]"] = []
+_bot: Optional[Bot] = None
+
+
+def _on_state(lock_key: str, data: Dict[str, Any]) -> None:
+    """State listener: diff against the previous snapshot, queue events."""
+    snapshot = (data.get("state"), data.get("doorState"), data.get("batteryCritical"))
+    previous = _last_seen.get(lock_key)
+    if previous == snapshot:
+        return
+    _last_seen[lock_key] = snapshot
+    state, door_state, battery_critical = snapshot
+
+    if previous is None or door_state != previous[1]:
+        timer = _door_timers.pop(lock_key, None)
+        if timer is not None:
+            timer.cancel()
+        delay = get_config().door_open_alert_after
+        if door_state == DOOR_OPENED and delay > 0:
+            loop = asyncio.get_running_loop()
+            _door_timers[lock_key] = loop.call_later(delay, _door_still_open, lock_key)
+
+    if previous is None:
+        # First sighting after start: nothing to compare with
+        return
+    prev_state, _prev_door_state, prev_battery_critical = previous
+
+    if battery_critical and not prev_battery_critical:
+        _queue_event("notify_battery_critical", lock_key, data)
+
+    if state in UNLOCKED_STATES and prev_state not in UNLOCKED_STATES:
+        since_action = seconds_since_last_action(lock_key)
+        if since_action is None or since_action > OWN_ACTION_WINDOW:
+            _queue_event("notify_unlocked_elsewhere", lock_key, data)
+
+
+def _door_still_open(lock_key: str) -> None:
+    _door_timers.pop(lock_key, None)
+    last = _last_seen.get(lock_key)
+    if last is not None and last[1] == DOOR_OPENED:
+        _queue_event("notify_door_open", lock_key, {"doorState": DOOR_OPENED})
+
+
+def _queue_event(message_key: str, lock_key: str, data: Dict[str, Any]) -> None:
+    if _outbox is None:
+        return
+    logger.info("Lock %s: %s", lock_key, message_key)
+    _outbox.put_nowait((message_key, lock_key, dict(data)))
+
+
+async def _fetch_for_render(lock: LockConfig, data: Dict[str, Any]) -> Dict[str, Any]:
+    if "state" in data:
+        return data
+    # Door timer events carry no state: use the cached one if any
+    cached, _age = await nuki_lock_state_cached(lock, max_age=get_config().watcher_poll_interval)
+    return data if "error" in cached else cached
+
+
+async def _send_one(chat_id: int, text: str) -> None:
+    assert _bot is not None
+    try:
+        await _bot.send_message(chat_id=chat_id, text=text)
+    except TelegramError as exc:
+        logger.warning("Cannot notify %s: %s", chat_id, exc)
+
+
+async def _sender_loop() -> None:
+    assert _outbox is not None
+    while True:
+        message_key, lock_key, data = await _outbox.get()
+        lock = get_lock(lock_key)
+        if lock is None:
+            continue
+        try:
+            data = await _fetch_for_render(lock, data)
+            recipients = [uid for uid in get_subscribers() if can_do(uid, "status")]
+            # Render once per language, not once per subscriber
+            rendered: Dict[str, str] = {}
+            messages: List[Tuple[int, str]] = []
+            for uid in recipients:
+                lang = get_user_lang(uid)
+                if lang not in rendered:
+                    rendered[lang] = "\n".join(
+                        [
+                            t(
+                                message_key,
+                                lang,
+                                name=lock.name,
+                                minutes=round(get_config().door_open_alert_after / 60),
+                            ),
+                            "",
+                            summarize_state(data, lang=lang),
+                        ]
+                    )
+                messages.append((uid, rendered[lang]))
+
+            for start in range(0, len(messages), SEND_BATCH_SIZE):
+                if start:
+                    await asyncio.sleep(SEND_BATCH_PAUSE)
+                batch = messages[start:start + SEND_BATCH_SIZE]
+                await asyncio.gather(*(_send_one(uid, text) for uid, text in batch))
+        except Exception:
+            logger.exception("Error sending %s notifications", message_key)
+
+
+async def _poll_loop(interval: float) -> None:
+    while True:
+        for lock in get_config().locks:
+            try:
+                # Served from the cache when push updates keep it fresh
+                await nuki_lock_state_cached(lock, max_age=interval)
+            except Exception:
+                logger.exception("Error polling lock %s", lock.key)
+        await asyncio.sleep(interval)
+
+
+async def start_watcher(bot: Bot) -> None:
+    """Start watching lock state changes (no-op unless WATCHER_ENABLED)."""
+    global _outbox, _bot
+    cfg = get_config()
+    if not cfg.watcher_enabled or _outbox is not None:
+        return
+    _bot = bot
+    _outbox = asyncio.Queue()
+    add_state_listener(_on_state)
+    _tasks.append(asyncio.create_task(_sender_loop()))
+    _tasks.append(asyncio.create_task(_poll_loop(cfg.watcher_poll_interval)))
+    logger.info("Lock state watcher started (poll every %.0fs)", cfg.watcher_poll_interval)
+
+
+async def stop_watcher() -> None:
+    global _outbox
+    if _outbox is None:
+        return
+    remove_state_listener(_on_state)
+    for task in _tasks:
+        task.cancel()
+    _tasks.clear()
+    for timer in _door_timers.values():
+        timer.cancel()
+    _door_timers.clear()
+    _outbox = None